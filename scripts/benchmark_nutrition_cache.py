@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la codificación del cache de nutrición: JSON frente a binario
+Mide bytes por entrada, tiempo de codificación/decodificación y, si se indica
+--redis, la memoria real por clave (MEMORY USAGE).
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src" / "backend"))
+
+from services import nutrition_codec  # noqa: E402
+
+SAMPLE_ENTRIES = [
+    {
+        "nutrition_per_100g": {
+            "calories": 52, "protein": 0.26, "carbs": 13.81, "fat": 0.17,
+            "fiber": 2.4, "sugar": 10.39, "sodium": 1
+        },
+        "source": "usda",
+        "food_name": "Apples, raw, with skin (Includes foods for USDA's Food Distribution Program)",
+        "schema": 2
+    },
+    {
+        "nutrition_per_100g": {
+            "calories": 165, "protein": 31.02, "carbs": 0, "fat": 3.57,
+            "fiber": 0, "sugar": 0, "sodium": 74
+        },
+        "source": "nutritionix",
+        "food_name": "chicken breast",
+        "schema": 2
+    },
+    {"not_found": True, "food_name": "tamal oaxaqueño", "schema": 2}
+]
+
+
+def measure(encode, decode, entries, rounds: int):
+    """(bytes promedio, µs por codificación, µs por decodificación)"""
+    encoded = [encode(entry) for entry in entries]
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for entry in entries:
+            encode(entry)
+    encode_us = (time.perf_counter() - start) / (rounds * len(entries)) * 1e6
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for raw in encoded:
+            decode(raw)
+    decode_us = (time.perf_counter() - start) / (rounds * len(entries)) * 1e6
+
+    return sum(map(len, encoded)) / len(encoded), encode_us, decode_us
+
+
+def redis_memory(redis_url: str, encode, entries) -> float:
+    """Bytes promedio por clave según MEMORY USAGE"""
+    import redis
+
+    client = redis.from_url(redis_url)
+    keys = []
+    for index, entry in enumerate(entries):
+        key = f"benchmark:nutrition:{index}"
+        client.setex(key, 60, encode(entry))
+        keys.append(key)
+    usage = [client.memory_usage(key) for key in keys]
+    client.delete(*keys)
+    return sum(usage) / len(usage)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la codificación del cache de nutrición")
+    parser.add_argument("--rounds", type=int, default=20000)
+    parser.add_argument("--redis", help="URL de Redis para medir MEMORY USAGE")
+    args = parser.parse_args()
+
+    codecs = {
+        "json": (
+            lambda entry: json.dumps(entry).encode("utf-8"),
+            json.loads
+        ),
+        "binary": (
+            nutrition_codec.encode,
+            lambda raw: nutrition_codec.decode(raw)[0]
+        )
+    }
+
+    print("📊 Cache de nutrición: JSON vs binario")
+    print("=" * 60)
+    for name, (encode, decode) in codecs.items():
+        size, encode_us, decode_us = measure(encode, decode, SAMPLE_ENTRIES, args.rounds)
+        line = f"{name:>7}: {size:6.1f} B/entrada  encode {encode_us:5.2f} µs  decode {decode_us:5.2f} µs"
+        if args.redis:
+            line += f"  redis {redis_memory(args.redis, encode, SAMPLE_ENTRIES):6.1f} B/clave"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark del índice de búsqueda de /foods/search
+Construye un índice con N alimentos sintéticos (descripciones al estilo FDC)
+y mide la latencia por consulta: exactas, con errores, en español y prefijos.
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src" / "backend"))
+
+from services.search_index import FoodSearchIndex  # noqa: E402
+
+BASES = [
+    "Apples", "Bananas", "Chicken", "Beef", "Pork", "Rice", "Beans", "Cheese", "Milk",
+    "Bread", "Potatoes", "Tomatoes", "Carrots", "Oranges", "Salmon", "Tuna", "Eggs",
+    "Yogurt", "Oats", "Lettuce", "Onions", "Peppers", "Corn", "Pasta", "Avocados"
+]
+QUALIFIERS = [
+    "raw", "cooked", "boiled", "roasted", "fried", "canned", "frozen", "dried", "whole",
+    "skinless", "breast", "ground", "white", "brown", "red", "green", "nonfat", "sweetened",
+    "unsalted", "with skin", "without salt", "drained solids", "enriched", "grilled"
+]
+CATEGORIES = ["Fruits", "Poultry", "Beef Products", "Cereal Grains", "Dairy", "Vegetables", "Fish"]
+
+QUERIES = {
+    "exacta": ["chicken breast roasted", "apples raw", "rice brown cooked"],
+    "con errores": ["chiken brest", "tomatos canned", "potatos boiled"],
+    "español": ["pollo asado", "manzana", "arroz cocido"],
+    "prefijo": ["chi", "manz", "salm"]
+}
+
+
+def synthetic_entries(count: int, seed: int):
+    """(item_id, nombre, categoría, fuente, usage_count) con vocabulario realista"""
+    rng = random.Random(seed)
+    for i in range(count):
+        words = [rng.choice(BASES)] + rng.sample(QUALIFIERS, rng.randint(1, 4))
+        # Un 5% con un token único, como marcas o códigos del catálogo real
+        if rng.random() < 0.05:
+            words.append(f"brand{rng.randrange(count // 10)}")
+        yield (
+            f"usda_{i}",
+            ", ".join(words),
+            rng.choice(CATEGORIES),
+            "usda",
+            int(rng.paretovariate(1.2))
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del índice de búsqueda de alimentos")
+    parser.add_argument("--items", type=int, default=300000)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    index = FoodSearchIndex()
+    start = time.perf_counter()
+    index.build(synthetic_entries(args.items, args.seed))
+    stats = index.get_stats()
+    print(f"📊 Índice de búsqueda: {stats['items']} alimentos, {stats['vocabulary']} tokens")
+    print(f"   construcción {time.perf_counter() - start:.1f}s")
+    print("=" * 60)
+
+    for kind, queries in QUERIES.items():
+        for query in queries:
+            index.search(query)  # calentar
+            timings = []
+            for _ in range(args.rounds):
+                start = time.perf_counter()
+                _, total = index.search_with_total(query, limit=10)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            p50 = timings[len(timings) // 2]
+            p95 = timings[int(len(timings) * 0.95) - 1]
+            print(f"{kind:>12}  {query!r:<26} {total:>7} coincidencias  p50 {p50:6.2f} ms  p95 {p95:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,12 @@ class Settings(BaseSettings):
     
     # Redis
     REDIS_URL: str = "redis://localhost:6379/0"
+    REDIS_CONNECT_TIMEOUT: float = 1.0  # seconds, no esperar el timeout del sistema
+    REDIS_SOCKET_TIMEOUT: float = 1.0  # seconds, comandos del cache binario (el de texto escucha pub/sub)
+    REDIS_BREAKER_FAILURES: int = 5  # fallos de conexión seguidos para abrir el circuito
+    REDIS_BREAKER_RESET_SECONDS: float = 5.0  # abierto: luego se deja pasar una sola prueba
+    REDIS_FALLBACK_MAX_ENTRIES: int = 10000  # almacén en memoria mientras el circuito está abierto
+    REDIS_FALLBACK_TTL: int = 300  # seconds, TTL máximo en el almacén de respaldo
     
     # CORS
     CORS_ORIGINS: List[str] = ["http://localhost:3000", "http://localhost:5173"]
@@ -38,6 +44,77 @@ class Settings(BaseSettings):
     # ML Service
     ML_TIMEOUT: int = 30  # seconds
     ML_MAX_RETRIES: int = 3
+    OPENAI_INITIAL_CONCURRENCY: int = 4  # límite AIMD inicial de llamadas simultáneas
+    OPENAI_MIN_CONCURRENCY: int = 1
+    OPENAI_MAX_CONCURRENCY: int = 32
+    IMAGE_CACHE_ENABLED: bool = True
+    IMAGE_CACHE_TTL: int = 600  # seconds, reutilizar fotos repetidas del mismo plato
+    IMAGE_CACHE_MAX_ENTRIES: int = 1000
+    IMAGE_CACHE_MAX_DISTANCE: int = 6  # bits de Hamming (de 64) para considerar duplicado
+    IMAGE_PREPROCESS_ENABLED: bool = True
+    IMAGE_MAX_EDGE: int = 1024  # px, lado mayor enviado al modelo de visión
+    IMAGE_JPEG_QUALITY: int = 85
+    IMAGE_PROCESS_WORKERS: int = 2  # procesos para decodificar/recodificar
+    
+    # Analysis Queue
+    ANALYSIS_MAX_CONCURRENCY: int = 4  # análisis simultáneos
+    ANALYSIS_QUEUE_SIZE: int = 50  # trabajos en espera antes de responder 503
+    ANALYSIS_JOB_HISTORY: int = 1000  # estados de trabajos retenidos en memoria
+    ANALYSIS_QUEUE_BACKEND: str = "memory"  # "memory" (en proceso) o "redis" (workers externos)
+    ANALYSIS_STREAM: str = "analysis:jobs"
+    ANALYSIS_DEAD_LETTER_STREAM: str = "analysis:dead"
+    ANALYSIS_CONSUMER_GROUP: str = "analysis-workers"
+    ANALYSIS_STREAM_MAXLEN: int = 10000
+    ANALYSIS_JOB_TTL: int = 86400  # seconds, imagen y estado del trabajo en Redis
+    ANALYSIS_CLAIM_IDLE_MS: int = 120000  # reclamar trabajos de workers caídos
+    ANALYSIS_WORKER_BLOCK_MS: int = 5000
+    
+    # Nutrition
+    NUTRITION_ENRICH_CONCURRENCY: int = 4  # consultas simultáneas por análisis
+    NUTRITION_ITEM_TIMEOUT: float = 6.0  # seconds, luego se usa la estimación
+    NUTRITION_L1_MAX_ENTRIES: int = 5000  # cache en memoria por proceso
+    NUTRITION_L1_TTL: int = 300  # seconds
+    NUTRITION_L1_DEGRADED_TTL: int = 10  # seconds, TTL del L1 mientras el canal de invalidación está caído
+    NUTRITION_LOCK_TTL_MS: int = 6000  # lock entre workers para una consulta upstream
+    NUTRITION_LOCK_POLL_MS: int = 100
+    NUTRITION_NEGATIVE_TTL: int = 900  # seconds, alimentos no encontrados en ninguna fuente
+    NUTRITION_SOFT_TTL: int = 518400  # seconds (6 días), luego se revalida en segundo plano
+    NUTRITION_HARD_TTL: int = 604800  # seconds (7 días), luego se espera a upstream
+    NUTRITION_TTL_JITTER: float = 0.1  # fracción aleatoria restada a ambos TTL
+    NUTRITION_REDIS_ENABLED: bool = True  # False: solo memoria + disco (un nodo sin Redis)
+    NUTRITION_DISK_CACHE_PATH: str = "data/nutrition_cache.db"  # L2 compartido por los workers del host ("" = desactivado)
+    NUTRITION_DISK_CACHE_MAX_MB: int = 256
+    NUTRITION_HEDGE_ENABLED: bool = True  # lanzar Nutritionix si USDA tarda más que su percentil
+    NUTRITION_HEDGE_PERCENTILE: float = 95.0  # de la latencia observada de USDA
+    NUTRITION_HEDGE_INITIAL_DELAY_MS: int = 1500  # umbral hasta reunir muestras suficientes
+    NUTRITION_HEDGE_MIN_SAMPLES: int = 20
+    NUTRITION_HEDGE_MIN_DELAY_MS: int = 200  # piso del umbral adaptativo
+    NUTRITION_HEDGE_MAX_RATE: float = 0.1  # fracción máxima de consultas con cobertura
+    NUTRITION_HEDGE_RATE_WINDOW: int = 200  # consultas recientes sobre las que se mide
+    
+    # HTTP (USDA / Nutritionix)
+    HTTP_POOL_LIMIT: int = 100  # conexiones totales por sesión
+    HTTP_POOL_LIMIT_PER_HOST: int = 20
+    HTTP_DNS_CACHE_TTL: int = 300  # seconds
+    HTTP_KEEPALIVE_TIMEOUT: int = 30  # seconds
+    USDA_CONNECT_TIMEOUT: float = 2.0
+    USDA_READ_TIMEOUT: float = 3.0
+    NUTRITIONIX_CONNECT_TIMEOUT: float = 2.0
+    NUTRITIONIX_READ_TIMEOUT: float = 6.0
+    
+    # Food Catalog (FDC offline)
+    FOOD_CATALOG_PATH: str = "data/fdc_catalog.db"  # generado con import_fdc.py
+    FOOD_COLUMNAR_PATH: str = "data/fdc_catalog.fcol"  # copia columnar mapeada en memoria
+    AUTOCOMPLETE_TOP_K: int = 10  # completados precalculados por nodo del trie
+    AUTOCOMPLETE_MAX_NAMES: int = 20000
+    AUTOCOMPLETE_REFRESH_SECONDS: int = 60
+    AUTOCOMPLETE_REBUILD_SECONDS: int = 900  # reconstrucción completa aunque no haya nombres nuevos
+    
+    # Cache Warm-up
+    CACHE_WARMUP_TOP_N: int = 500  # alimentos más usados a precargar al iniciar (0 = desactivado)
+    CACHE_WARMUP_BATCH: int = 20
+    CACHE_WARMUP_UPSTREAM_RATE: float = 5.0  # consultas upstream por segundo durante el precalentamiento
+    CACHE_WARMUP_READY_FRACTION: float = 0.8  # /ready responde 200 desde esta fracción
     
     # File Upload
     MAX_FILE_SIZE: int = 5 * 1024 * 1024  # 5MB
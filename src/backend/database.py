@@ -49,9 +49,42 @@ def get_db():
 
 # Redis connection
 import redis.asyncio as redis
+from services.circuit_breaker import CircuitBreaker, FallbackStore, GuardedRedis
 
-redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+# Un solo circuito para el servidor: si Redis cae, no esperar en cada comando
+redis_fallback = FallbackStore(settings.REDIS_FALLBACK_MAX_ENTRIES, settings.REDIS_FALLBACK_TTL)
+redis_breaker = CircuitBreaker(
+    "Redis",
+    failure_threshold=settings.REDIS_BREAKER_FAILURES,
+    reset_timeout=settings.REDIS_BREAKER_RESET_SECONDS,
+    on_close=redis_fallback.clear
+)
+
+redis_client = GuardedRedis(
+    redis.from_url(
+        settings.REDIS_URL,
+        decode_responses=True,
+        socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT
+    ),
+    redis_breaker,
+    redis_fallback
+)
 
 async def get_redis():
     """Dependency para obtener cliente Redis"""
-    return redis_client
\ No newline at end of file
+    return redis_client
+
+# Cliente sin decodificación para valores binarios (cache de nutrición)
+redis_binary_client = GuardedRedis(
+    redis.from_url(
+        settings.REDIS_URL,
+        socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT
+    ),
+    redis_breaker,
+    redis_fallback
+)
+
+async def get_redis_binary():
+    """Cliente Redis que devuelve bytes"""
+    return redis_binary_client
\ No newline at end of file
@@ -0,0 +1,52 @@
+"""
+Importador del catálogo local USDA FoodData Central
+
+Carga las descargas JSON de Foundation Foods / SR Legacy (planas o .zip)
+en el catálogo SQLite con índice de texto completo. Es incremental: solo
+inserta alimentos nuevos y actualiza los que cambiaron de publicationDate.
+Al terminar regenera la copia columnar que mapean los workers.
+
+    python import_fdc.py FoodData_Central_foundation_food_json_2024-10-31.zip
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Agregar el directorio actual al path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import settings
+from services.food_catalog import import_foods, iter_fdc_file
+from services.catalog_columns import build_columnar
+
+
+def main(paths, db_path: str, release: str = None, columnar_path: str = None):
+    """Importar uno o más archivos FDC"""
+    for path in paths:
+        name = release or os.path.basename(path)
+        print(f"📥 Importando {path} → {db_path}")
+        start = time.perf_counter()
+        counts = import_foods(db_path, iter_fdc_file(path), name)
+        elapsed = time.perf_counter() - start
+        print(
+            f"✅ {name}: {counts['inserted']} nuevos, {counts['updated']} actualizados, "
+            f"{counts['unchanged']} sin cambios ({elapsed:.1f}s)"
+        )
+
+    if columnar_path:
+        foods = build_columnar(db_path, columnar_path)
+        print(f"🗂️ Catálogo columnar: {foods} alimentos → {columnar_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importar FDC al catálogo local")
+    parser.add_argument("paths", nargs="+", help="Archivos JSON o .zip de FoodData Central")
+    parser.add_argument("--db", default=settings.FOOD_CATALOG_PATH, help="Ruta del catálogo SQLite")
+    parser.add_argument("--release", help="Nombre de la versión (por defecto el nombre del archivo)")
+    parser.add_argument("--columnar", default=settings.FOOD_COLUMNAR_PATH,
+                        help="Ruta del catálogo columnar ('' para omitirlo)")
+    args = parser.parse_args()
+
+    main(args.paths, args.db, args.release, args.columnar)
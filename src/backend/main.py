@@ -9,12 +9,28 @@ from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.responses import JSONResponse
 import uvicorn
 import os
+import asyncio
 from contextlib import asynccontextmanager
 
 from routers import auth, images, nutrition, analytics
 from middleware.rate_limit import RateLimitMiddleware
 from middleware.logging import LoggingMiddleware
-from database import init_db
+from database import init_db, redis_breaker, redis_fallback
+from services.analysis_queue import analysis_queue
+from services.job_stream import job_queue
+from services.image_cache import image_cache
+from services import image_processing
+from services.ml_service import get_openai_client, close_openai_client, vision_limiter
+from services.http_sessions import http_sessions
+from services import nutrition_service
+from services.food_names import fold_tracker
+from services.food_translation import food_translator
+from services.food_catalog import food_catalog
+from services.catalog_columns import columnar_catalog
+from services.search_index import food_search_index
+from services.autocomplete import autocomplete_index
+from services.food_popularity import food_popularity
+from services.cache_warmer import cache_warmer
 from config import settings
 
 @asynccontextmanager
@@ -24,11 +40,35 @@ async def lifespan(app: FastAPI):
     print("🚀 Iniciando Contador de Calorías API...")
     await init_db()
     print("✅ Base de datos inicializada")
+    get_openai_client()
+    await http_sessions.get("usda")
+    await http_sessions.get("nutritionix")
+    invalidation_task = asyncio.create_task(nutrition_service.run_invalidation_listener())
+    # Índice de búsqueda en segundo plano (la primera búsqueda espera si no terminó)
+    index_task = asyncio.create_task(
+        food_search_index.ensure_built(nutrition.search_entries, food_catalog.version)
+    )
+    autocomplete_task = asyncio.create_task(autocomplete_index.run_refresher())
+    popularity_task = asyncio.create_task(nutrition.run_search_popularity_refresher())
+    # Precalentar el cache de nutrición (/ready espera la fracción configurada)
+    warmup_task = asyncio.create_task(cache_warmer.run())
+    if settings.ANALYSIS_QUEUE_BACKEND == "memory":
+        analysis_queue.start()
     
     yield
     
     # Shutdown
     print("🔄 Cerrando aplicación...")
+    invalidation_task.cancel()
+    index_task.cancel()
+    autocomplete_task.cancel()
+    popularity_task.cancel()
+    warmup_task.cancel()
+    await analysis_queue.stop()
+    await job_queue.close()
+    image_processing.shutdown()
+    await close_openai_client()
+    await http_sessions.close()
 
 # Crear aplicación FastAPI
 app = FastAPI(
@@ -75,15 +115,54 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check para monitoreo"""
+    # Con el circuito de Redis abierto el cache responde desde memoria
+    cache_degraded = redis_breaker.state != "closed"
     return {
-        "status": "healthy",
+        "status": "degraded" if cache_degraded else "healthy",
         "timestamp": "2025-09-14T12:00:00Z",
         "services": {
             "database": "connected",
-            "cache": "connected",
+            "cache": "degraded" if cache_degraded else "connected",
             "ml_service": "available"
-        }
+        },
+        "cache_breaker": {**redis_breaker.get_stats(), "fallback": redis_fallback.get_stats()}
+    }
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: no recibir tráfico hasta precalentar el cache de nutrición"""
+    warmup = cache_warmer.get_stats()
+    if not cache_warmer.ready:
+        return JSONResponse(status_code=503, content={"status": "warming", "cache_warmup": warmup})
+    return {"status": "ready", "cache_warmup": warmup}
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas internas de rendimiento"""
+    stats = {
+        "analysis_queue": analysis_queue.get_stats(),
+        "image_cache": image_cache.get_stats(),
+        "image_processing": image_processing.get_stats(),
+        "vision_limiter": vision_limiter.get_stats(),
+        "nutrition_enrichment": {
+            **images.enrichment_latency.get_stats(),
+            "timeouts": nutrition_service.batch_stats["timeouts"]
+        },
+        "http_pools": http_sessions.get_stats(),
+        "nutrition_cache": nutrition_service.get_cache_stats(),
+        "nutrition_upstream": nutrition_service.get_upstream_stats(),
+        "food_name_folding": fold_tracker.get_stats(),
+        "food_translation": food_translator.get_stats(),
+        "food_catalog": food_catalog.get_stats(),
+        "columnar_catalog": columnar_catalog.get_stats(),
+        "food_search_index": food_search_index.get_stats(),
+        "autocomplete": {**autocomplete_index.get_stats(), "popularity": food_popularity.get_stats()},
+        "cache_warmup": cache_warmer.get_stats(),
+        "redis_breaker": {**redis_breaker.get_stats(), "fallback": redis_fallback.get_stats()}
     }
+    if settings.ANALYSIS_QUEUE_BACKEND == "redis":
+        stats["analysis_stream"] = await job_queue.get_stats()
+    return stats
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
@@ -96,7 +175,8 @@ async def http_exception_handler(request, exc):
                 "message": exc.detail,
                 "timestamp": "2025-09-14T12:00:00Z"
             }
-        }
+        },
+        headers=getattr(exc, "headers", None)
     )
 
 if __name__ == "__main__":
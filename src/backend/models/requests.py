@@ -64,6 +64,10 @@ class NutritionCalculationRequest(BaseModel):
     """Modelo para cálculo nutricional manual"""
     food_id: str
     portion_grams: float = Field(..., ge=1, le=2000)
+
+class NutritionBatchRequest(BaseModel):
+    """Modelo para cálculo nutricional de varias porciones"""
+    items: List[NutritionCalculationRequest] = Field(..., min_items=1, max_items=500)
     
 class AnalyticsRequest(BaseModel):
     """Modelo para consultas de analytics"""
@@ -118,6 +118,30 @@ class FoodSearchResponse(BaseModel):
     results: List[FoodItem]
     suggestions: Optional[List[str]] = None
 
+class AutocompleteSuggestion(BaseModel):
+    """Sugerencia de autocompletado"""
+    name: str
+    usage_count: int
+
+class AutocompleteResponse(BaseModel):
+    """Respuesta de autocompletado"""
+    query: str
+    suggestions: List[AutocompleteSuggestion]
+
+class NutritionCalculation(BaseModel):
+    """Resultado de una porción del cálculo por lotes"""
+    food_id: str
+    portion_grams: float
+    nutrition: Optional[NutritionData] = None
+    source: Optional[str] = None
+    found: bool
+
+class NutritionBatchResponse(BaseModel):
+    """Respuesta del cálculo nutricional por lotes"""
+    results: List[NutritionCalculation]
+    total_nutrition: NutritionData
+    not_found: List[str]
+
 class FoodDetailResponse(BaseModel):
     """Respuesta detallada de alimento"""
     id: str
@@ -47,7 +47,7 @@ async def get_daily_summary(
                 "fat": 65.8,
                 "fiber": 28.3,
                 "sugar": 45.2,
-                "sodium": 2.1
+                "sodium": 2100
             },
             "goals": {
                 "calories": 2200,
@@ -56,7 +56,7 @@ async def get_daily_summary(
                 "fat": 73,
                 "fiber": 30,
                 "sugar": 50,
-                "sodium": 2.3
+                "sodium": 2300
             },
             "progress": {
                 "calories": 84.1,
@@ -88,7 +88,7 @@ async def get_daily_summary(
             "fat": 68.2,
             "fiber": 28.5,
             "sugar": 44.8,
-            "sodium": 2.0
+            "sodium": 2000
         }
     }
 
@@ -2,26 +2,36 @@
 Router para análisis de imágenes
 """
 
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import Optional, List, Dict, Tuple
 import uuid
 import asyncio
-from datetime import datetime
+from datetime import datetime, timedelta
+import numpy as np
 
 from database import get_db
 from services.ml_service import MLService
 from services.nutrition_service import NutritionService
+from services import nutrients
+from services.analysis_queue import analysis_queue, QueueFullError
+from services.job_stream import job_queue
+from services.autocomplete import autocomplete_index
+from services.food_popularity import MIN_CONFIDENCE
 from models.requests import ImageAnalysisRequest
 from models.responses import AnalysisResponse, AnalysisStatusResponse
+from services.metrics import LatencyTracker
 from middleware.auth import get_current_user
+from config import settings
 
 router = APIRouter()
 
+# Latencias por alimento en la etapa de enriquecimiento nutricional
+enrichment_latency = LatencyTracker()
+
 @router.post("/image", response_model=AnalysisStatusResponse, status_code=202)
 async def analyze_image(
-    background_tasks: BackgroundTasks,
     image: UploadFile = File(...),
     meal_type: Optional[str] = None,
     notes: Optional[str] = None,
@@ -39,14 +49,22 @@ async def analyze_image(
             detail="El archivo debe ser una imagen"
         )
     
+    # Leer imagen antes de responder: el UploadFile se cierra al terminar el request
+    image_data = await image.read()
+    if len(image_data) > settings.MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail="La imagen supera el tamaño máximo permitido"
+        )
+    
     # Generar ID único para el análisis
     analysis_id = str(uuid.uuid4())
     
     # Crear registro inicial en base de datos
     analysis_record = {
         "id": analysis_id,
-        "user_id": current_user.id,
-        "status": "processing",
+        "user_id": current_user["id"],
+        "status": "queued",
         "created_at": datetime.utcnow()
     }
     
@@ -54,21 +72,80 @@ async def analyze_image(
     # db.add(analysis_record)
     # db.commit()
     
-    # Procesar imagen en background
-    background_tasks.add_task(
-        process_image_analysis,
-        analysis_id,
-        image,
-        current_user.id,
-        meal_type,
-        notes
+    # Encolar procesamiento (concurrencia y cola acotadas)
+    try:
+        if settings.ANALYSIS_QUEUE_BACKEND == "redis":
+            await job_queue.enqueue(
+                analysis_id,
+                image_data,
+                current_user["id"],
+                meal_type,
+                notes
+            )
+        else:
+            analysis_queue.submit(
+                analysis_id,
+                process_image_analysis,
+                analysis_id,
+                image_data,
+                current_user["id"],
+                meal_type,
+                notes,
+                user_id=current_user["id"]
+            )
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Servicio de análisis saturado, intente nuevamente más tarde",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    wait_seconds = analysis_queue.estimate_wait()
+    return AnalysisStatusResponse(
+        analysis_id=analysis_id,
+        status="queued",
+        estimated_completion=(datetime.utcnow() + timedelta(seconds=wait_seconds)).isoformat() + "Z",
+        message="Análisis en cola. Use GET /analyze/{analysis_id}/status para verificar estado."
     )
+
+@router.get("/{analysis_id}/status", response_model=AnalysisStatusResponse)
+async def get_analysis_status(
+    analysis_id: str,
+    current_user = Depends(get_current_user)
+):
+    """
+    Obtener estado del trabajo de análisis (queued/processing/completed/failed)
+    """
+    
+    job = analysis_queue.get_job(analysis_id)
+    if not job and settings.ANALYSIS_QUEUE_BACKEND == "redis":
+        job = await job_queue.get_job(analysis_id)
+    # Solo el dueño ve el trabajo (Redis guarda el user_id como texto)
+    if not job or str(job.get("user_id")) != str(current_user["id"]):
+        raise HTTPException(
+            status_code=404,
+            detail="Análisis no encontrado"
+        )
+    
+    messages = {
+        "queued": "Análisis en cola",
+        "processing": "Análisis en progreso",
+        "completed": "Análisis completado",
+        "failed": f"Análisis fallido: {job['error']}"
+    }
+    progress = {"queued": 0, "processing": 50, "completed": 100, "failed": 100}
+    
+    current_step = None
+    if job["status"] == "queued" and settings.ANALYSIS_QUEUE_BACKEND == "memory":
+        position = analysis_queue.queue_position(analysis_id)
+        current_step = f"posición en cola: {position}" if position else None
     
     return AnalysisStatusResponse(
         analysis_id=analysis_id,
-        status="processing",
-        estimated_completion=datetime.utcnow().isoformat() + "Z",
-        message="Análisis en progreso. Use GET /analyze/{analysis_id} para verificar estado."
+        status=job["status"],
+        progress=progress[job["status"]],
+        current_step=current_step,
+        message=messages[job["status"]]
     )
 
 @router.get("/{analysis_id}", response_model=AnalysisResponse)
@@ -138,61 +215,71 @@ async def get_analysis_result(
 
 async def process_image_analysis(
     analysis_id: str,
-    image: UploadFile,
+    image_data: bytes,
     user_id: int,
     meal_type: Optional[str],
     notes: Optional[str]
 ):
     """
-    Procesar análisis de imagen en background
+    Procesar análisis de imagen (ejecutado por la cola de análisis)
     """
     try:
         # 1. Inicializar servicios
         ml_service = MLService()
         nutrition_service = NutritionService()
         
-        # 2. Leer imagen
-        image_data = await image.read()
+        # 2. Analizar con OpenAI Vision (los fallos llegan a la cola para reintentar)
+        detected_foods = await ml_service.analyze_food_image(image_data, user_id, raise_errors=True)
         
-        # 3. Analizar con OpenAI Vision
-        detected_foods = await ml_service.analyze_food_image(image_data)
+        # 3. Obtener información nutricional (consultas concurrentes)
+        enriched_foods, portions = await enrich_foods(nutrition_service, detected_foods)
         
-        # 4. Obtener información nutricional
-        enriched_foods = []
-        for food in detected_foods:
-            nutrition_data = await nutrition_service.get_nutrition_data(
-                food["name"], 
-                food["portion_grams"]
-            )
-            enriched_foods.append({**food, **nutrition_data})
-        
-        # 5. Calcular totales
-        total_nutrition = calculate_total_nutrition(enriched_foods)
+        # 4. Calcular totales
+        total_nutrition = calculate_total_nutrition(portions)
         
-        # 6. Actualizar base de datos
+        # 5. Actualizar base de datos
         # update_analysis_record(analysis_id, "completed", enriched_foods, total_nutrition)
+        # Solo detecciones confiables, con el mismo criterio que la siembra desde detected_foods
+        await autocomplete_index.record(
+            [food for food in detected_foods if food.get("confidence", 0) >= MIN_CONFIDENCE]
+        )
         
         print(f"✅ Análisis {analysis_id} completado exitosamente")
+        return {"detected_foods": enriched_foods, "total_nutrition": nutrients.to_dict(total_nutrition)}
         
     except Exception as e:
         print(f"❌ Error en análisis {analysis_id}: {e}")
         # update_analysis_record(analysis_id, "failed", error=str(e))
+        raise
 
-def calculate_total_nutrition(foods):
-    """Calcular totales nutricionales"""
-    totals = {
-        "calories": 0,
-        "protein": 0,
-        "carbs": 0,
-        "fat": 0,
-        "fiber": 0,
-        "sugar": 0,
-        "sodium": 0
-    }
+async def enrich_foods(nutrition_service: NutritionService, foods: List[Dict]) -> Tuple[List[Dict], np.ndarray]:
+    """
+    Consultar nutrición de todos los alimentos en un solo lote (un MGET y una
+    escritura en pipeline), con límite de concurrencia hacia upstream y timeout
+    por alimento (fallback a estimación).
+    Las porciones se escalan después en una sola operación sobre la matriz.
+    """
+    base_datas = await nutrition_service.get_base_nutrition_many(
+        [food["name"] for food in foods],
+        timeout=settings.NUTRITION_ITEM_TIMEOUT,
+        concurrency=settings.NUTRITION_ENRICH_CONCURRENCY,
+        latency=enrichment_latency
+    )
     
-    for food in foods:
-        nutrition = food.get("nutrition", {})
-        for key in totals:
-            totals[key] += nutrition.get(key, 0)
+    per_100g = nutrients.to_matrix(base_data.get("nutrition_per_100g") for base_data in base_datas)
+    portions = nutrients.scale_portions(per_100g, [food["portion_grams"] for food in foods])
     
-    return totals
\ No newline at end of file
+    enriched_foods = [
+        {
+            **food,
+            "nutrition": nutrients.to_dict(portion),
+            "source": base_data.get("source", "calculated"),
+            "food_name": base_data.get("food_name", "")
+        }
+        for food, base_data, portion in zip(foods, base_datas, portions)
+    ]
+    return enriched_foods, portions
+
+def calculate_total_nutrition(portions: np.ndarray) -> np.ndarray:
+    """Calcular totales nutricionales (suma por columnas de la matriz de porciones)"""
+    return portions.sum(axis=0)
\ No newline at end of file
@@ -4,15 +4,171 @@ Router para búsqueda y datos nutricionales
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import time
+import numpy as np
 
+from config import settings
 from database import get_db
 from services.nutrition_service import NutritionService
-from models.responses import FoodSearchResponse, FoodDetailResponse
+from services.food_catalog import food_catalog
+from services import nutrients
+from services.catalog_columns import columnar_catalog
+from services.search_index import food_search_index
+from services.autocomplete import autocomplete_index
+from services.food_popularity import food_popularity
+from models.requests import NutritionBatchRequest
+from models.responses import (
+    FoodSearchResponse, FoodDetailResponse, AutocompleteResponse, NutritionBatchResponse
+)
 from middleware.auth import get_current_user
 
 router = APIRouter()
 
+# Conteos de food_popularity aplicados al índice: item_id → usos
+popular_usage: Dict[str, int] = {}
+_popularity_state = {"version": None, "builds": None, "applied_at": 0.0}
+
+# Alimentos de ejemplo mientras no se importe el catálogo FDC (MVP)
+SAMPLE_FOODS = {
+    "usda_169905": {
+        "id": "usda_169905",
+        "name": "Manzana, cruda, con cáscara",
+        "name_normalized": "apple_raw_with_skin",
+        "source": "usda",
+        "category": "fruits",
+        "nutrition_per_100g": {
+            "calories": 52,
+            "protein": 0.26,
+            "carbs": 13.81,
+            "fat": 0.17,
+            "fiber": 2.4,
+            "sugar": 10.39,
+            "sodium": 1
+        },
+        "serving_sizes": [
+            {
+                "description": "1 manzana mediana",
+                "grams": 182
+            },
+            {
+                "description": "1 taza en rodajas",
+                "grams": 109
+            }
+        ],
+        "confidence": 10,
+        "usage_count": 1247
+    }
+}
+
+def _fdc_id(food_id: str) -> Optional[int]:
+    """Identificador FDC de un food_id "usda_<fdc_id>" """
+    if food_id.startswith("usda_") and food_id[5:].isdigit():
+        return int(food_id[5:])
+    return None
+
+def search_entries():
+    """Entradas del índice de búsqueda: catálogo FDC o alimentos de ejemplo"""
+    if food_catalog.available:
+        entries = food_catalog.index_entries()
+    else:
+        entries = [
+            (food["id"], food["name"], food["category"], food["source"], food["usage_count"])
+            for food in SAMPLE_FOODS.values()
+        ]
+    # Las reconstrucciones conservan la popularidad ya aplicada
+    usage = dict(popular_usage)
+    return (
+        (item_id, name, category, source, usage.get(item_id, usage_count))
+        for item_id, name, category, source, usage_count in entries
+    )
+
+async def refresh_search_popularity():
+    """
+    Llevar los conteos de food_popularity al índice de búsqueda: cada nombre
+    detectado suma sus usos al mejor resultado del índice para ese nombre
+    """
+    if not food_search_index.size:
+        return
+    version = await food_popularity.version()
+    builds = food_search_index.stats["builds"]
+    stale = time.monotonic() - _popularity_state["applied_at"] >= settings.AUTOCOMPLETE_REBUILD_SECONDS
+    if version == _popularity_state["version"] and builds == _popularity_state["builds"] and not stale:
+        return
+    
+    usage: Dict[str, int] = {}
+    for _, name, uses in await food_popularity.load(settings.AUTOCOMPLETE_MAX_NAMES):
+        matches = food_search_index.search(name, 1)
+        if matches:
+            item_id = matches[0][0]
+            usage[item_id] = usage.get(item_id, 0) + uses
+    
+    for item_id in popular_usage.keys() - usage.keys():
+        food_search_index.set_usage(item_id, 0)
+    for item_id, uses in usage.items():
+        food_search_index.set_usage(item_id, uses)
+    popular_usage.clear()
+    popular_usage.update(usage)
+    _popularity_state.update(version=version, builds=builds, applied_at=time.monotonic())
+
+async def run_search_popularity_refresher():
+    """Tarea en segundo plano: aplicar la popularidad tras cada construcción y al cambiar"""
+    while True:
+        try:
+            await refresh_search_popularity()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Error aplicando popularidad a la búsqueda: {e}")
+        await asyncio.sleep(settings.AUTOCOMPLETE_REFRESH_SECONDS)
+
+async def _load_food(item_id: str) -> Optional[dict]:
+    """Datos completos de un resultado del índice"""
+    fdc_id = _fdc_id(item_id)
+    if fdc_id is not None:
+        # Consulta SQLite en un hilo para no bloquear el event loop
+        food = columnar_catalog.get(fdc_id) or await asyncio.to_thread(food_catalog.get, fdc_id)
+        if food:
+            return food
+    return SAMPLE_FOODS.get(item_id)
+
+async def _bulk_per_100g(food_ids: List[str]) -> Tuple[np.ndarray, List[Optional[str]]]:
+    """Vectores por 100 g de varios alimentos: una consulta por fuente, no por alimento"""
+    per_100g = np.zeros((len(food_ids), nutrients.SIZE))
+    sources: List[Optional[str]] = [None] * len(food_ids)
+    
+    usda = [(position, _fdc_id(food_id)) for position, food_id in enumerate(food_ids)]
+    usda = [(position, fdc_id) for position, fdc_id in usda if fdc_id is not None]
+    if usda:
+        positions = np.array([position for position, _ in usda])
+        fdc_ids = np.array([fdc_id for _, fdc_id in usda], dtype=np.int64)
+        
+        # Catálogo columnar: una búsqueda binaria vectorizada y una sola copia de filas
+        rows = columnar_catalog.rows(fdc_ids)
+        hits = rows >= 0
+        if hits.any():
+            per_100g[positions[hits]] = columnar_catalog.nutrients(rows[hits])
+            for position in positions[hits].tolist():
+                sources[position] = "usda"
+        
+        # Catálogo SQLite para los que falten (consulta IN por bloques, fuera del event loop)
+        missing = [(int(position), int(fdc_id)) for position, fdc_id in zip(positions[~hits], fdc_ids[~hits])]
+        stored = {}
+        if missing:
+            stored = await asyncio.to_thread(food_catalog.nutrients_many, [fdc_id for _, fdc_id in missing])
+        for position, fdc_id in missing:
+            if fdc_id in stored:
+                per_100g[position] = stored[fdc_id]
+                sources[position] = "usda"
+    
+    for position, food_id in enumerate(food_ids):
+        if sources[position] is None and food_id in SAMPLE_FOODS:
+            per_100g[position] = nutrients.to_vector(SAMPLE_FOODS[food_id]["nutrition_per_100g"])
+            sources[position] = SAMPLE_FOODS[food_id]["source"]
+    
+    return per_100g, sources
+
 @router.get("/search", response_model=FoodSearchResponse)
 async def search_foods(
     q: str = Query(..., min_length=2, max_length=100, description="Término de búsqueda"),
@@ -28,53 +184,36 @@ async def search_foods(
     
     nutrition_service = NutritionService()
     
-    # Simulación de búsqueda para MVP
+    await food_search_index.ensure_built(search_entries, food_catalog.version)
+    
+    matches, total_results = food_search_index.search_with_total(q, limit, category=category, source=source)
+    foods = await asyncio.gather(*(_load_food(item_id) for item_id, _ in matches))
     results = [
-        {
-            "id": "usda_169905",
-            "name": "Manzana, cruda, con cáscara",
-            "name_normalized": "apple_raw_with_skin",
-            "source": "usda",
-            "category": "fruits",
-            "nutrition_per_100g": {
-                "calories": 52,
-                "protein": 0.26,
-                "carbs": 13.81,
-                "fat": 0.17,
-                "fiber": 2.4,
-                "sugar": 10.39,
-                "sodium": 0.001
-            },
-            "serving_sizes": [
-                {
-                    "description": "1 manzana mediana",
-                    "grams": 182
-                },
-                {
-                    "description": "1 taza en rodajas",
-                    "grams": 109
-                }
-            ],
-            "confidence": 10,
-            "usage_count": 1247
-        }
+        {**food, "usage_count": usage_count}
+        for food, (_, usage_count) in zip(foods, matches)
+        if food
     ]
     
-    # Filtrar por término de búsqueda
-    filtered_results = [
-        result for result in results 
-        if q.lower() in result["name"].lower()
-    ]
+    return {
+        "query": q,
+        "total_results": total_results,
+        "results": results,
+        "suggestions": [suggestion["name"] for suggestion in autocomplete_index.complete(q, 3)]
+    }
+
+@router.get("/autocomplete", response_model=AutocompleteResponse)
+async def autocomplete_foods(
+    q: str = Query(..., min_length=1, max_length=100, description="Texto escrito hasta ahora"),
+    limit: int = Query(10, ge=1, le=20, description="Número de sugerencias"),
+    current_user = Depends(get_current_user)
+):
+    """
+    Autocompletar nombres de alimentos por popularidad
+    """
     
     return {
         "query": q,
-        "total_results": len(filtered_results),
-        "results": filtered_results[:limit],
-        "suggestions": [
-            "manzana verde",
-            "manzana roja", 
-            "jugo de manzana"
-        ]
+        "suggestions": autocomplete_index.complete(q, limit)
     }
 
 @router.get("/{food_id}", response_model=FoodDetailResponse)
@@ -87,6 +226,13 @@ async def get_food_details(
     Obtener información detallada de un alimento específico
     """
     
+    fdc_id = _fdc_id(food_id)
+    if fdc_id is not None:
+        # Catálogo columnar mapeado y, si no existe, el catálogo SQLite (en un hilo)
+        food = columnar_catalog.get(fdc_id) or await asyncio.to_thread(food_catalog.get, fdc_id)
+        if food:
+            return food
+    
     # Simulación para MVP
     if food_id == "usda_169905":
         return {
@@ -105,7 +251,7 @@ async def get_food_details(
                 "fat": 0.17,
                 "fiber": 2.4,
                 "sugar": 10.39,
-                "sodium": 0.001
+                "sodium": 1
             },
             "serving_sizes": [
                 {
@@ -144,35 +290,62 @@ async def calculate_nutrition(
     Calcular información nutricional para una porción específica
     """
     
-    # Obtener datos del alimento
-    # food_data = get_food_by_id(food_id)
+    # Obtener datos del alimento (vector por 100 g del esquema canónico)
+    fdc_id = _fdc_id(food_id)
+    row = columnar_catalog.row(fdc_id) if fdc_id is not None else None
+    if row is not None:
+        # Vista float32 sin copia sobre el archivo mapeado
+        per_100g, source = columnar_catalog.nutrients(row), "usda"
+    else:
+        food = await _load_food(food_id)
+        per_100g = nutrients.to_vector(food["nutrition_per_100g"]) if food else None
+        source = food["source"] if food else None
     
-    # Simulación para MVP
-    if food_id == "usda_169905":
-        base_nutrition = {
-            "calories": 52,
-            "protein": 0.26,
-            "carbs": 13.81,
-            "fat": 0.17,
-            "fiber": 2.4,
-            "sugar": 10.39,
-            "sodium": 0.001
-        }
-        
-        factor = portion_grams / 100.0
-        calculated_nutrition = {}
-        
-        for key, value in base_nutrition.items():
-            calculated_nutrition[key] = round(value * factor, 2)
-        
+    if per_100g is not None:
         return {
             "food_id": food_id,
             "portion_grams": portion_grams,
-            "nutrition": calculated_nutrition,
-            "source": "usda"
+            "nutrition": nutrients.to_dict(nutrients.scale_portions(per_100g, portion_grams)),
+            "source": source
         }
     
     raise HTTPException(
         status_code=404,
         detail="Alimento no encontrado"
-    )
\ No newline at end of file
+    )
+
+@router.post("/calculate-nutrition/batch", response_model=NutritionBatchResponse)
+async def calculate_nutrition_batch(
+    request: NutritionBatchRequest,
+    current_user = Depends(get_current_user)
+):
+    """
+    Calcular información nutricional de muchas porciones en una sola llamada
+    """
+    
+    # Cada alimento distinto se resuelve una sola vez
+    food_ids = list(dict.fromkeys(item.food_id for item in request.items))
+    per_100g, sources = await _bulk_per_100g(food_ids)
+    
+    # Una sola pasada vectorizada para todas las porciones
+    index: Dict[str, int] = {food_id: position for position, food_id in enumerate(food_ids)}
+    positions = np.array([index[item.food_id] for item in request.items])
+    portions = nutrients.scale_portions(per_100g[positions], [item.portion_grams for item in request.items])
+    
+    results = []
+    for item, position, nutrition in zip(request.items, positions.tolist(), nutrients.to_dicts(portions)):
+        found = sources[position] is not None
+        results.append({
+            "food_id": item.food_id,
+            "portion_grams": item.portion_grams,
+            "nutrition": nutrition if found else None,
+            "source": sources[position],
+            "found": found
+        })
+    
+    return {
+        "results": results,
+        # Los alimentos no encontrados son filas de ceros y no alteran el total
+        "total_nutrition": nutrients.to_dict(portions.sum(axis=0)),
+        "not_found": [food_id for food_id, source in zip(food_ids, sources) if source is None]
+    }
\ No newline at end of file
@@ -0,0 +1,158 @@
+"""
+Cola acotada de análisis de imágenes con pool de workers
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+from config import settings
+
+# Estados posibles de un trabajo
+JOB_QUEUED = "queued"
+JOB_PROCESSING = "processing"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """La cola de análisis alcanzó su capacidad máxima"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Cola de análisis llena")
+        self.retry_after = retry_after
+
+
+class AnalysisQueue:
+    """Planificador en proceso con concurrencia limitada y cola acotada"""
+
+    def __init__(self, max_concurrency: int, max_queue_size: int, max_history: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+        self.max_history = max_history
+        self.jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._avg_duration = 5.0  # segundos, media móvil exponencial
+        self._stats = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+    def start(self):
+        """Arrancar workers (idempotente)"""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self.max_concurrency)
+        ]
+        print(f"✅ Cola de análisis iniciada ({self.max_concurrency} workers, capacidad {self.max_queue_size})")
+
+    async def stop(self, timeout: float = 30):
+        """Esperar trabajos pendientes y detener workers"""
+        if not self._workers:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ {self._queue.qsize()} análisis pendientes descartados al cerrar")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    def submit(self, job_id: str, handler: Callable[..., Awaitable], *args, user_id: Optional[int] = None) -> Dict:
+        """
+        Encolar un trabajo; lanza QueueFullError si no hay capacidad.
+        user_id identifica al dueño para consultar el estado.
+        """
+        self.start()
+        job = {
+            "id": job_id,
+            "user_id": user_id,
+            "status": JOB_QUEUED,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+            "result": None,
+        }
+        try:
+            self._queue.put_nowait((job, handler, args))
+        except asyncio.QueueFull:
+            self._stats["rejected"] += 1
+            raise QueueFullError(self.estimate_wait())
+
+        self._stats["submitted"] += 1
+        self._remember(job)
+        return job
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """Obtener estado de un trabajo"""
+        return self.jobs.get(job_id)
+
+    def queue_position(self, job_id: str) -> Optional[int]:
+        """Posición aproximada de un trabajo en cola (1 = siguiente)"""
+        if self._queue is None:
+            return None
+        for position, (job, _, _) in enumerate(list(self._queue._queue), start=1):
+            if job["id"] == job_id:
+                return position
+        return None
+
+    def estimate_wait(self) -> int:
+        """Segundos estimados hasta que se libere capacidad"""
+        depth = self._queue.qsize() if self._queue else 0
+        return max(1, int(depth * self._avg_duration / self.max_concurrency))
+
+    def get_stats(self) -> Dict:
+        """Métricas de la cola"""
+        processing = sum(1 for job in self.jobs.values() if job["status"] == JOB_PROCESSING)
+        return {
+            **self._stats,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "processing": processing,
+            "capacity": self.max_queue_size,
+            "max_concurrency": self.max_concurrency,
+            "avg_duration_s": round(self._avg_duration, 2),
+        }
+
+    def _remember(self, job: Dict):
+        """Guardar estado del trabajo, descartando los terminados más antiguos"""
+        self.jobs[job["id"]] = job
+        while len(self.jobs) > self.max_history:
+            oldest_id, oldest = next(iter(self.jobs.items()))
+            if oldest["status"] not in (JOB_COMPLETED, JOB_FAILED):
+                break
+            del self.jobs[oldest_id]
+
+    async def _worker(self, worker_id: int):
+        """Consumir trabajos de la cola"""
+        while True:
+            job, handler, args = await self._queue.get()
+            job["status"] = JOB_PROCESSING
+            job["started_at"] = time.time()
+            try:
+                job["result"] = await handler(*args)
+                job["status"] = JOB_COMPLETED
+                self._stats["completed"] += 1
+            except asyncio.CancelledError:
+                job["status"] = JOB_FAILED
+                job["error"] = "cancelled"
+                raise
+            except Exception as e:
+                job["status"] = JOB_FAILED
+                job["error"] = str(e)
+                self._stats["failed"] += 1
+            finally:
+                job["finished_at"] = time.time()
+                duration = job["finished_at"] - job["started_at"]
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+                self._queue.task_done()
+
+
+# Instancia global de la cola
+analysis_queue = AnalysisQueue(
+    max_concurrency=settings.ANALYSIS_MAX_CONCURRENCY,
+    max_queue_size=settings.ANALYSIS_QUEUE_SIZE,
+    max_history=settings.ANALYSIS_JOB_HISTORY,
+)
@@ -0,0 +1,201 @@
+"""
+Autocompletado de nombres de alimentos con un trie comprimido (radix)
+
+Cada nodo guarda sus top-k completados por popularidad, así cada tecla
+cuesta O(longitud del prefijo) sin recorrer el subárbol.
+"""
+
+import asyncio
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+from config import settings
+from services.food_names import STOP_WORDS, fold_accents
+from services.food_popularity import food_popularity
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_prefix(text: str) -> str:
+    """Minúsculas, sin acentos y con espacios simples"""
+    return _SPACES.sub(" ", fold_accents(text.lower())).strip()
+
+
+class _Node:
+    __slots__ = ("edges", "top")
+
+    def __init__(self):
+        self.edges: Dict[str, Tuple[str, "_Node"]] = {}  # primer carácter → (etiqueta, hijo)
+        self.top: List[Tuple[int, str]] = []  # (usos, clave canónica) de mayor a menor
+
+
+class CompletionTrie:
+    """Trie radix con top-k precalculado por nodo"""
+
+    def __init__(self, top_k: int):
+        self.top_k = top_k
+        self.root = _Node()
+        self.counts: Dict[str, int] = {}
+        self.names: Dict[str, str] = {}
+        self.nodes = 1
+
+    def set_count(self, canonical: str, name: str, count: int):
+        """Insertar un alimento (o actualizar su conteo) en todas sus rutas"""
+        self.counts[canonical] = count
+        self.names[canonical] = name
+        for key in self._keys(name):
+            for node in self._insert_path(key):
+                self._update_top(node, canonical, count)
+
+    def increment(self, canonical: str, name: str, delta: int = 1):
+        """Sumar usos: solo se tocan los nodos de las rutas del alimento"""
+        self.set_count(canonical, name, self.counts.get(canonical, 0) + delta)
+
+    def complete(self, prefix: str, limit: int) -> List[Tuple[str, int]]:
+        """Completados para el prefijo como [(nombre, usos)]"""
+        node = self.root
+        i = 0
+        while i < len(prefix):
+            edge = node.edges.get(prefix[i])
+            if edge is None:
+                return []
+            label, child = edge
+            rest = prefix[i:]
+            if rest.startswith(label):
+                i += len(label)
+            elif not label.startswith(rest):
+                return []
+            else:
+                i = len(prefix)
+            node = child
+        return [(self.names[canonical], count) for count, canonical in node.top[:limit]]
+
+    @staticmethod
+    def _keys(name: str) -> List[str]:
+        """El nombre completo y cada sufijo que empieza en una palabra relevante"""
+        words = normalize_prefix(name).split(" ")
+        return [
+            " ".join(words[i:]) for i, word in enumerate(words)
+            if word and (i == 0 or word not in STOP_WORDS)
+        ]
+
+    def _insert_path(self, key: str) -> List[_Node]:
+        """Nodos desde la raíz hasta la clave, dividiendo aristas si hace falta"""
+        node = self.root
+        path = [node]
+        i = 0
+        while i < len(key):
+            edge = node.edges.get(key[i])
+            if edge is None:
+                child = _Node()
+                node.edges[key[i]] = (key[i:], child)
+                self.nodes += 1
+                path.append(child)
+                return path
+
+            label, child = edge
+            common = 0
+            while common < len(label) and i + common < len(key) and label[common] == key[i + common]:
+                common += 1
+            if common < len(label):
+                # Dividir la arista: el nodo intermedio hereda el top-k del hijo
+                middle = _Node()
+                middle.top = list(child.top)
+                middle.edges[label[common]] = (label[common:], child)
+                node.edges[key[i]] = (label[:common], middle)
+                self.nodes += 1
+                child = middle
+            node = child
+            path.append(node)
+            i += common
+        return path
+
+    def _update_top(self, node: _Node, canonical: str, count: int):
+        """Los conteos solo crecen, así que basta con reordenar este nodo"""
+        top = [entry for entry in node.top if entry[1] != canonical]
+        if len(top) < self.top_k or count > top[-1][0]:
+            top.append((count, canonical))
+            top.sort(key=lambda entry: (-entry[0], entry[1]))
+            del top[self.top_k:]
+        node.top = top
+
+
+def build_trie(items: List[Tuple[str, str, int]], top_k: int) -> CompletionTrie:
+    """Construir un trie completo a partir de [(clave canónica, nombre, usos)]"""
+    trie = CompletionTrie(top_k)
+    for canonical, name, count in items:
+        trie.set_count(canonical, name, count)
+    return trie
+
+
+class AutocompleteIndex:
+    """Trie servido en memoria, actualizado localmente y reconstruido en segundo plano"""
+
+    def __init__(self, top_k: int, max_names: int):
+        self.top_k = top_k
+        self.max_names = max_names
+        self.trie = CompletionTrie(top_k)
+        self.version: Optional[int] = None
+        self.built_at = 0.0
+        self.stats = {"queries": 0, "rebuilds": 0, "rebuild_ms": 0.0, "increments": 0}
+
+    def complete(self, prefix: str, limit: int = 10) -> List[Dict]:
+        """Sugerencias para lo que el usuario lleva escrito"""
+        self.stats["queries"] += 1
+        prefix = normalize_prefix(prefix)
+        if not prefix:
+            return []
+        return [
+            {"name": name, "usage_count": count}
+            for name, count in self.trie.complete(prefix, limit)
+        ]
+
+    async def record(self, foods: List[Dict]):
+        """Registrar detecciones y reflejarlas de inmediato en el trie local"""
+        for canonical, name in await food_popularity.record(foods):
+            self.trie.increment(canonical, name)
+            self.stats["increments"] += 1
+
+    async def refresh(self):
+        """
+        Reconstruir desde Redis si otros workers registraron alimentos nuevos
+        o, para recoger sus conteos, cada AUTOCOMPLETE_REBUILD_SECONDS
+        """
+        version = await food_popularity.version()
+        stale = time.monotonic() - self.built_at >= settings.AUTOCOMPLETE_REBUILD_SECONDS
+        if version == self.version and not stale:
+            return
+        start = time.perf_counter()
+        items = await food_popularity.load(self.max_names)
+        self.trie = await asyncio.to_thread(build_trie, items, self.top_k)
+        self.version = version
+        self.built_at = time.monotonic()
+        self.stats["rebuilds"] += 1
+        self.stats["rebuild_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    async def run_refresher(self):
+        """Tarea en segundo plano durante la vida del proceso"""
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Error reconstruyendo autocompletado: {e}")
+            await asyncio.sleep(settings.AUTOCOMPLETE_REFRESH_SECONDS)
+
+    def get_stats(self) -> Dict:
+        """Métricas del autocompletado"""
+        return {
+            **self.stats,
+            "names": len(self.trie.counts),
+            "nodes": self.trie.nodes,
+            "version": self.version
+        }
+
+
+# Instancia global del autocompletado
+autocomplete_index = AutocompleteIndex(
+    top_k=settings.AUTOCOMPLETE_TOP_K,
+    max_names=settings.AUTOCOMPLETE_MAX_NAMES
+)
@@ -0,0 +1,146 @@
+"""
+Precalentamiento del cache de nutrición con los alimentos más usados
+
+Tras un despliegue o un flush de Redis carga los top-N alimentos (tabla
+food_cache y popularidad de detected_foods) en Redis y en el L1 del proceso,
+limitando la tasa de consultas a USDA / Nutritionix.
+"""
+
+import asyncio
+import time
+from typing import Dict, List, Optional
+from sqlalchemy import text
+from config import settings
+from database import engine
+from services.food_names import cache_name
+from services.concurrency import TokenBucket
+from services.food_popularity import food_popularity
+from services.nutrition_service import NutritionService
+
+# Usa idx_food_cache_usage
+FOOD_CACHE_QUERY = text("""
+    SELECT food_name, usage_count
+    FROM food_cache
+    ORDER BY usage_count DESC, last_used DESC
+    LIMIT :limit
+""")
+
+
+class CacheWarmer:
+    """Carga por lotes los alimentos populares y reporta el progreso"""
+
+    def __init__(self, top_n: int, batch_size: int, upstream_rate: float, ready_fraction: float):
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self.upstream_rate = upstream_rate  # consultas upstream por segundo (0 = sin límite)
+        self.ready_fraction = ready_fraction
+        self.stats = {
+            "state": "idle", "total": 0, "warmed": 0, "skipped": 0,
+            "from_cache": 0, "from_upstream": 0, "throttled_s": 0.0, "elapsed_s": 0.0
+        }
+
+    @property
+    def progress(self) -> float:
+        """Fracción de alimentos con datos reales en cache (sin estimaciones)"""
+        if self.stats["total"]:
+            return self.stats["warmed"] / self.stats["total"]
+        return 1.0 if self.stats["state"] == "done" else 0.0
+
+    @property
+    def ready(self) -> bool:
+        """Se alcanzó la fracción configurada (o no hay nada que esperar)"""
+        if self.top_n <= 0 or self.stats["state"] in ("done", "failed"):
+            return True
+        return self.stats["state"] == "running" and self.progress >= self.ready_fraction
+
+    async def load_names(self) -> List[str]:
+        """Los top-N nombres combinando food_cache y la popularidad detectada"""
+        scores: Dict[str, List] = {}
+        try:
+            rows = await asyncio.to_thread(self._query_food_cache)
+        except Exception as e:
+            print(f"⚠️ food_cache no disponible para precalentar: {e}")
+            rows = []
+        try:
+            popular = [(name, uses) for _, name, uses in await food_popularity.load(self.top_n)]
+        except Exception as e:
+            print(f"⚠️ Popularidad no disponible para precalentar: {e}")
+            popular = []
+
+        for name, uses in list(rows) + popular:
+            entry = scores.setdefault(cache_name(name), [name, 0])
+            entry[1] += uses or 0
+        ranked = sorted(scores.values(), key=lambda entry: -entry[1])
+        return [name for name, _ in ranked[:self.top_n]]
+
+    def _query_food_cache(self):
+        with engine.connect() as conn:
+            return conn.execute(FOOD_CACHE_QUERY, {"limit": self.top_n}).fetchall()
+
+    async def run(self, nutrition_service: Optional[NutritionService] = None):
+        """Precargar por lotes; las consultas upstream respetan la tasa configurada"""
+        if self.top_n <= 0:
+            return
+        nutrition_service = nutrition_service or NutritionService()
+        start = time.perf_counter()
+        self.stats["state"] = "loading"
+        try:
+            names = await self.load_names()
+            self.stats.update(state="running", total=len(names))
+            print(f"🔥 Precalentando cache de nutrición: {len(names)} alimentos")
+
+            # Token bucket propio: solo cuenta las consultas del precalentamiento
+            bucket = TokenBucket(self.upstream_rate, burst=self.upstream_rate)
+            fetched = set()
+
+            async def throttle(cache_key: str):
+                fetched.add(cache_key)
+                waited = await bucket.acquire()
+                self.stats["throttled_s"] = round(self.stats["throttled_s"] + waited, 1)
+
+            for offset in range(0, len(names), self.batch_size):
+                batch = names[offset:offset + self.batch_size]
+                results = await nutrition_service.get_base_nutrition_many(
+                    batch,
+                    timeout=settings.NUTRITION_ITEM_TIMEOUT,
+                    concurrency=settings.NUTRITION_ENRICH_CONCURRENCY,
+                    upstream_gate=throttle
+                )
+                for name, data in zip(batch, results):
+                    if data.get("source") == "estimated":
+                        # Timeout, fallo upstream o alimento desconocido: no quedó en cache
+                        self.stats["skipped"] += 1
+                    elif f"nutrition:{cache_name(name)}" in fetched:
+                        self.stats["from_upstream"] += 1
+                    else:
+                        self.stats["from_cache"] += 1
+                self.stats["warmed"] = self.stats["from_cache"] + self.stats["from_upstream"]
+                self.stats["elapsed_s"] = round(time.perf_counter() - start, 1)
+                print(
+                    f"🔥 Cache: {self.stats['warmed']}/{len(names)} ({self.progress:.0%}), "
+                    f"{self.stats['from_upstream']} desde upstream, {self.stats['skipped']} sin datos"
+                )
+
+            self.stats["state"] = "done"
+            print(f"✅ Cache precalentado: {len(names)} alimentos en {time.perf_counter() - start:.1f}s")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Sin precalentamiento el servicio funciona igual: no bloquear readiness
+            self.stats["state"] = "failed"
+            print(f"⚠️ Error precalentando cache: {e}")
+        finally:
+            self.stats["elapsed_s"] = round(time.perf_counter() - start, 1)
+
+    def get_stats(self) -> Dict:
+        """Progreso del precalentamiento"""
+        return {**self.stats, "progress": round(self.progress, 3), "ready": self.ready}
+
+
+# Instancia global del precalentamiento
+cache_warmer = CacheWarmer(
+    top_n=settings.CACHE_WARMUP_TOP_N,
+    batch_size=settings.CACHE_WARMUP_BATCH,
+    upstream_rate=settings.CACHE_WARMUP_UPSTREAM_RATE,
+    ready_fraction=settings.CACHE_WARMUP_READY_FRACTION
+)
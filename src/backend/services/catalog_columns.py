@@ -0,0 +1,229 @@
+"""
+Catálogo columnar de solo lectura, mapeado en memoria
+
+Formato (little-endian, secciones alineadas a 8 bytes):
+    cabecera   HEADER
+    ids        int64[n]            identificadores FDC ordenados (fila = posición)
+    nombres    uint64[n + 1] + utf-8
+    metadatos  uint64[n + 1] + utf-8 (JSON: categoría, porciones, fecha)
+    nutrientes float32[n, len(NUTRIENTS)] en el orden del esquema canónico
+
+Cada worker de uvicorn mapea el mismo archivo: las páginas se comparten
+entre procesos y abrirlo no copia datos.
+"""
+
+import json
+import mmap
+import os
+import sqlite3
+import struct
+from typing import Dict, Optional
+import numpy as np
+from config import settings
+from services.nutrients import NUTRIENTS
+from services.food_names import fold_accents
+
+MAGIC = b"FDCC"
+VERSION = 2  # 2: sodio en mg
+# magic, versión, nutrientes, alimentos, offsets de ids / nombres / metadatos / matriz
+HEADER = struct.Struct("<4sHHIQQQQ")
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _string_column(values) -> bytes:
+    """Offsets uint64 seguidos del blob utf-8"""
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype="<u8")
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    return offsets.tobytes() + b"".join(encoded)
+
+
+def build_columnar(db_path: str, out_path: str) -> int:
+    """Generar el archivo columnar desde el catálogo SQLite (escritura atómica)"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    rows = conn.execute(
+        f"SELECT fdc_id, description, category, portions, publication_date, "
+        f"{', '.join(NUTRIENTS)} FROM foods ORDER BY fdc_id"
+    ).fetchall()
+    conn.close()
+
+    ids = np.array([row[0] for row in rows], dtype="<i8")
+    names = _string_column(row[1] for row in rows)
+    meta = _string_column(
+        json.dumps({"category": row[2], "portions": json.loads(row[3]), "published": row[4]},
+                   ensure_ascii=False, separators=(",", ":"))
+        for row in rows
+    )
+    matrix = np.array(
+        [[value or 0.0 for value in row[5:]] for row in rows], dtype="<f4"
+    ).reshape(len(rows), len(NUTRIENTS))
+
+    ids_offset = _align(HEADER.size)
+    names_offset = _align(ids_offset + ids.nbytes)
+    meta_offset = _align(names_offset + len(names))
+    matrix_offset = _align(meta_offset + len(meta))
+
+    tmp_path = f"{out_path}.tmp"
+    with open(tmp_path, "wb") as handle:
+        for offset, payload in (
+            (0, HEADER.pack(MAGIC, VERSION, len(NUTRIENTS), len(rows),
+                            ids_offset, names_offset, meta_offset, matrix_offset)),
+            (ids_offset, ids.tobytes()),
+            (names_offset, names),
+            (meta_offset, meta),
+            (matrix_offset, matrix.tobytes())
+        ):
+            handle.write(b"\0" * (offset - handle.tell()))
+            handle.write(payload)
+    # Los workers que ya lo tienen mapeado conservan la versión anterior
+    os.replace(tmp_path, out_path)
+    return len(rows)
+
+
+class ColumnarCatalog:
+    """Lecturas sin copia por food_id sobre el archivo mapeado"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mm: Optional[mmap.mmap] = None
+        self._identity = None
+        self._rejected = None  # identidad del archivo inválido: no se reabre hasta que cambie
+        self.stats = {"lookups": 0, "hits": 0, "reloads": 0, "rejected": 0}
+
+    @property
+    def available(self) -> bool:
+        """El archivo existe y se pudo mapear"""
+        return self._ensure_mapped()
+
+    def _ensure_mapped(self) -> bool:
+        """
+        Mapear el archivo (o volver a mapearlo si fue reemplazado). Un archivo
+        incompatible, truncado o corrupto desactiva la ruta columnar (se usa el
+        catálogo SQLite) hasta que se reemplace.
+        """
+        try:
+            stat = os.stat(self.path)
+        except (OSError, TypeError):
+            return False
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if identity == self._identity:
+            return True
+        if identity == self._rejected:
+            return False
+
+        try:
+            self._map(identity)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"⚠️ Catálogo columnar inválido, se usa SQLite: {self.path} ({e})")
+            self._mm = None
+            self._identity = None
+            self._rejected = identity
+            self.stats["rejected"] += 1
+            return False
+        return True
+
+    def _map(self, identity):
+        """Mapear y validar la cabecera y las secciones; ValueError si no encajan"""
+        with open(self.path, "rb") as handle:
+            mm = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, n_nutrients, count, ids_offset, names_offset, meta_offset, matrix_offset = \
+                HEADER.unpack_from(mm, 0)
+        except struct.error:
+            mm.close()
+            raise
+        if magic != MAGIC or version != VERSION or n_nutrients != len(NUTRIENTS):
+            mm.close()
+            raise ValueError(f"formato incompatible (versión {version})")
+
+        # Un archivo truncado no alcanza para las secciones: frombuffer lanza ValueError
+        ids = np.frombuffer(mm, dtype="<i8", count=count, offset=ids_offset)
+        name_offsets = np.frombuffer(mm, dtype="<u8", count=count + 1, offset=names_offset)
+        meta_offsets = np.frombuffer(mm, dtype="<u8", count=count + 1, offset=meta_offset)
+        matrix = np.frombuffer(
+            mm, dtype="<f4", count=count * n_nutrients, offset=matrix_offset
+        ).reshape(count, n_nutrients)
+        if names_offset + 8 * (count + 1) + int(name_offsets[-1]) > meta_offset \
+                or meta_offset + 8 * (count + 1) + int(meta_offsets[-1]) > matrix_offset:
+            raise ValueError("secciones de texto fuera de rango")
+
+        self.ids = ids
+        self.name_offsets = name_offsets
+        self.names_base = names_offset + 8 * (count + 1)
+        self.meta_offsets = meta_offsets
+        self.meta_base = meta_offset + 8 * (count + 1)
+        self.matrix = matrix
+
+        # El mapa anterior se libera cuando ya no quedan vistas que lo usen
+        self._mm = mm
+        self._identity = identity
+        self.stats["reloads"] += 1
+
+    def row(self, fdc_id: int) -> Optional[int]:
+        """Fila del alimento (búsqueda binaria sobre los ids)"""
+        self.stats["lookups"] += 1
+        if not self._ensure_mapped():
+            return None
+        row = int(np.searchsorted(self.ids, fdc_id))
+        if row < len(self.ids) and self.ids[row] == fdc_id:
+            self.stats["hits"] += 1
+            return row
+        return None
+
+    def rows(self, fdc_ids: np.ndarray) -> np.ndarray:
+        """Filas de varios alimentos en una sola búsqueda binaria (-1 si no existe)"""
+        fdc_ids = np.asarray(fdc_ids, dtype=np.int64)
+        self.stats["lookups"] += len(fdc_ids)
+        if not self._ensure_mapped() or len(self.ids) == 0:
+            return np.full(len(fdc_ids), -1, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.ids, fdc_ids), len(self.ids) - 1)
+        rows = np.where(self.ids[rows] == fdc_ids, rows, -1)
+        self.stats["hits"] += int((rows >= 0).sum())
+        return rows
+
+    def nutrients(self, row: int) -> np.ndarray:
+        """Vista float32 (sin copia) de los nutrientes por 100 g"""
+        return self.matrix[row]
+
+    def _string(self, offsets: np.ndarray, base: int, row: int) -> str:
+        start, end = int(offsets[row]), int(offsets[row + 1])
+        return self._mm[base + start:base + end].decode("utf-8")
+
+    def get(self, fdc_id: int) -> Optional[Dict]:
+        """Alimento en formato FoodDetailResponse"""
+        row = self.row(fdc_id)
+        if row is None:
+            return None
+        name = self._string(self.name_offsets, self.names_base, row)
+        meta = json.loads(self._string(self.meta_offsets, self.meta_base, row))
+        return {
+            "id": f"usda_{fdc_id}",
+            "external_id": str(fdc_id),
+            "name": name,
+            "name_normalized": fold_accents(name.lower()),
+            "source": "usda",
+            "category": meta["category"],
+            "nutrition_per_100g": {
+                key: round(value, 4) for key, value in zip(NUTRIENTS, self.nutrients(row).tolist())
+            },
+            "serving_sizes": meta["portions"],
+            "confidence": 10,
+            "usage_count": 0,
+            "last_updated": meta["published"] or ""
+        }
+
+    def get_stats(self) -> Dict:
+        """Métricas del catálogo mapeado"""
+        mapped = self._mm is not None
+        return {
+            **self.stats,
+            "foods": len(self.ids) if mapped else 0,
+            "mapped_bytes": len(self._mm) if mapped else 0
+        }
+
+
+# Instancia global (cada worker mapea el mismo archivo)
+columnar_catalog = ColumnarCatalog(settings.FOOD_COLUMNAR_PATH)
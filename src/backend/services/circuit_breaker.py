@@ -0,0 +1,303 @@
+"""
+Circuit breaker para Redis con almacén de respaldo en memoria
+
+Tras varios fallos de conexión seguidos el circuito se abre: los comandos ya
+no esperan a Redis y se resuelven contra un almacén acotado del proceso.
+Pasado un tiempo se deja pasar una sola prueba (semiabierto); si responde,
+el circuito se cierra y el almacén se vacía.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+# Errores que indican que Redis no está disponible (no los de aplicación)
+FAILURES = (RedisConnectionError, RedisTimeoutError, OSError, asyncio.TimeoutError)
+
+# Resultado de CircuitBreaker.allow(): llamada normal o prueba en semiabierto
+PASS = "pass"
+PROBE = "probe"
+
+# Atributos del cliente que no pasan por el breaker
+PASSTHROUGH = {"pubsub", "close", "aclose", "connection_pool", "get_connection_kwargs"}
+
+
+class CircuitOpenError(RedisConnectionError):
+    """Circuito abierto y comando sin equivalente en el almacén de respaldo"""
+
+
+class CircuitBreaker:
+    """Estados closed → open → half_open → closed"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        reset_timeout: float,
+        on_close: Optional[Callable[[], None]] = None
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_close = on_close
+        self.state = "closed"
+        self.failures = 0  # fallos seguidos
+        self.opened_at = 0.0
+        self._probing = False
+        self.stats = {"opened": 0, "rejected": 0, "probes": 0, "failures": 0}
+
+    def allow(self) -> Optional[str]:
+        """
+        ¿Puede pasar la llamada? Devuelve None (rechazada), PASS o PROBE.
+        En semiabierto solo una prueba a la vez; quien la recibe la devuelve
+        en record_failure / call al terminar.
+        """
+        if self.state == "closed":
+            return PASS
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return None
+            self.state = "half_open"
+        if self._probing:
+            return None
+        self._probing = True
+        self.stats["probes"] += 1
+        return PROBE
+
+    def record_success(self):
+        """Respuesta del servidor: cerrar el circuito si estaba abierto"""
+        self.failures = 0
+        if self.state != "closed":
+            self.state = "closed"
+            print(f"✅ {self.name}: circuito cerrado")
+            if self.on_close:
+                self.on_close()
+
+    def record_failure(self, error: Exception, ticket: Optional[str] = PASS):
+        """Fallo de conexión: abrir al llegar al umbral (o si falló la prueba)"""
+        self.failures += 1
+        self.stats["failures"] += 1
+        if self.state == "open":
+            return  # llamadas que ya estaban en curso al abrirse
+        if self.state == "half_open" and ticket != PROBE:
+            return  # llamada previa a la apertura: solo decide la prueba
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.stats["opened"] += 1
+            print(f"⚠️ {self.name}: circuito abierto tras {self.failures} fallos ({error})")
+
+    async def call(self, operation: Callable[[], Awaitable[Any]], fallback: Callable[[], Any]) -> Any:
+        """
+        Ejecutar la operación; con el circuito abierto se responde con el respaldo.
+        Por debajo del umbral el error de conexión llega al llamador.
+        """
+        ticket = self.allow()
+        if ticket is None:
+            self.stats["rejected"] += 1
+            return fallback()
+        try:
+            result = await operation()
+        except FAILURES as e:
+            self.record_failure(e, ticket)
+            if self.state == "closed":
+                raise
+            return fallback()
+        except Exception:
+            # Error de aplicación (WRONGTYPE, NOSCRIPT...): el servidor responde
+            self.record_success()
+            raise
+        finally:
+            if ticket == PROBE:
+                self._probing = False
+        self.record_success()
+        return result
+
+    def get_stats(self) -> Dict:
+        """Estado del circuito"""
+        retry_in = 0.0
+        if self.state == "open":
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        return {
+            **self.stats,
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_in_s": round(retry_in, 1)
+        }
+
+
+class FallbackStore:
+    """
+    Subconjunto de comandos de Redis (cadenas con TTL) en memoria del proceso,
+    acotado por número de entradas (LRU) y por un TTL máximo
+    """
+
+    def __init__(self, max_entries: int, max_ttl: float):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._scripts: Dict[str, Callable] = {}
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "unsupported": 0}
+
+    def execute(self, name: str, args: tuple, kwargs: Dict) -> Any:
+        """Ejecutar un comando; los no soportados fallan sin esperar"""
+        command = getattr(self, f"_cmd_{name}", None)
+        if command is None:
+            self.stats["unsupported"] += 1
+            raise CircuitOpenError(f"Redis no disponible ({name} sin respaldo en memoria)")
+        return command(*args, **kwargs)
+
+    def execute_many(self, commands: List[Tuple[str, tuple, Dict]], raise_on_error: bool = True) -> List[Any]:
+        """Pipeline: se aplican todos y, como en Redis, se reporta el primer error"""
+        results = []
+        for name, args, kwargs in commands:
+            try:
+                results.append(self.execute(name, args, kwargs))
+            except CircuitOpenError as e:
+                results.append(e)
+        if raise_on_error:
+            for result in results:
+                if isinstance(result, CircuitOpenError):
+                    raise result
+        return results
+
+    def register_script(self, script: str, handler: Callable[["FallbackStore", tuple, tuple], Any]):
+        """Equivalente en Python de un script Lua usado con EVAL"""
+        self._scripts[script] = handler
+
+    def clear(self):
+        """Vaciar (Redis vuelve a ser la fuente de verdad)"""
+        self._data.clear()
+
+    def _lookup(self, key) -> Optional[Tuple[float, Any]]:
+        entry = self._data.get(key)
+        if entry is not None and entry[0] <= time.monotonic():
+            del self._data[key]
+            entry = None
+        return entry
+
+    def _store(self, key, value, ttl: Optional[float]):
+        ttl = self.max_ttl if ttl is None else min(ttl, self.max_ttl)
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        self.stats["writes"] += 1
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _cmd_get(self, key):
+        entry = self._lookup(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self._data.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry[1]
+
+    def _cmd_mget(self, keys, *more_keys):
+        keys = [keys] if isinstance(keys, (str, bytes)) else list(keys)
+        return [self._cmd_get(key) for key in keys + list(more_keys)]
+
+    def _cmd_set(self, key, value, ex=None, px=None, nx=False, xx=False, keepttl=False):
+        entry = self._lookup(key)
+        if (nx and entry is not None) or (xx and entry is None):
+            return None
+        if px is not None:
+            ttl = px / 1000
+        elif ex is not None:
+            ttl = ex
+        elif keepttl and entry is not None:
+            ttl = entry[0] - time.monotonic()
+        else:
+            ttl = None
+        self._store(key, value, ttl)
+        return True
+
+    def _cmd_setex(self, key, time_s, value):
+        self._store(key, value, time_s)
+        return True
+
+    def _cmd_delete(self, *keys):
+        return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def _cmd_exists(self, *keys):
+        return sum(self._lookup(key) is not None for key in keys)
+
+    def _cmd_eval(self, script, numkeys, *keys_and_args):
+        handler = self._scripts.get(script)
+        if handler is None:
+            self.stats["unsupported"] += 1
+            raise CircuitOpenError("Redis no disponible (script sin respaldo en memoria)")
+        return handler(self, keys_and_args[:numkeys], keys_and_args[numkeys:])
+
+    def _cmd_publish(self, channel, message):
+        return 0  # sin Redis no hay suscriptores en otros procesos
+
+    def get_stats(self) -> Dict:
+        """Métricas del almacén de respaldo"""
+        return {**self.stats, "entries": len(self._data), "max_entries": self.max_entries}
+
+
+class GuardedRedis:
+    """Cliente Redis cuyos comandos y pipelines pasan por el circuit breaker"""
+
+    def __init__(self, client, breaker: CircuitBreaker, fallback: FallbackStore):
+        self._client = client
+        self.breaker = breaker
+        self.fallback = fallback
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._client, name)
+        if name in PASSTHROUGH or not callable(attr):
+            return attr
+
+        async def command(*args, **kwargs):
+            return await self.breaker.call(
+                lambda: attr(*args, **kwargs),
+                lambda: self.fallback.execute(name, args, kwargs)
+            )
+        return command
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> "GuardedPipeline":
+        return GuardedPipeline(self, transaction, shard_hint)
+
+
+class GuardedPipeline:
+    """Acumula los comandos y los envía juntos a Redis (o al respaldo)"""
+
+    def __init__(self, guarded: GuardedRedis, transaction: bool, shard_hint):
+        self._guarded = guarded
+        self._transaction = transaction
+        self._shard_hint = shard_hint
+        self._commands: List[Tuple[str, tuple, Dict]] = []
+
+    async def __aenter__(self) -> "GuardedPipeline":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._commands.clear()
+
+    def __getattr__(self, name: str):
+        def queue(*args, **kwargs) -> "GuardedPipeline":
+            self._commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def __len__(self) -> int:
+        return len(self._commands)
+
+    async def execute(self, raise_on_error: bool = True) -> List[Any]:
+        commands, self._commands = self._commands, []
+
+        async def run():
+            async with self._guarded._client.pipeline(self._transaction, self._shard_hint) as pipe:
+                for name, args, kwargs in commands:
+                    getattr(pipe, name)(*args, **kwargs)
+                return await pipe.execute(raise_on_error=raise_on_error)
+
+        return await self._guarded.breaker.call(
+            run,
+            lambda: self._guarded.fallback.execute_many(commands, raise_on_error)
+        )
@@ -0,0 +1,147 @@
+"""
+Primitivas de concurrencia: limitador adaptativo (AIMD), token bucket y single-flight
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class AIMDLimiter:
+    """
+    Limita llamadas simultáneas a un proveedor externo.
+
+    El límite crece de forma aditiva (+1 por cada `limit` éxitos) y se reduce
+    de forma multiplicativa ante throttling o timeouts, como el control de
+    congestión de TCP: como mucho una reducción por ventana, ignorando los
+    fallos de llamadas iniciadas antes de la última reducción.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        decrease_factor: float = 0.5
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.in_flight = 0
+        self.window = 0  # cambia con cada reducción
+        self._condition = asyncio.Condition()
+        self._stats = {
+            "acquired": 0, "successes": 0, "overloads": 0, "decreases": 0, "errors": 0, "waits": 0
+        }
+
+    async def acquire(self) -> int:
+        """Esperar un espacio libre; devuelve la ventana en la que empieza la llamada"""
+        async with self._condition:
+            if self.in_flight >= int(self.limit):
+                self._stats["waits"] += 1
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            self._stats["acquired"] += 1
+            return self.window
+
+    async def release(self, outcome: str = "success", window: Optional[int] = None):
+        """
+        Liberar espacio y ajustar el límite.
+        outcome: "success", "overload" (429/timeout) o "error" (no ajusta)
+        window: el valor devuelto por acquire(); un overload de una ventana
+        anterior ya quedó cubierto por la reducción que la cerró
+        """
+        async with self._condition:
+            self.in_flight -= 1
+            if outcome == "success":
+                self._stats["successes"] += 1
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            elif outcome == "overload":
+                self._stats["overloads"] += 1
+                if window is None or window == self.window:
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    self.window += 1
+                    self._stats["decreases"] += 1
+            else:
+                self._stats["errors"] += 1
+            self._condition.notify_all()
+
+    def get_stats(self) -> Dict:
+        """Métricas del limitador"""
+        return {
+            **self._stats,
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight
+        }
+
+
+class TokenBucket:
+    """Limita la tasa de llamadas: `rate` por segundo con ráfagas de hasta `burst`"""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        """Esperar un token; devuelve los segundos esperados (rate <= 0: sin límite)"""
+        if self.rate <= 0:
+            return 0.0
+        async with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait:
+                await asyncio.sleep(wait)
+                self.tokens = 1.0
+                self.updated = time.monotonic()
+            self.tokens -= 1
+            return wait
+
+
+class SingleFlight:
+    """
+    Coalescencia de llamadas concurrentes por clave: solo se ejecuta una
+    y todos los que esperan reciben el mismo resultado (o excepción).
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Ejecutar fn para la clave o unirse a la ejecución en curso.
+        La llamada corre en su propia tarea: cancelar a un solicitante
+        (p. ej. por timeout) no cancela el trabajo de los demás.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        self.executed += 1
+        task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        """Liberar la clave y marcar la excepción como recuperada"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> Dict:
+        """Métricas de coalescencia"""
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight)
+        }
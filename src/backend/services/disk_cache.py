@@ -0,0 +1,164 @@
+"""
+Cache L2 en disco (SQLite en modo WAL) entre Redis y las APIs externas
+
+Lo comparten todos los workers del mismo host, sobrevive a caídas y flushes
+de Redis y basta por sí solo en despliegues de un nodo sin Redis. Se acota
+por tamaño: al superarlo se borran las entradas vencidas y luego las menos
+usadas recientemente.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Tuple
+from config import settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries(last_access);
+"""
+
+# Comprobar el tamaño total cada tantas escrituras del proceso, o antes si
+# lo escrito desde la última compactación agota el margen hasta el máximo
+COMPACT_EVERY = 200
+# Al compactar se deja el cache en esta fracción del máximo
+COMPACT_TARGET = 0.9
+
+
+class DiskCache:
+    """Entradas clave → bytes con TTL y desalojo LRU"""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._writes_since_check = 0
+        self._bytes_since_check = 0
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "expired": 0, "evicted": 0, "compactions": 0, "errors": 0}
+
+    @property
+    def available(self) -> bool:
+        """Configurado con una ruta (\"\" lo desactiva)"""
+        return bool(self.path)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Conexión por hilo; WAL permite lectores y un escritor entre procesos"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        """Valores vigentes de las claves (las ausentes o vencidas no aparecen)"""
+        if not self.available or not keys:
+            return {}
+        now = time.time()
+        placeholders = ", ".join("?" * len(keys))
+        try:
+            conn = self._connection()
+            rows = conn.execute(
+                f"SELECT key, value FROM entries WHERE key IN ({placeholders}) AND expires_at > ?",
+                (*keys, now)
+            ).fetchall()
+            if rows:
+                conn.execute(
+                    f"UPDATE entries SET last_access = ? WHERE key IN ({', '.join('?' * len(rows))})",
+                    (now, *(key for key, _ in rows))
+                )
+        except sqlite3.Error as e:
+            self.stats["errors"] += 1
+            print(f"⚠️ Error leyendo cache en disco: {e}")
+            return {}
+        self.stats["hits"] += len(rows)
+        self.stats["misses"] += len(keys) - len(rows)
+        return dict(rows)
+
+    def set_many(self, entries: Dict[str, Tuple[bytes, int]]):
+        """Guardar {clave: (valor, ttl en segundos)} en una transacción"""
+        if not self.available or not entries:
+            return
+        now = time.time()
+        rows = [
+            (key, value, len(key) + len(value), now + ttl, now)
+            for key, (value, ttl) in entries.items()
+        ]
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(
+                    "INSERT OR REPLACE INTO entries (key, value, size, expires_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+        except sqlite3.Error as e:
+            self.stats["errors"] += 1
+            print(f"⚠️ Error guardando en cache en disco: {e}")
+            return
+        self.stats["writes"] += len(entries)
+        self._writes_since_check += len(rows)
+        self._bytes_since_check += sum(row[2] for row in rows)
+        if (
+            self._writes_since_check >= COMPACT_EVERY
+            or self._bytes_since_check >= self.max_bytes * (1 - COMPACT_TARGET)
+        ):
+            self._writes_since_check = self._bytes_since_check = 0
+            self.compact()
+
+    def compact(self):
+        """Borrar vencidas y, si aún se supera el máximo, las de acceso más antiguo"""
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                expired = conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),)).rowcount
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                evicted = 0
+                if total > self.max_bytes:
+                    # Conservar las más recientes hasta COMPACT_TARGET del máximo
+                    evicted = conn.execute("""
+                        DELETE FROM entries WHERE key IN (
+                            SELECT key FROM (
+                                SELECT key, SUM(size) OVER (ORDER BY last_access DESC, key) AS running
+                                FROM entries
+                            ) WHERE running > ?
+                        )
+                    """, (int(self.max_bytes * COMPACT_TARGET),)).rowcount
+        except sqlite3.Error as e:
+            self.stats["errors"] += 1
+            print(f"⚠️ Error compactando cache en disco: {e}")
+            return
+        self.stats["expired"] += expired
+        self.stats["evicted"] += evicted
+        self.stats["compactions"] += 1
+
+    def get_stats(self) -> Dict:
+        """Métricas del cache en disco"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_ratio": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            "path": self.path,
+            "max_bytes": self.max_bytes
+        }
+
+
+# Instancia global (un archivo por host, compartido por los workers)
+disk_cache = DiskCache(
+    settings.NUTRITION_DISK_CACHE_PATH,
+    settings.NUTRITION_DISK_CACHE_MAX_MB * 1024 * 1024
+)
@@ -0,0 +1,365 @@
+"""
+Catálogo local de USDA FoodData Central (SQLite + índice FTS5 trigram)
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import zipfile
+from typing import Dict, Iterable, Iterator, List, Optional
+from config import settings
+from services.food_names import fold_accents
+from services.nutrients import NUTRIENTS, SCHEMA_VERSION
+
+# Columnas de nutrientes por 100 g, en el orden y unidades del esquema canónico
+NUTRIENT_COLUMNS = NUTRIENTS
+
+# Número de nutriente FDC → columna (en orden de preferencia)
+FDC_NUTRIENTS = {
+    "calories": ["208", "957", "958"],  # Energy kcal / Atwater general / Atwater specific
+    "protein": ["203"],
+    "carbs": ["205"],
+    "fat": ["204"],
+    "fiber": ["291"],
+    "sugar": ["269", "269.3"],
+    "sodium": ["307"],
+}
+
+# Parámetros por consulta IN (SQLite antiguo admite como máximo 999)
+BULK_CHUNK = 500
+
+# Candidatos de la búsqueda que lookup revisa antes de rendirse
+LOOKUP_CANDIDATES = 5
+
+_WORD = re.compile(r"[a-z0-9ñ]+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS foods (
+    fdc_id INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    data_type TEXT NOT NULL,
+    category TEXT,
+    publication_date TEXT,
+    calories REAL, protein REAL, carbs REAL, fat REAL,
+    fiber REAL, sugar REAL, sodium REAL,
+    portions TEXT NOT NULL DEFAULT '[]'
+);
+CREATE INDEX IF NOT EXISTS idx_foods_category ON foods(category);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS foods_fts USING fts5(
+    description, category,
+    content='foods', content_rowid='fdc_id', tokenize='trigram'
+);
+
+CREATE TRIGGER IF NOT EXISTS foods_ai AFTER INSERT ON foods BEGIN
+    INSERT INTO foods_fts(rowid, description, category)
+    VALUES (new.fdc_id, new.description, new.category);
+END;
+CREATE TRIGGER IF NOT EXISTS foods_ad AFTER DELETE ON foods BEGIN
+    INSERT INTO foods_fts(foods_fts, rowid, description, category)
+    VALUES ('delete', old.fdc_id, old.description, old.category);
+END;
+CREATE TRIGGER IF NOT EXISTS foods_au AFTER UPDATE ON foods BEGIN
+    INSERT INTO foods_fts(foods_fts, rowid, description, category)
+    VALUES ('delete', old.fdc_id, old.description, old.category);
+    INSERT INTO foods_fts(rowid, description, category)
+    VALUES (new.fdc_id, new.description, new.category);
+END;
+
+CREATE TABLE IF NOT EXISTS imports (
+    release TEXT PRIMARY KEY,
+    imported_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    inserted INTEGER NOT NULL,
+    updated INTEGER NOT NULL,
+    unchanged INTEGER NOT NULL
+);
+"""
+
+
+def iter_fdc_file(path: str) -> Iterator[Dict]:
+    """Leer alimentos de un JSON de FDC (Foundation o SR Legacy), plano o en .zip"""
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                if name.endswith(".json"):
+                    with archive.open(name) as handle:
+                        yield from _foods_from_document(json.load(handle))
+    else:
+        with open(path, encoding="utf-8") as handle:
+            yield from _foods_from_document(json.load(handle))
+
+
+def _foods_from_document(document) -> Iterator[Dict]:
+    """Las descargas de FDC envuelven la lista en FoundationFoods / SRLegacyFoods"""
+    if isinstance(document, list):
+        yield from document
+        return
+    for key in ("FoundationFoods", "SRLegacyFoods", "foods"):
+        yield from document.get(key, [])
+
+
+def parse_fdc_food(food: Dict) -> Dict:
+    """Convertir un alimento FDC a una fila del catálogo"""
+    amounts = {}
+    for item in food.get("foodNutrients", []):
+        nutrient = item.get("nutrient", {})
+        number = str(nutrient.get("number", ""))
+        if "amount" in item and number:
+            amounts.setdefault(number, item["amount"])
+
+    row = {
+        "fdc_id": int(food["fdcId"]),
+        "description": food.get("description", ""),
+        "data_type": food.get("dataType", ""),
+        "category": (food.get("foodCategory") or {}).get("description"),
+        "publication_date": food.get("publicationDate"),
+    }
+    for column, numbers in FDC_NUTRIENTS.items():
+        row[column] = next((amounts[n] for n in numbers if n in amounts), None)
+
+    row["portions"] = json.dumps([
+        {
+            "description": portion.get("portionDescription")
+            or " ".join(str(part) for part in (
+                portion.get("amount"),
+                (portion.get("measureUnit") or {}).get("name"),
+                portion.get("modifier")
+            ) if part not in (None, "", "undetermined")),
+            "grams": portion["gramWeight"]
+        }
+        for portion in food.get("foodPortions", [])
+        if portion.get("gramWeight")
+    ], ensure_ascii=False)
+    return row
+
+
+class FoodCatalog:
+    """Consultas de solo lectura e importación incremental del catálogo"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self.stats = {"lookups": 0, "hits": 0, "rejected": 0, "searches": 0}
+
+    @property
+    def available(self) -> bool:
+        """El catálogo existe en disco"""
+        return bool(self.path) and os.path.exists(self.path)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Conexión de solo lectura por hilo"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def search(self, query: str, limit: int = 10, category: Optional[str] = None) -> List[Dict]:
+        """Búsqueda de texto completo (trigram, tolerante a subcadenas)"""
+        if not self.available:
+            return []
+        self.stats["searches"] += 1
+
+        terms = [t for t in fold_accents(query.lower()).replace(",", " ").split() if t]
+        long_terms = [t for t in terms if len(t) >= 3]
+        short_terms = [t for t in terms if len(t) < 3]
+
+        params: List = []
+        if long_terms:
+            sql = (
+                "SELECT f.* FROM foods_fts JOIN foods f ON f.fdc_id = foods_fts.rowid "
+                "WHERE foods_fts MATCH ?"
+            )
+            params.append(" AND ".join('"' + t.replace('"', '""') + '"' for t in long_terms))
+        else:
+            sql = "SELECT f.* FROM foods f WHERE 1 = 1"
+        for term in short_terms:
+            sql += " AND f.description LIKE ?"
+            params.append(f"%{term}%")
+        if category:
+            sql += " AND f.category LIKE ?"
+            params.append(f"%{category}%")
+        sql += " ORDER BY " + ("bm25(foods_fts), " if long_terms else "") + "length(f.description) LIMIT ?"
+        params.append(limit)
+
+        try:
+            rows = self._connection().execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            print(f"⚠️ Error consultando catálogo local: {e}")
+            return []
+        return [self._row_to_item(row) for row in rows]
+
+    def lookup(self, query: str) -> Optional[Dict]:
+        """
+        Coincidencia confiable en el formato de NutritionService (por 100 g).
+        Una subcadena no basta: todas las palabras de la consulta deben estar en
+        la descripción y el nombre principal (antes de la primera coma) debe
+        estar en la consulta; si ningún candidato cumple, None.
+        """
+        self.stats["lookups"] += 1
+        query_words = _words(query)
+        if not query_words:
+            return None
+        candidates = self.search(query, limit=LOOKUP_CANDIDATES)
+        item = next((item for item in candidates if _is_match(query_words, item["name"])), None)
+        if item is None:
+            if candidates:
+                self.stats["rejected"] += 1  # solo coincidencias parciales
+            return None
+        self.stats["hits"] += 1
+        return {
+            "nutrition_per_100g": item["nutrition_per_100g"],
+            "source": "usda",
+            "food_name": item["name"],
+            "fdc_id": item["external_id"]
+        }
+
+    def get(self, fdc_id: int) -> Optional[Dict]:
+        """Alimento por identificador FDC"""
+        if not self.available:
+            return None
+        row = self._connection().execute(
+            "SELECT * FROM foods WHERE fdc_id = ?", (fdc_id,)
+        ).fetchone()
+        return self._row_to_item(row) if row else None
+
+    def nutrients_many(self, fdc_ids: List[int]) -> Dict[int, List[float]]:
+        """Nutrientes por 100 g de varios alimentos con una consulta por bloque"""
+        if not self.available or not fdc_ids:
+            return {}
+        found = {}
+        conn = self._connection()
+        columns = ", ".join(NUTRIENT_COLUMNS)
+        for start in range(0, len(fdc_ids), BULK_CHUNK):
+            chunk = fdc_ids[start:start + BULK_CHUNK]
+            placeholders = ", ".join("?" * len(chunk))
+            for row in conn.execute(
+                f"SELECT fdc_id, {columns} FROM foods WHERE fdc_id IN ({placeholders})", chunk
+            ):
+                found[row[0]] = [value or 0 for value in tuple(row)[1:]]
+        return found
+
+    @property
+    def version(self) -> Optional[int]:
+        """Cambia cada vez que se importa una nueva versión"""
+        return os.stat(self.path).st_mtime_ns if self.available else None
+
+    def index_entries(self) -> Iterator:
+        """(item_id, nombre, categoría, fuente, usage_count) para el índice de búsqueda"""
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            for fdc_id, description, category in conn.execute(
+                "SELECT fdc_id, description, category FROM foods"
+            ):
+                yield f"usda_{fdc_id}", description, category, "usda", 0
+        finally:
+            conn.close()
+
+    def get_stats(self) -> Dict:
+        """Métricas de uso del catálogo"""
+        return {**self.stats, "available": self.available}
+
+    @staticmethod
+    def _row_to_item(row: sqlite3.Row) -> Dict:
+        """Fila → formato FoodItem de la API"""
+        return {
+            "id": f"usda_{row['fdc_id']}",
+            "external_id": str(row["fdc_id"]),
+            "name": row["description"],
+            "name_normalized": fold_accents(row["description"].lower()),
+            "source": "usda",
+            "category": row["category"],
+            "nutrition_per_100g": {column: row[column] or 0 for column in NUTRIENT_COLUMNS},
+            "serving_sizes": json.loads(row["portions"]),
+            "confidence": 10,
+            "usage_count": 0,
+            "last_updated": row["publication_date"] or ""
+        }
+
+
+def _stem(word: str) -> str:
+    """Singular aproximado en inglés (apples → apple, tomatoes → tomato, berries → berry)"""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith("oes"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _words(text: str) -> set:
+    return {_stem(word) for word in _WORD.findall(fold_accents(text.lower()))}
+
+
+def _is_match(query_words: set, description: str) -> bool:
+    """Palabras completas (no subcadenas) en ambos sentidos"""
+    head = description.split(",", 1)[0]
+    return query_words <= _words(description) and _words(head) <= query_words
+
+
+def _migrate(conn: sqlite3.Connection):
+    """Llevar catálogos existentes a las unidades actuales (user_version)"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    with conn:
+        if version < 2 and conn.execute("SELECT 1 FROM foods LIMIT 1").fetchone():
+            conn.execute("UPDATE foods SET sodium = sodium * 1000")  # g → mg
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def import_foods(db_path: str, foods: Iterable[Dict], release: str, batch_size: int = 1000) -> Dict:
+    """
+    Importación incremental: inserta alimentos nuevos, actualiza los que cambiaron
+    de publicationDate y omite el resto, sin reconstruir el índice completo
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    _migrate(conn)
+    known = dict(conn.execute("SELECT fdc_id, publication_date FROM foods"))
+
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    columns = ["fdc_id", "description", "data_type", "category", "publication_date",
+               *NUTRIENT_COLUMNS, "portions"]
+    upsert = (
+        f"INSERT INTO foods ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+        "ON CONFLICT(fdc_id) DO UPDATE SET "
+        + ", ".join(f"{c} = excluded.{c}" for c in columns[1:])
+    )
+
+    batch = []
+    for food in foods:
+        row = parse_fdc_food(food)
+        if row["fdc_id"] in known:
+            if known[row["fdc_id"]] == row["publication_date"]:
+                counts["unchanged"] += 1
+                continue
+            counts["updated"] += 1
+        else:
+            counts["inserted"] += 1
+        known[row["fdc_id"]] = row["publication_date"]
+        batch.append([row[c] for c in columns])
+
+        if len(batch) >= batch_size:
+            with conn:
+                conn.executemany(upsert, batch)
+            batch = []
+            print(f"  … {sum(counts.values())} alimentos procesados")
+
+    with conn:
+        if batch:
+            conn.executemany(upsert, batch)
+        conn.execute(
+            "INSERT OR REPLACE INTO imports (release, inserted, updated, unchanged) VALUES (?, ?, ?, ?)",
+            (release, counts["inserted"], counts["updated"], counts["unchanged"])
+        )
+    conn.execute("INSERT INTO foods_fts(foods_fts) VALUES ('optimize')")
+    conn.close()
+    return counts
+
+
+# Instancia global del catálogo
+food_catalog = FoodCatalog(settings.FOOD_CATALOG_PATH)
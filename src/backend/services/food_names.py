@@ -0,0 +1,142 @@
+"""
+Canonicalización de nombres de alimentos para claves de cache
+"""
+
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List
+
+# Palabras sin valor para identificar el alimento
+STOP_WORDS = {
+    "de", "del", "la", "el", "los", "las", "lo", "con", "y", "e", "en",
+    "a", "al", "un", "una", "unos", "unas", "para", "por",
+    "the", "of", "with", "and", "an",
+}
+
+# Sinónimos regionales → nombre canónico (después de quitar acentos y plurales)
+ALIASES = {
+    "banano": "platano",
+    "banana": "platano",
+    "cambur": "platano",
+    "guineo": "platano",
+    "patata": "papa",
+    "jitomate": "tomate",
+    "palta": "aguacate",
+    "elote": "maiz",
+    "choclo": "maiz",
+    "poroto": "frijol",
+    "frejol": "frijol",
+    "alubia": "frijol",
+    "judia": "frijol",
+    "frutilla": "fresa",
+    "melocoton": "durazno",
+    "arveja": "guisante",
+    "chicharo": "guisante",
+    "zumo": "jugo",
+    "cacahuete": "mani",
+    "cacahuate": "mani",
+    "betabel": "remolacha",
+    "calabacin": "zapallito",
+    "puerco": "cerdo",
+    "chancho": "cerdo",
+    "res": "ternera",
+    "vacuno": "ternera",
+}
+
+# Singulares terminados en "e" cuyo plural podría confundirse con "-es"
+E_SINGULARS = {
+    "chile", "carne", "leche", "tomate", "aguacate", "guisante", "verde",
+    "dulce", "grande", "postre", "filete", "cacahuate", "elote", "mole",
+    "jarabe", "aceite", "sorbete", "brote", "nance",
+}
+# Palabras que terminan en "s" en singular
+S_SINGULARS = {"ananas", "anis", "cuscus", "mas", "tres", "dos", "seis"}
+
+_PARENTHESES = re.compile(r"\([^)]*\)|\[[^\]]*\]")
+_NON_WORD = re.compile(r"[^a-z0-9ñ]+")
+
+
+def fold_accents(text: str) -> str:
+    """Quitar acentos conservando la ñ"""
+    text = text.replace("ñ", "\0")
+    folded = "".join(
+        ch for ch in unicodedata.normalize("NFKD", text)
+        if not unicodedata.combining(ch)
+    )
+    return folded.replace("\0", "ñ")
+
+
+def singularize(word: str) -> str:
+    """Singular aproximado en español"""
+    if len(word) <= 3 or word in S_SINGULARS or not word.endswith("s"):
+        return word
+    if word.endswith("ces"):
+        return word[:-3] + "z"  # nueces → nuez
+    if word.endswith("es") and word[-3] not in "aeiou":
+        if word[:-1] in E_SINGULARS:
+            return word[:-1]  # chiles → chile
+        if word[-3] in "lnrdjy":
+            return word[:-2]  # panes → pan, limones → limon
+    return word[:-1]  # manzanas → manzana
+
+
+def canonicalize(food_name: str) -> str:
+    """
+    Clave estable: minúsculas, sin acentos, sin calificativos entre paréntesis,
+    sin stop-words, en singular y con sinónimos resueltos
+    """
+    text = fold_accents(food_name.lower())
+    text = _PARENTHESES.sub(" ", text)
+    tokens = [token for token in _NON_WORD.split(text) if token and token not in STOP_WORDS]
+    tokens = [ALIASES.get(singularize(token), singularize(token)) for token in tokens]
+
+    canonical = " ".join(tokens)
+    canonical = ALIASES.get(canonical, canonical)
+    return canonical or food_name.strip().lower()
+
+
+class FoldTracker:
+    """Registra cuántos nombres originales distintos caen en cada clave canónica"""
+
+    def __init__(self, max_keys: int = 10000, max_variants: int = 50):
+        self.max_keys = max_keys
+        self.max_variants = max_variants
+        self.variants: "OrderedDict[str, set]" = OrderedDict()
+
+    def record(self, raw_name: str, canonical: str):
+        """Registrar un nombre original"""
+        variants = self.variants.get(canonical)
+        if variants is None:
+            if len(self.variants) >= self.max_keys:
+                self.variants.popitem(last=False)
+            variants = self.variants[canonical] = set()
+        if len(variants) < self.max_variants:
+            variants.add(raw_name.strip().lower())
+
+    def get_stats(self, top: int = 20) -> Dict:
+        """Resumen de plegado y las claves con más variantes"""
+        raw_total = sum(len(variants) for variants in self.variants.values())
+        ranked: List = sorted(self.variants.items(), key=lambda item: len(item[1]), reverse=True)
+        return {
+            "canonical_keys": len(self.variants),
+            "raw_names": raw_total,
+            # Entradas de cache (y consultas upstream) evitadas por el plegado
+            "keys_saved": raw_total - len(self.variants),
+            "top_folds": [
+                {"key": key, "variants": len(variants), "examples": sorted(variants)[:5]}
+                for key, variants in ranked[:top]
+                if len(variants) > 1
+            ]
+        }
+
+
+# Instancia global del registro de plegado
+fold_tracker = FoldTracker()
+
+
+def cache_name(food_name: str) -> str:
+    """Canonicalizar y registrar el plegado"""
+    canonical = canonicalize(food_name)
+    fold_tracker.record(food_name, canonical)
+    return canonical
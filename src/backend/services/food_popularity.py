@@ -0,0 +1,108 @@
+"""
+Popularidad de alimentos detectados (conteos por nombre canónico)
+"""
+
+import asyncio
+from typing import Dict, List, Tuple
+from sqlalchemy import text
+from database import engine, get_redis
+from services.food_names import canonicalize
+
+POPULARITY_KEY = "foods:popularity"  # sorted set: clave canónica → usos
+NAMES_KEY = "foods:popularity:names"  # hash: clave canónica → nombre para mostrar
+VERSION_KEY = "foods:popularity:version"  # cambia al aparecer alimentos nuevos
+MIN_CONFIDENCE = 7  # detecciones con menos confianza (o el fallback) no cuentan
+
+# Misma condición que idx_detected_foods_popular
+DETECTED_FOODS_QUERY = text(f"""
+    SELECT food_name_normalized, MAX(food_name) AS food_name, COUNT(*) AS uses
+    FROM detected_foods
+    WHERE confidence >= {MIN_CONFIDENCE}
+    GROUP BY food_name_normalized
+""")
+
+
+class FoodPopularity:
+    """Conteos en Redis, sembrados desde la tabla detected_foods"""
+
+    def __init__(self):
+        self.stats = {"recorded": 0, "seeded": 0, "errors": 0}
+
+    async def record(self, foods: List[Dict]) -> List[Tuple[str, str]]:
+        """Registrar alimentos detectados; devuelve [(clave canónica, nombre)]"""
+        entries = [(canonicalize(food["name"]), food["name"].strip()) for food in foods if food.get("name")]
+        if not entries:
+            return []
+        try:
+            redis_client = await get_redis()
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for key, name in entries:
+                    pipe.zincrby(POPULARITY_KEY, 1, key)
+                    pipe.hset(NAMES_KEY, key, name)
+                results = await pipe.execute()
+            # Solo un alimento nuevo obliga a reconstruir los tries de otros workers;
+            # los conteos de los ya conocidos se recogen en la reconstrucción periódica
+            if any(float(score) == 1 for score in results[::2]):
+                await redis_client.incr(VERSION_KEY)
+            self.stats["recorded"] += len(entries)
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"⚠️ Error registrando popularidad: {e}")
+        return entries
+
+    async def version(self) -> int:
+        """Versión actual de los conteos (0 si no hay datos)"""
+        redis_client = await get_redis()
+        return int(await redis_client.get(VERSION_KEY) or 0)
+
+    async def load(self, limit: int) -> List[Tuple[str, str, int]]:
+        """Los `limit` alimentos más usados como [(clave canónica, nombre, usos)]"""
+        redis_client = await get_redis()
+        counts = await redis_client.zrevrange(POPULARITY_KEY, 0, limit - 1, withscores=True)
+        if not counts:
+            await self._seed_from_database()
+            counts = await redis_client.zrevrange(POPULARITY_KEY, 0, limit - 1, withscores=True)
+        if not counts:
+            return []
+        names = await redis_client.hmget(NAMES_KEY, [key for key, _ in counts])
+        return [(key, name or key, int(uses)) for (key, uses), name in zip(counts, names)]
+
+    async def _seed_from_database(self):
+        """Cargar los conteos históricos de detected_foods la primera vez"""
+        try:
+            rows = await asyncio.to_thread(self._query_detected_foods)
+        except Exception as e:
+            print(f"⚠️ detected_foods no disponible para popularidad: {e}")
+            return
+        if not rows:
+            return
+
+        merged: Dict[str, Tuple[str, int]] = {}
+        for _, name, uses in rows:
+            # food_name_normalized guarda claves en inglés (apple_red): se agrupa por el nombre
+            key = canonicalize(name)
+            previous = merged.get(key, (name, 0))
+            merged[key] = (previous[0], previous[1] + uses)
+
+        redis_client = await get_redis()
+        async with redis_client.pipeline(transaction=False) as pipe:
+            # NX: no pisar conteos registrados mientras tanto por otro worker
+            pipe.zadd(POPULARITY_KEY, {key: uses for key, (_, uses) in merged.items()}, nx=True)
+            for key, (name, _) in merged.items():
+                pipe.hsetnx(NAMES_KEY, key, name)
+            pipe.incr(VERSION_KEY)
+            await pipe.execute()
+        self.stats["seeded"] = len(merged)
+
+    @staticmethod
+    def _query_detected_foods():
+        with engine.connect() as conn:
+            return conn.execute(DETECTED_FOODS_QUERY).fetchall()
+
+    def get_stats(self) -> Dict:
+        """Métricas de popularidad"""
+        return dict(self.stats)
+
+
+# Instancia global de popularidad
+food_popularity = FoodPopularity()
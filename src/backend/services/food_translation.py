@@ -0,0 +1,197 @@
+"""
+Traducción local español → inglés de nombres de alimentos para consultas USDA
+"""
+
+import time
+from typing import Dict, Optional, Tuple
+from database import get_redis
+
+LEARNED_KEY = "nutrition:translations"
+LEARNED_RETRY_MAX = 300  # seconds, tope del backoff si Redis no responde
+LEARNED_MAX_LENGTH = 100  # caracteres de una consulta aprendida
+
+# Frases completas (claves canónicas de food_names.canonicalize) → consulta USDA
+PHRASES = {
+    "manzana": "apple raw",
+    "manzana roja": "apple red delicious raw",
+    "manzana verde": "apple granny smith raw",
+    "platano": "banana raw",
+    "naranja": "orange raw",
+    "jugo naranja": "orange juice raw",
+    "fresa": "strawberries raw",
+    "uva": "grapes raw",
+    "pera": "pear raw",
+    "piña": "pineapple raw",
+    "mango": "mango raw",
+    "sandia": "watermelon raw",
+    "melon": "cantaloupe raw",
+    "durazno": "peach raw",
+    "limon": "lemon raw",
+    "aguacate": "avocado raw",
+    "tomate": "tomato red raw",
+    "lechuga": "lettuce raw",
+    "zanahoria": "carrot raw",
+    "cebolla": "onion raw",
+    "papa": "potato raw",
+    "papa frita": "potato french fried",
+    "pure papa": "potato mashed",
+    "brocoli": "broccoli raw",
+    "espinaca": "spinach raw",
+    "pepino": "cucumber raw",
+    "maiz": "corn sweet yellow",
+    "guisante": "peas green",
+    "frijol": "beans kidney cooked",
+    "frijol negro": "beans black cooked",
+    "lenteja": "lentils cooked",
+    "garbanzo": "chickpeas cooked",
+    "arroz": "rice white cooked",
+    "arroz blanco": "rice white cooked",
+    "arroz integral": "rice brown cooked",
+    "pan": "bread white",
+    "pan integral": "bread whole wheat",
+    "pasta": "pasta cooked",
+    "espagueti": "spaghetti cooked",
+    "tortilla maiz": "tortillas corn",
+    "tortilla harina": "tortillas flour",
+    "avena": "oats",
+    "pollo": "chicken meat cooked",
+    "pechuga pollo": "chicken breast roasted",
+    "pechuga pollo plancha": "chicken breast grilled",
+    "muslo pollo": "chicken thigh roasted",
+    "ternera": "beef cooked",
+    "cerdo": "pork cooked",
+    "jamon": "ham sliced",
+    "tocino": "bacon cooked",
+    "salchicha": "sausage",
+    "pescado": "fish cooked",
+    "salmon": "salmon cooked",
+    "atun": "tuna canned",
+    "camaron": "shrimp cooked",
+    "huevo": "egg whole raw",
+    "huevo frito": "egg whole fried",
+    "huevo cocido": "egg whole hard boiled",
+    "leche": "milk whole",
+    "queso": "cheese cheddar",
+    "queso fresco": "cheese queso fresco",
+    "yogur": "yogurt plain",
+    "mantequilla": "butter salted",
+    "aceite oliva": "oil olive",
+    "azucar": "sugar granulated",
+    "miel": "honey",
+    "mani": "peanuts",
+    "nuez": "walnuts",
+    "almendra": "almonds",
+    "chocolate": "chocolate dark",
+    "galleta": "cookies",
+    "pizza": "pizza cheese",
+    "hamburguesa": "hamburger",
+    "cafe": "coffee brewed",
+    "te": "tea brewed",
+    "refresco": "soft drink cola",
+    "cerveza": "beer",
+    "vino": "wine table red",
+}
+
+# Palabras sueltas para traducir frases no registradas
+WORDS = {
+    "manzana": "apple", "platano": "banana", "naranja": "orange", "fresa": "strawberries",
+    "uva": "grapes", "pera": "pear", "limon": "lemon", "tomate": "tomato",
+    "lechuga": "lettuce", "zanahoria": "carrot", "cebolla": "onion", "papa": "potato",
+    "ajo": "garlic", "pimiento": "pepper", "chile": "pepper hot chili", "maiz": "corn",
+    "frijol": "beans", "arroz": "rice", "pan": "bread", "pasta": "pasta",
+    "pollo": "chicken", "pavo": "turkey", "ternera": "beef", "cerdo": "pork",
+    "pescado": "fish", "huevo": "egg", "leche": "milk", "queso": "cheese",
+    "jugo": "juice", "sopa": "soup", "ensalada": "salad", "salsa": "sauce",
+    "pechuga": "breast", "muslo": "thigh", "filete": "steak", "carne": "meat",
+    "crudo": "raw", "cruda": "raw", "cocido": "cooked", "cocida": "cooked",
+    "frito": "fried", "frita": "fried", "asado": "roasted", "asada": "roasted",
+    "hervido": "boiled", "hervida": "boiled", "plancha": "grilled", "horneado": "baked",
+    "horneada": "baked", "integral": "whole grain", "blanco": "white", "blanca": "white",
+    "negro": "black", "negra": "black", "rojo": "red", "roja": "red",
+    "verde": "green", "dulce": "sweet", "entero": "whole", "entera": "whole",
+    "descremado": "nonfat", "descremada": "nonfat", "molido": "ground", "molida": "ground",
+}
+
+
+class FoodTranslator:
+    """Diccionario bilingüe local más tabla aprendida de traducciones confirmadas"""
+
+    def __init__(self):
+        self._learned: Dict[str, str] = {}
+        self._learned_loaded = False
+        self._retry_at = 0.0
+        self._retry_delay = 1.0
+        self.stats = {
+            "learned": 0, "dictionary": 0, "words": 0, "untranslated": 0,
+            "confirmed": 0, "round_trips_avoided": 0
+        }
+
+    async def translate(self, canonical: str) -> Tuple[Optional[str], str]:
+        """
+        Traducir una clave canónica a consulta USDA.
+        Devuelve (consulta, origen); consulta None si no hay traducción.
+        """
+        if canonical in PHRASES:
+            self.stats["dictionary"] += 1
+            return PHRASES[canonical], "dictionary"
+
+        tokens = canonical.split()
+        translated = [WORDS[token] for token in tokens if token in WORDS]
+        if translated and len(translated) == len(tokens):
+            self.stats["words"] += 1
+            return " ".join(translated), "words"
+
+        # Lo que el diccionario no cubre: traducciones aprendidas de upstream
+        await self._load_learned()
+        if canonical in self._learned:
+            self.stats["learned"] += 1
+            return self._learned[canonical], "learned"
+
+        self.stats["untranslated"] += 1
+        return None, "none"
+
+    async def confirm(self, canonical: str, origin: str, data: Dict):
+        """
+        Aprender del resultado upstream de una clave sin traducción: el nombre en
+        inglés con el que USDA / Nutritionix la resolvieron (descripción FDC o
+        food_name de Nutritionix) se usa como consulta la próxima vez
+        """
+        if origin == "learned":
+            if data.get("source") == "usda":
+                # Sin la tabla, la consulta en español no habría encontrado el alimento en USDA
+                self.stats["round_trips_avoided"] += 1
+            return
+        if origin != "none":
+            return  # el diccionario ya la traduce
+
+        query = (data.get("food_name") or "").strip().lower()[:LEARNED_MAX_LENGTH]
+        if not query or query == canonical:
+            return
+        self._learned[canonical] = query
+        self.stats["confirmed"] += 1
+        try:
+            redis_client = await get_redis()
+            await redis_client.hset(LEARNED_KEY, canonical, query)
+        except Exception as e:
+            print(f"⚠️ Error guardando traducción aprendida: {e}")
+
+    async def _load_learned(self):
+        """Cargar la tabla aprendida de Redis una vez por proceso (reintenta con backoff)"""
+        if self._learned_loaded or time.monotonic() < self._retry_at:
+            return
+        try:
+            redis_client = await get_redis()
+            self._learned.update(await redis_client.hgetall(LEARNED_KEY))
+            self._learned_loaded = True
+        except Exception as e:
+            self._retry_at = time.monotonic() + self._retry_delay
+            self._retry_delay = min(self._retry_delay * 2, LEARNED_RETRY_MAX)
+            print(f"⚠️ Tabla de traducciones no disponible, usando diccionario local: {e}")
+
+    def get_stats(self) -> Dict:
+        """Métricas de traducción"""
+        return {**self.stats, "learned_entries": len(self._learned)}
+
+
+# Instancia global del traductor
+food_translator = FoodTranslator()
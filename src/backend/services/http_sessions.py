@@ -0,0 +1,119 @@
+"""
+Sesiones HTTP compartidas para las APIs nutricionales
+"""
+
+import asyncio
+from typing import Dict, Tuple
+import aiohttp
+from config import settings
+
+
+class HTTPSessionPool:
+    """Una ClientSession de larga duración por upstream (keep-alive, cache DNS, límites por host)"""
+
+    def __init__(self):
+        self._sessions: Dict[str, Tuple[aiohttp.ClientSession, asyncio.AbstractEventLoop]] = {}
+        # Contadores propios alimentados por TraceConfig (API pública de aiohttp)
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._timeouts = {
+            "usda": (settings.USDA_CONNECT_TIMEOUT, settings.USDA_READ_TIMEOUT),
+            "nutritionix": (settings.NUTRITIONIX_CONNECT_TIMEOUT, settings.NUTRITIONIX_READ_TIMEOUT),
+        }
+
+    async def get(self, upstream: str) -> aiohttp.ClientSession:
+        """Obtener (o crear) la sesión del upstream en el event loop actual"""
+        loop = asyncio.get_running_loop()
+        entry = self._sessions.get(upstream)
+        if entry is not None:
+            session, session_loop = entry
+            if not session.closed and session_loop is loop:
+                return session
+            await self._discard(session, session_loop)
+
+        connect_timeout, read_timeout = self._timeouts.get(upstream, (5, 10))
+        connector = aiohttp.TCPConnector(
+            limit=settings.HTTP_POOL_LIMIT,
+            limit_per_host=settings.HTTP_POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=settings.HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+        )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(
+                total=connect_timeout + read_timeout,
+                connect=connect_timeout,
+                sock_read=read_timeout,
+            ),
+            trace_configs=[self._trace_config(upstream)],
+        )
+        self._sessions[upstream] = (session, loop)
+        return session
+
+    def _trace_config(self, upstream: str) -> aiohttp.TraceConfig:
+        """Contar peticiones en curso y conexiones nuevas / reutilizadas del upstream"""
+        counters = self._counters.setdefault(upstream, {
+            "in_flight": 0, "requests": 0, "connections_created": 0, "connections_reused": 0
+        })
+
+        async def on_request_start(session, context, params):
+            counters["in_flight"] += 1
+            counters["requests"] += 1
+
+        async def on_request_done(session, context, params):
+            counters["in_flight"] -= 1
+
+        async def on_connection_created(session, context, params):
+            counters["connections_created"] += 1
+
+        async def on_connection_reused(session, context, params):
+            counters["connections_reused"] += 1
+
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(on_request_start)
+        trace.on_request_end.append(on_request_done)
+        trace.on_request_exception.append(on_request_done)
+        trace.on_connection_create_end.append(on_connection_created)
+        trace.on_connection_reuseconn.append(on_connection_reused)
+        return trace
+
+    @staticmethod
+    async def _discard(session: aiohttp.ClientSession, session_loop: asyncio.AbstractEventLoop):
+        """Cerrar la sesión de otro event loop antes de reemplazarla (no dejar conectores abiertos)"""
+        if session.closed:
+            return
+        if session_loop.is_running():
+            # Su loop sigue vivo en otro hilo: cerrarla allí
+            asyncio.run_coroutine_threadsafe(session.close(), session_loop)
+            return
+        try:
+            await session.close()
+        except Exception as e:
+            # Transportes ligados a un loop ya cerrado: el conector queda cerrado igualmente
+            print(f"⚠️ Error cerrando sesión HTTP de un event loop terminado: {e}")
+
+    async def close(self):
+        """Cerrar todas las sesiones"""
+        for session, _ in self._sessions.values():
+            if not session.closed:
+                await session.close()
+        self._sessions.clear()
+
+    def get_stats(self) -> Dict:
+        """Estado de los pools de conexiones"""
+        stats = {}
+        for upstream, (session, _) in self._sessions.items():
+            connector = session.connector
+            if connector is None or session.closed:
+                stats[upstream] = {"closed": True}
+                continue
+            stats[upstream] = {
+                "closed": False,
+                "limit": connector.limit,
+                "limit_per_host": connector.limit_per_host,
+                **self._counters.get(upstream, {}),
+            }
+        return stats
+
+
+# Instancia global del pool
+http_sessions = HTTPSessionPool()
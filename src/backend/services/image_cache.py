@@ -0,0 +1,146 @@
+"""
+Cache de imágenes casi duplicadas por hash perceptual
+"""
+
+import copy
+import io
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, Hashable, List, Optional, Tuple
+from PIL import Image
+from config import settings
+
+HASH_BITS = 64
+
+
+def compute_dhash(image_data: bytes) -> Optional[int]:
+    """
+    Calcular difference hash (dHash) de 64 bits; None si la imagen no se puede decodificar
+    """
+    try:
+        with Image.open(io.BytesIO(image_data)) as img:
+            img.draft("L", (64, 64))  # decodificación reducida para JPEG
+            return dhash_from_image(img)
+    except Exception:
+        return None
+
+
+def dhash_from_image(img: Image.Image) -> int:
+    """dHash de una imagen ya decodificada"""
+    pixels = list(img.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+class PerceptualImageCache:
+    """
+    Cache LRU con TTL indexado por hash perceptual, particionado por usuario
+    (scope): una foto parecida de otro usuario nunca reutiliza su resultado.
+
+    Usa multi-index hashing: el hash se divide en max_distance + 1 bandas y,
+    por el principio del palomar, cualquier hash a distancia de Hamming
+    <= max_distance coincide exactamente en al menos una banda.
+    """
+
+    def __init__(self, max_entries: int, ttl: int, max_distance: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.entries: "OrderedDict[Tuple[Hashable, int], Tuple[float, List[Dict]]]" = OrderedDict()
+        self._bands = self._build_bands(max_distance + 1)
+        self._index = [defaultdict(set) for _ in self._bands]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, image_hash: int, scope: Hashable = None) -> Optional[List[Dict]]:
+        """Buscar resultado de una imagen similar del mismo scope (usuario)"""
+        now = time.time()
+        best_key, best_distance = None, self.max_distance + 1
+
+        for candidate in self._candidates(scope, image_hash):
+            key = (scope, candidate)
+            stored_at, _ = self.entries[key]
+            if now - stored_at > self.ttl:
+                self._remove(key)
+                self.evictions += 1
+                continue
+            distance = bin(candidate ^ image_hash).count("1")
+            if distance < best_distance:
+                best_key, best_distance = key, distance
+
+        if best_key is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(best_key)
+        return copy.deepcopy(self.entries[best_key][1])
+
+    def put(self, image_hash: int, result: List[Dict], scope: Hashable = None):
+        """Guardar resultado de análisis en el scope (usuario)"""
+        key = (scope, image_hash)
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (time.time(), copy.deepcopy(result))
+        for band_index, (shift, mask) in enumerate(self._bands):
+            self._index[band_index][(scope, (image_hash >> shift) & mask)].add(image_hash)
+
+        while len(self.entries) > self.max_entries:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def get_stats(self) -> Dict:
+        """Métricas del cache"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0
+        }
+
+    def _candidates(self, scope: Hashable, image_hash: int) -> set:
+        """Hashes del scope que comparten al menos una banda"""
+        candidates = set()
+        for band_index, (shift, mask) in enumerate(self._bands):
+            candidates |= self._index[band_index].get((scope, (image_hash >> shift) & mask), set())
+        return candidates
+
+    def _remove(self, key: Tuple[Hashable, int]):
+        """Eliminar entrada y sus referencias en el índice"""
+        del self.entries[key]
+        scope, image_hash = key
+        for band_index, (shift, mask) in enumerate(self._bands):
+            band_key = (scope, (image_hash >> shift) & mask)
+            bucket = self._index[band_index].get(band_key)
+            if bucket is not None:
+                bucket.discard(image_hash)
+                if not bucket:
+                    del self._index[band_index][band_key]
+
+    @staticmethod
+    def _build_bands(count: int) -> List[Tuple[int, int]]:
+        """Dividir los 64 bits en bandas contiguas (desplazamiento, máscara)"""
+        count = max(1, min(count, HASH_BITS))
+        bands, shift = [], 0
+        for i in range(count):
+            width = HASH_BITS // count + (1 if i < HASH_BITS % count else 0)
+            bands.append((shift, (1 << width) - 1))
+            shift += width
+        return bands
+
+
+# Instancia global del cache
+image_cache = PerceptualImageCache(
+    max_entries=settings.IMAGE_CACHE_MAX_ENTRIES,
+    ttl=settings.IMAGE_CACHE_TTL,
+    max_distance=settings.IMAGE_CACHE_MAX_DISTANCE,
+)
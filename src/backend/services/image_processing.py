@@ -0,0 +1,143 @@
+"""
+Preprocesamiento de imágenes antes del análisis de visión
+"""
+
+import asyncio
+import io
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+from PIL import Image, ImageOps
+from config import settings
+from services.image_cache import dhash_from_image
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+ORIENTATION_TAG = 0x0112
+
+# Métricas acumuladas del proceso
+stats = {"processed": 0, "failed": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def detect_mime_type(image_data: bytes) -> str:
+    """Detectar tipo MIME por firma del archivo"""
+    if image_data.startswith(b"\x89PNG"):
+        return "image/png"
+    if image_data[:4] == b"RIFF" and image_data[8:12] == b"WEBP":
+        return "image/webp"
+    if image_data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return "image/jpeg"
+
+
+def preprocess_image(image_data: bytes, max_edge: int, quality: int) -> Dict:
+    """
+    Decodificar una sola vez, corregir orientación, quitar EXIF, redimensionar
+    y recodificar a JPEG. Se ejecuta en un proceso del pool.
+    Si la imagen ya cabe en max_edge, no trae EXIF (que puede incluir GPS) y
+    recodificada no ocupa menos, se conservan los bytes originales.
+    """
+    result = _unprocessed(image_data)
+
+    try:
+        with Image.open(io.BytesIO(image_data)) as img:
+            has_exif = "exif" in img.info or len(img.getexif()) > 0
+            unchanged = max(img.size) <= max_edge and not has_exif
+            img.draft("RGB", (max_edge, max_edge))  # reducción en la decodificación JPEG
+            img = ImageOps.exif_transpose(img)
+
+            if img.mode in ("RGBA", "LA", "P"):
+                img = img.convert("RGBA")
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask=img.split()[-1])
+                img = background
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            result["image_hash"] = dhash_from_image(img)
+
+            # Guardar sin metadatos EXIF
+            output = io.BytesIO()
+            img.save(output, format="JPEG", quality=quality, optimize=True)
+            result["dimensions"] = {"width": img.width, "height": img.height}
+    except Exception:
+        return result
+
+    result["processed"] = True
+    if unchanged and output.tell() >= len(image_data):
+        return result
+    result.update({
+        "data": output.getvalue(),
+        "mime_type": "image/jpeg",
+        "processed_bytes": output.tell()
+    })
+    return result
+
+
+def _unprocessed(image_data: bytes) -> Dict:
+    """Resultado con la imagen tal cual llegó"""
+    return {
+        "data": image_data,
+        "mime_type": detect_mime_type(image_data),
+        "image_hash": None,
+        "original_bytes": len(image_data),
+        "processed_bytes": len(image_data),
+        "dimensions": None,
+        "processed": False
+    }
+
+
+async def preprocess_image_async(image_data: bytes) -> Dict:
+    """
+    Preprocesar imagen en el pool de procesos sin bloquear el event loop.
+    Si el pool falla se devuelve la imagen original (nunca lanza).
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.IMAGE_PROCESS_WORKERS)
+
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(
+            _executor,
+            preprocess_image,
+            image_data,
+            settings.IMAGE_MAX_EDGE,
+            settings.IMAGE_JPEG_QUALITY
+        )
+    except BrokenProcessPool as e:
+        # Un proceso murió (OOM, señal): el pool ya no acepta tareas, se recrea en la próxima
+        print(f"⚠️ Pool de imágenes roto, se envía la imagen original: {e}")
+        shutdown(wait=False)
+        result = _unprocessed(image_data)
+    except Exception as e:
+        # Errores de serialización u otros del pool
+        print(f"⚠️ Preprocesamiento no disponible, se envía la imagen original: {e}")
+        result = _unprocessed(image_data)
+
+    if result["processed"]:
+        stats["processed"] += 1
+        stats["bytes_in"] += result["original_bytes"]
+        stats["bytes_out"] += result["processed_bytes"]
+    else:
+        stats["failed"] += 1
+    result["saved_bytes"] = result["original_bytes"] - result["processed_bytes"]
+    return result
+
+
+def get_stats() -> Dict:
+    """Métricas de preprocesamiento"""
+    return {
+        **stats,
+        "bytes_saved": stats["bytes_in"] - stats["bytes_out"],
+        "avg_reduction": round(1 - stats["bytes_out"] / stats["bytes_in"], 3) if stats["bytes_in"] else 0.0
+    }
+
+
+def shutdown(wait: bool = True):
+    """Cerrar pool de procesos"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,266 @@
+"""
+Cola durable de análisis sobre Redis Streams
+"""
+
+import asyncio
+import json
+import socket
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import redis.asyncio as redis
+from redis.exceptions import ResponseError
+from config import settings
+from services.analysis_queue import QueueFullError
+
+IMAGE_KEY = "analysis:image:{}"
+JOB_KEY = "analysis:job:{}"
+
+
+class RedisJobQueue:
+    """Productor y consultas de estado para la cola de análisis en Redis"""
+
+    def __init__(self, redis_url: str = None):
+        # Cliente binario: las imágenes se guardan sin decodificar
+        self.redis = redis.from_url(redis_url or settings.REDIS_URL)
+        self.stream = settings.ANALYSIS_STREAM
+        self.dead_letter_stream = settings.ANALYSIS_DEAD_LETTER_STREAM
+        self.group = settings.ANALYSIS_CONSUMER_GROUP
+
+    async def enqueue(
+        self,
+        analysis_id: str,
+        image_data: bytes,
+        user_id: int,
+        meal_type: Optional[str],
+        notes: Optional[str]
+    ) -> str:
+        """
+        Guardar imagen y publicar trabajo; lanza QueueFullError si hay demasiados pendientes
+        """
+        depth = await self.pending_count()
+        if depth >= settings.ANALYSIS_QUEUE_SIZE:
+            raise QueueFullError(max(1, depth // max(1, settings.ANALYSIS_MAX_CONCURRENCY)))
+
+        image_key = IMAGE_KEY.format(analysis_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(image_key, image_data, ex=settings.ANALYSIS_JOB_TTL)
+            pipe.hset(JOB_KEY.format(analysis_id), mapping={
+                "status": "queued",
+                "user_id": user_id,
+                "attempts": 0,
+                "created_at": time.time()
+            })
+            pipe.expire(JOB_KEY.format(analysis_id), settings.ANALYSIS_JOB_TTL)
+            pipe.xadd(
+                self.stream,
+                _encode_job(analysis_id, image_key, user_id, meal_type, notes, attempts=0),
+                maxlen=settings.ANALYSIS_STREAM_MAXLEN,
+                approximate=True
+            )
+            results = await pipe.execute()
+
+        return results[-1].decode() if isinstance(results[-1], bytes) else results[-1]
+
+    async def pending_count(self) -> int:
+        """Trabajos no confirmados (en espera + en proceso)"""
+        try:
+            groups = await self.redis.xinfo_groups(self.stream)
+        except ResponseError:
+            return 0  # el stream aún no existe
+        for group in groups:
+            if _decode(group.get("name")) == self.group:
+                lag = group.get("lag") or 0
+                return int(lag) + int(group.get("pending", 0))
+        return await self.redis.xlen(self.stream)
+
+    async def get_job(self, analysis_id: str) -> Optional[Dict]:
+        """Obtener estado de un trabajo desde Redis"""
+        data = await self.redis.hgetall(JOB_KEY.format(analysis_id))
+        if not data:
+            return None
+        job = {_decode(k): _decode(v) for k, v in data.items()}
+        job["id"] = analysis_id
+        job.setdefault("error", None)
+        if job.get("result"):
+            job["result"] = json.loads(job["result"])
+        return job
+
+    async def get_stats(self) -> Dict:
+        """Métricas del stream de trabajos"""
+        try:
+            return {
+                "pending": await self.pending_count(),
+                "stream_length": await self.redis.xlen(self.stream),
+                "dead_letter": await self.redis.xlen(self.dead_letter_stream)
+            }
+        except Exception as e:
+            return {"error": str(e)}
+
+    async def close(self):
+        """Cerrar conexión"""
+        await self.redis.close()
+
+
+class AnalysisStreamWorker:
+    """Consumidor de trabajos con consumer groups, reintentos y dead-letter"""
+
+    def __init__(
+        self,
+        handler: Callable[..., Awaitable],
+        consumer_name: str = None,
+        concurrency: int = None,
+        redis_url: str = None
+    ):
+        self.handler = handler
+        self.queue = RedisJobQueue(redis_url)
+        self.redis = self.queue.redis
+        self.consumer = consumer_name or f"{socket.gethostname()}-{os.getpid()}"
+        self.concurrency = concurrency or settings.ANALYSIS_MAX_CONCURRENCY
+        self.max_attempts = settings.ML_MAX_RETRIES
+        self._running = False
+
+    async def ensure_group(self):
+        """Crear consumer group (y stream) si no existe"""
+        try:
+            await self.redis.xgroup_create(
+                self.queue.stream, self.queue.group, id="0", mkstream=True
+            )
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def run(self):
+        """Bucle principal del worker"""
+        await self.ensure_group()
+        self._running = True
+        print(f"✅ Worker {self.consumer} escuchando {self.queue.stream} ({self.concurrency} concurrentes)")
+
+        while self._running:
+            try:
+                messages = await self._claim_stale()
+                if not messages:
+                    response = await self.redis.xreadgroup(
+                        self.queue.group,
+                        self.consumer,
+                        {self.queue.stream: ">"},
+                        count=self.concurrency,
+                        block=settings.ANALYSIS_WORKER_BLOCK_MS
+                    )
+                    messages = [(msg_id, fields, 1) for _, entries in response for msg_id, fields in entries]
+
+                if messages:
+                    await asyncio.gather(*(self.process_message(*m) for m in messages))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Error en worker {self.consumer}: {e}")
+                await asyncio.sleep(1)
+
+    def stop(self):
+        """Terminar el bucle después del lote actual"""
+        self._running = False
+
+    async def _claim_stale(self) -> List[Tuple]:
+        """Reclamar trabajos entregados a workers caídos"""
+        result = await self.redis.xautoclaim(
+            self.queue.stream,
+            self.queue.group,
+            self.consumer,
+            min_idle_time=settings.ANALYSIS_CLAIM_IDLE_MS,
+            start_id="0-0",
+            count=self.concurrency
+        )
+        claimed = []
+        for msg_id, fields in result[1]:
+            if not fields:
+                continue  # entrada eliminada del stream por MAXLEN
+            pending = await self.redis.xpending_range(
+                self.queue.stream, self.queue.group, min=msg_id, max=msg_id, count=1
+            )
+            deliveries = pending[0]["times_delivered"] if pending else 1
+            claimed.append((msg_id, fields, deliveries))
+        return claimed
+
+    async def process_message(self, msg_id, fields: Dict, deliveries: int = 1):
+        """Procesar un trabajo y confirmar, reintentar o enviar a dead-letter"""
+        job = {_decode(k): _decode(v) for k, v in fields.items()}
+        analysis_id = job["analysis_id"]
+        attempts = int(job.get("attempts", 0)) + deliveries - 1
+        job_key = JOB_KEY.format(analysis_id)
+
+        if attempts >= self.max_attempts:
+            await self._dead_letter(msg_id, job, "máximo de entregas alcanzado")
+            return
+
+        await self.redis.hset(job_key, mapping={"status": "processing", "attempts": attempts + 1})
+        try:
+            image_data = await self.redis.get(job["image_key"])
+            if image_data is None:
+                await self._dead_letter(msg_id, job, "imagen expirada o inexistente")
+                return
+
+            result = await self.handler(
+                analysis_id,
+                image_data,
+                int(job["user_id"]),
+                job.get("meal_type") or None,
+                job.get("notes") or None
+            )
+
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(job_key, mapping={
+                    "status": "completed",
+                    "result": json.dumps(result, default=str),
+                    "finished_at": time.time()
+                })
+                pipe.delete(job["image_key"])
+                pipe.xack(self.queue.stream, self.queue.group, msg_id)
+                await pipe.execute()
+
+        except Exception as e:
+            if attempts + 1 < self.max_attempts:
+                print(f"⚠️ Reintentando análisis {analysis_id} ({attempts + 1}/{self.max_attempts}): {e}")
+                job["attempts"] = attempts + 1
+                async with self.redis.pipeline(transaction=True) as pipe:
+                    pipe.hset(job_key, mapping={"status": "queued", "error": str(e)})
+                    pipe.xadd(self.queue.stream, job, maxlen=settings.ANALYSIS_STREAM_MAXLEN, approximate=True)
+                    pipe.xack(self.queue.stream, self.queue.group, msg_id)
+                    await pipe.execute()
+            else:
+                await self._dead_letter(msg_id, job, str(e))
+
+    async def _dead_letter(self, msg_id, job: Dict, error: str):
+        """Mover trabajo al stream de dead-letter y marcarlo como fallido"""
+        print(f"❌ Análisis {job['analysis_id']} enviado a dead-letter: {error}")
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xadd(self.queue.dead_letter_stream, {**job, "error": error, "failed_at": time.time()})
+            pipe.hset(JOB_KEY.format(job["analysis_id"]), mapping={
+                "status": "failed",
+                "error": error,
+                "finished_at": time.time()
+            })
+            pipe.delete(job["image_key"])
+            pipe.xack(self.queue.stream, self.queue.group, msg_id)
+            await pipe.execute()
+
+
+def _encode_job(analysis_id, image_key, user_id, meal_type, notes, attempts) -> Dict:
+    """Campos del mensaje (Redis Streams solo admite valores planos)"""
+    return {
+        "analysis_id": analysis_id,
+        "image_key": image_key,
+        "user_id": user_id,
+        "meal_type": meal_type or "",
+        "notes": notes or "",
+        "attempts": attempts
+    }
+
+
+def _decode(value):
+    """Decodificar bytes de Redis"""
+    return value.decode() if isinstance(value, bytes) else value
+
+
+# Instancia global del productor
+job_queue = RedisJobQueue()
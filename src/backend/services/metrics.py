@@ -0,0 +1,39 @@
+"""
+Utilidades de métricas en memoria
+"""
+
+from collections import deque
+from typing import Dict
+
+
+class LatencyTracker:
+    """Ventana deslizante de latencias (ms) con percentiles"""
+
+    def __init__(self, window: int = 1000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total_ms = 0.0
+
+    def record(self, latency_ms: float):
+        """Registrar una muestra"""
+        self.samples.append(latency_ms)
+        self.count += 1
+        self.total_ms += latency_ms
+
+    def percentile(self, p: float) -> float:
+        """Percentil p (0-100) de la ventana actual"""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def get_stats(self) -> Dict:
+        """Resumen de la ventana"""
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50), 2),
+            "p95_ms": round(self.percentile(95), 2),
+            "max_ms": round(max(self.samples), 2) if self.samples else 0.0
+        }
@@ -6,48 +6,137 @@ import openai
 import base64
 import json
 import asyncio
-from typing import List, Dict
+from typing import List, Dict, Optional
 from config import settings
+from services.image_cache import image_cache, compute_dhash
+from services.image_processing import preprocess_image_async, detect_mime_type
+from services.concurrency import AIMDLimiter
+
+# Cliente compartido por todo el proceso (reutiliza el pool de conexiones HTTP)
+_openai_client: Optional[openai.AsyncOpenAI] = None
+
+# Concurrencia adaptativa frente a los límites del proveedor
+vision_limiter = AIMDLimiter(
+    initial_limit=settings.OPENAI_INITIAL_CONCURRENCY,
+    min_limit=settings.OPENAI_MIN_CONCURRENCY,
+    max_limit=settings.OPENAI_MAX_CONCURRENCY
+)
+
+def get_openai_client() -> openai.AsyncOpenAI:
+    """Obtener (o crear) el cliente OpenAI del proceso"""
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = openai.AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            timeout=settings.ML_TIMEOUT,
+            max_retries=0  # los reintentos pasan por el limitador AIMD
+        )
+    return _openai_client
+
+async def close_openai_client():
+    """Cerrar el cliente OpenAI del proceso"""
+    global _openai_client
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
 
 class MLService:
     """Servicio para análisis de imágenes con OpenAI Vision"""
     
     def __init__(self):
-        self.client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        self.client = get_openai_client()
         self.model = "gpt-4-vision-preview"
         
-    async def analyze_food_image(self, image_data: bytes) -> List[Dict]:
+    async def analyze_food_image(
+        self,
+        image_data: bytes,
+        user_id: Optional[int] = None,
+        raise_errors: bool = False
+    ) -> List[Dict]:
         """
-        Analizar imagen y extraer información de alimentos
+        Analizar imagen y extraer información de alimentos.
+        El cache de fotos casi duplicadas es por usuario (sin user_id no se usa).
+        Con raise_errors los fallos del modelo se propagan (la cola reintenta)
+        en lugar de devolver la respuesta de fallback.
         """
+        # Reducir y recodificar la imagen (una sola decodificación, en el pool de procesos)
+        mime_type = detect_mime_type(image_data)
+        image_hash = None
+        if settings.IMAGE_PREPROCESS_ENABLED:
+            processed = await preprocess_image_async(image_data)
+            if processed["processed"]:
+                print(
+                    f"🖼️ Imagen {processed['original_bytes']} → {processed['processed_bytes']} bytes "
+                    f"({processed['saved_bytes']} ahorrados)"
+                )
+                image_data = processed["data"]
+                mime_type = processed["mime_type"]
+                image_hash = processed["image_hash"]
+        elif settings.IMAGE_CACHE_ENABLED and user_id is not None:
+            image_hash = await asyncio.to_thread(compute_dhash, image_data)
+        
+        # Reutilizar resultado de una foto casi idéntica reciente del mismo usuario
+        if not settings.IMAGE_CACHE_ENABLED or user_id is None:
+            image_hash = None
+        if image_hash is not None:
+            cached_foods = image_cache.get(image_hash, scope=user_id)
+            if cached_foods is not None:
+                return cached_foods
+        
         try:
             # Convertir imagen a base64
             image_base64 = base64.b64encode(image_data).decode('utf-8')
-            image_url = f"data:image/jpeg;base64,{image_base64}"
+            image_url = f"data:{mime_type};base64,{image_base64}"
             
             # Llamada a OpenAI Vision API
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[{
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": self._get_analysis_prompt()},
-                        {"type": "image_url", "image_url": {"url": image_url}}
-                    ]
-                }],
-                max_tokens=500,
-                temperature=0.1
-            )
+            response = await self._create_completion(image_url)
             
             # Parsear respuesta
             content = response.choices[0].message.content
-            return self._parse_analysis_response(content)
+            foods = self._parse_analysis_response(content)
+            
+            if image_hash is not None and foods != self._get_fallback_response():
+                image_cache.put(image_hash, foods, scope=user_id)
+            return foods
             
         except Exception as e:
             print(f"❌ Error en análisis ML: {e}")
+            if raise_errors:
+                raise
             # Fallback: devolver datos de ejemplo
             return self._get_fallback_response()
     
+    async def _create_completion(self, image_url: str):
+        """Llamar al modelo de visión respetando el limitador, con reintentos y backoff"""
+        attempts = max(1, settings.ML_MAX_RETRIES)  # ML_MAX_RETRIES=0 sigue haciendo la llamada
+        for attempt in range(attempts):
+            window = await vision_limiter.acquire()
+            outcome = "error"
+            try:
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[{
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": self._get_analysis_prompt()},
+                            {"type": "image_url", "image_url": {"url": image_url}}
+                        ]
+                    }],
+                    max_tokens=500,
+                    temperature=0.1
+                )
+                outcome = "success"
+                return response
+            except (openai.RateLimitError, openai.APITimeoutError) as e:
+                outcome = "overload"
+                if attempt == attempts - 1:
+                    raise
+                print(f"⚠️ OpenAI saturado ({type(e).__name__}), reintento {attempt + 1}")
+            finally:
+                await vision_limiter.release(outcome, window)
+            
+            await asyncio.sleep(min(8, 0.5 * 2 ** attempt))
+    
     def _get_analysis_prompt(self) -> str:
         """Prompt optimizado para análisis de alimentos"""
         return """
@@ -0,0 +1,49 @@
+"""
+Esquema canónico de nutrientes: vectores de orden fijo y cálculos por lotes
+"""
+
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+
+# Orden fijo de los vectores (y de las columnas del catálogo)
+NUTRIENTS = ["calories", "protein", "carbs", "fat", "fiber", "sugar", "sodium"]
+UNITS = {
+    "calories": "kcal",
+    "protein": "g",
+    "carbs": "g",
+    "fat": "g",
+    "fiber": "g",
+    "sugar": "g",
+    "sodium": "mg",  # como USDA, Nutritionix y la tabla detected_foods
+}
+SIZE = len(NUTRIENTS)
+
+# Versión de unidades de los datos cacheados (2: sodio en mg)
+SCHEMA_VERSION = 2
+
+
+def to_vector(nutrition: Optional[Dict]) -> np.ndarray:
+    """Dict de nutrientes → vector float64 (faltantes en 0)"""
+    nutrition = nutrition or {}
+    return np.array([nutrition.get(key) or 0.0 for key in NUTRIENTS], dtype=np.float64)
+
+
+def to_matrix(nutritions: Iterable[Optional[Dict]]) -> np.ndarray:
+    """Varios dicts → matriz (alimentos × nutrientes)"""
+    rows = [[(nutrition or {}).get(key) or 0.0 for key in NUTRIENTS] for nutrition in nutritions]
+    return np.array(rows, dtype=np.float64).reshape(len(rows), SIZE)
+
+
+def scale_portions(per_100g: np.ndarray, grams) -> np.ndarray:
+    """Nutrientes de cada porción: una sola operación para todos los alimentos"""
+    return per_100g * (np.asarray(grams, dtype=np.float64) / 100.0)[..., None]
+
+
+def to_dict(vector: np.ndarray, decimals: int = 2) -> Dict[str, float]:
+    """Vector → dict para la respuesta de la API"""
+    return dict(zip(NUTRIENTS, np.round(vector, decimals).tolist()))
+
+
+def to_dicts(matrix: np.ndarray, decimals: int = 2) -> List[Dict[str, float]]:
+    """Matriz → lista de dicts, redondeando todas las filas de una vez"""
+    return [dict(zip(NUTRIENTS, row)) for row in np.round(matrix, decimals).tolist()]
@@ -0,0 +1,98 @@
+"""
+Codificación binaria compacta de las entradas de nutrición en Redis
+
+Formato 2: cabecera fija (con el vencimiento suave de la entrada) + vector
+float32 en el orden de nutrients.NUTRIENTS + nombre en UTF-8. Las entradas
+del formato 1 y las JSON anteriores se siguen leyendo.
+"""
+
+import json
+import struct
+from typing import Dict, Optional, Tuple
+from services import nutrients
+
+MAGIC = b"NV"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<2sBBBBI")  # magic, formato, esquema de unidades, flags, fuente, fresh_until
+HEADER_V1 = struct.Struct("<2sBBBB")  # sin fresh_until
+VECTOR = struct.Struct(f"<{nutrients.SIZE}f")
+
+FLAG_NOT_FOUND = 0x01
+
+# Índice en la cabecera → fuente
+SOURCES = ["usda", "nutritionix", "estimated", "calculated"]
+_SOURCE_INDEX = {source: index for index, source in enumerate(SOURCES)}
+
+# Campos que caben en el formato binario; cualquier otro obliga a usar JSON
+_FIELDS = {"nutrition_per_100g", "source", "food_name", "schema", "not_found", "fresh_until"}
+
+
+def encode(data: Dict) -> bytes:
+    """Entrada → bytes (JSON si no encaja en el formato binario)"""
+    schema = data.get("schema", nutrients.SCHEMA_VERSION)
+    fresh_until = data.get("fresh_until") or 0  # 0: sin vencimiento suave
+    name = (data.get("food_name") or "").encode("utf-8")
+    if (
+        not data.keys() <= _FIELDS
+        or not isinstance(schema, int) or not 0 <= schema <= 255
+        or not isinstance(fresh_until, int) or not 0 <= fresh_until < 2 ** 32
+    ):
+        return json.dumps(data).encode("utf-8")
+
+    if data.get("not_found"):
+        return HEADER.pack(MAGIC, FORMAT_VERSION, schema, FLAG_NOT_FOUND, 0, fresh_until) + name
+
+    source = _SOURCE_INDEX.get(data.get("source"))
+    if source is None:
+        return json.dumps(data).encode("utf-8")
+    vector = nutrients.to_vector(data.get("nutrition_per_100g"))
+    return HEADER.pack(MAGIC, FORMAT_VERSION, schema, 0, source, fresh_until) + VECTOR.pack(*vector) + name
+
+
+class CorruptEntry(ValueError):
+    """Bytes truncados o dañados: ni binario válido ni JSON"""
+
+
+def decode(raw: bytes) -> Tuple[Optional[Dict], bool]:
+    """
+    Bytes → (entrada, es_json). Devuelve None si el formato es de una
+    versión posterior que este proceso no entiende; lanza CorruptEntry
+    si la entrada está truncada o dañada.
+    """
+    try:
+        return _decode(raw)
+    except (struct.error, ValueError, IndexError) as e:  # incluye UnicodeDecodeError y JSONDecodeError
+        raise CorruptEntry(f"entrada de nutrición ilegible: {e}") from e
+
+
+def _decode(raw: bytes) -> Tuple[Optional[Dict], bool]:
+    if raw[:2] != MAGIC:
+        data = json.loads(raw)
+        if not isinstance(data, dict):
+            raise ValueError("JSON sin objeto")
+        return data, True
+
+    version = raw[2]
+    if version == FORMAT_VERSION:
+        _, _, schema, flags, source, fresh_until = HEADER.unpack_from(raw)
+        offset = HEADER.size
+    elif version == 1:
+        _, _, schema, flags, source = HEADER_V1.unpack_from(raw)
+        fresh_until, offset = 0, HEADER_V1.size
+    else:
+        return None, False
+
+    if flags & FLAG_NOT_FOUND:
+        data = {"not_found": True, "food_name": raw[offset:].decode("utf-8"), "schema": schema}
+    else:
+        values = VECTOR.unpack_from(raw, offset)
+        data = {
+            # float32 → 4 decimales, como el catálogo columnar
+            "nutrition_per_100g": {key: round(value, 4) for key, value in zip(nutrients.NUTRIENTS, values)},
+            "source": SOURCES[source],
+            "food_name": raw[offset + VECTOR.size:].decode("utf-8"),
+            "schema": schema
+        }
+    if fresh_until:
+        data["fresh_until"] = fresh_until
+    return data, False
@@ -2,12 +2,85 @@
 Servicio de información nutricional
 """
 
-import aiohttp
 import asyncio
-from typing import Dict, Optional
-import json
+import os
+import random
+import time
+import uuid
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
 from config import settings
-from database import get_redis
+from database import get_redis, get_redis_binary, redis_fallback
+from services.http_sessions import http_sessions
+from services.memory_cache import TTLCache
+from services.metrics import LatencyTracker
+from services.concurrency import SingleFlight
+from services.food_names import cache_name
+from services.food_translation import food_translator
+from services.food_catalog import food_catalog
+from services.disk_cache import disk_cache
+from services import nutrients, nutrition_codec
+
+INVALIDATION_CHANNEL = "nutrition:invalidate"
+
+# Identificador del proceso para ignorar sus propias invalidaciones
+PROCESS_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+# L1: cache en memoria del proceso delante de Redis
+l1_cache = TTLCache(
+    max_entries=settings.NUTRITION_L1_MAX_ENTRIES,
+    ttl=settings.NUTRITION_L1_TTL
+)
+redis_stats = {"hits": 0, "misses": 0, "errors": 0, "stale_schema": 0}
+redis_latency = LatencyTracker()
+
+# Una sola consulta upstream por alimento (en el proceso y entre procesos)
+upstream_flight = SingleFlight()
+lock_stats = {"acquired": 0, "waited": 0, "served_by_peer": 0, "fallbacks": 0}
+negative_stats = {"stored": 0, "hits": 0}
+
+# Consultas por lotes: comandos enviados a Redis frente a viajes de ida y vuelta
+batch_stats = {"batches": 0, "foods": 0, "redis_commands": 0, "redis_round_trips": 0, "timeouts": 0}
+
+# Codificación binaria de las entradas (las JSON anteriores se reescriben al leerlas)
+encoding_stats = {
+    "written": 0, "bytes_written": 0, "legacy_read": 0, "migrated": 0, "unknown_format": 0, "corrupt": 0
+}
+
+# Stale-while-revalidate: una revalidación en segundo plano por clave
+refresh_tasks: Dict[str, asyncio.Task] = {}
+refresh_retry_at: Dict[str, float] = {}  # claves cuya revalidación falló: no reintentar antes
+refresh_stats = {"stale_served": 0, "scheduled": 0, "deduplicated": 0, "refreshed": 0, "skipped": 0, "failed": 0}
+
+# Hedging: Nutritionix en paralelo si USDA supera su percentil de latencia
+usda_latency = LatencyTracker()
+nutritionix_latency = LatencyTracker()
+upstream_latency = LatencyTracker()  # consulta completa, con o sin cobertura
+hedge_stats = {
+    "lookups": 0, "hedged": 0, "hedge_wins": 0, "usda_cancelled": 0, "nutritionix_cancelled": 0,
+    "saved_ms": 0.0, "budget_exhausted": 0
+}
+# Últimas consultas con hedging activo (True si se lanzó la cobertura)
+hedge_window: Deque[bool] = deque(maxlen=settings.NUTRITION_HEDGE_RATE_WINDOW)
+
+# Liberar el lock solo si sigue siendo nuestro
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+def _release_lock_in_memory(store, keys, args) -> int:
+    """RELEASE_LOCK_SCRIPT sobre el almacén de respaldo (circuito de Redis abierto)"""
+    if store.execute("get", (keys[0],), {}) == args[0]:
+        return store.execute("delete", (keys[0],), {})
+    return 0
+
+redis_fallback.register_script(RELEASE_LOCK_SCRIPT, _release_lock_in_memory)
+
+class UpstreamUnavailable(Exception):
+    """USDA / Nutritionix no respondieron (error de red, timeout o estado distinto de 200)"""
 
 class NutritionService:
     """Servicio para obtener información nutricional de alimentos"""
@@ -20,39 +93,663 @@ class NutritionService:
         """
         Obtener datos nutricionales con estrategia de cache y fallback
         """
-        # 1. Buscar en cache Redis
-        cache_key = f"nutrition:{food_name.lower()}"
-        redis_client = await get_redis()
+        base_data = await self.get_base_nutrition(food_name)
+        return self._calculate_portion_nutrition(base_data, portion_grams)
+    
+    async def get_base_nutrition(self, food_name: str) -> Dict:
+        """
+        Datos por 100 g del alimento (para escalar porciones por lotes)
+        """
+        # 1. Buscar en cache (memoria del proceso, catálogo local, Redis y disco)
+        cache_key = f"nutrition:{cache_name(food_name)}"
+        data = await self._cache_get(cache_key)
+        if data is not None and data.get("not_found"):
+            negative_stats["hits"] += 1
+        if data is not None and self._is_stale(data):
+            # Vencido el soft TTL: responder ya y revalidar en segundo plano
+            self._schedule_refresh(food_name, cache_key)
+        
+        # 2. USDA y luego Nutritionix, una sola consulta por alimento
+        if data is None:
+            try:
+                data = await upstream_flight.do(
+                    cache_key,
+                    lambda: self._load_upstream_coalesced(food_name, cache_key)
+                )
+            except UpstreamUnavailable as e:
+                # Falla transitoria: estimar sin guardar nada en cache
+                print(f"⚠️ {e}, usando estimación")
+        
+        if data and not data.get("not_found"):
+            return data
+        
+        # 3. Fallback final: datos estimados (alimento desconocido para ambas fuentes)
+        return self._estimate_base_nutrition(food_name)
+    
+    async def get_base_nutrition_many(
+        self,
+        food_names: List[str],
+        timeout: Optional[float] = None,
+        concurrency: int = 8,
+        upstream_gate: Optional[Callable[[str], Awaitable]] = None,
+        latency: Optional[LatencyTracker] = None
+    ) -> List[Dict]:
+        """
+        Datos por 100 g de varios alimentos, en el orden de entrada: un solo MGET
+        para lo que no esté en memoria y una sola escritura en pipeline al final.
+        upstream_gate(cache_key) se espera antes de cada consulta upstream,
+        fuera del timeout (p. ej. para limitar la tasa del precalentamiento).
+        latency recibe una muestra por alimento.
+        """
+        start = time.perf_counter()
+        keys = [f"nutrition:{cache_name(food_name)}" for food_name in food_names]
+        names: Dict[str, str] = {}
+        for cache_key, food_name in zip(keys, food_names):
+            names.setdefault(cache_key, food_name)
+        batch_stats["batches"] += 1
+        batch_stats["foods"] += len(food_names)
+        
+        # 1. Memoria del proceso y catálogo local
+        found: Dict[str, Dict] = {}
+        for cache_key in names:
+            data = await self._local_get(cache_key)
+            if data is not None:
+                found[cache_key] = data
+        
+        # 2. Redis: un MGET para todas las claves restantes
+        missing = [cache_key for cache_key in names if cache_key not in found]
+        if missing:
+            found.update(await self._redis_get_many(missing))
+        
+        # 3. L2 en disco para lo que Redis no tenga (o si no responde)
+        missing = [cache_key for cache_key in missing if cache_key not in found]
+        if missing:
+            found.update(await self._disk_get_many(missing))
+        negative_stats["hits"] += sum(1 for data in found.values() if data.get("not_found"))
+        for cache_key, data in found.items():
+            if self._is_stale(data):
+                self._schedule_refresh(names[cache_key], cache_key)
+        if latency is not None:
+            cached_ms = (time.perf_counter() - start) * 1000
+            for _ in found:
+                latency.record(cached_ms)
+        
+        # 4. Upstream para los faltantes, escritos juntos en un pipeline
+        upstream = {cache_key: names[cache_key] for cache_key in names if cache_key not in found}
+        if upstream:
+            found.update(await self._load_upstream_many(upstream, timeout, concurrency, upstream_gate, latency))
+        
+        results = []
+        for cache_key, food_name in zip(keys, food_names):
+            data = found.get(cache_key)
+            if data and not data.get("not_found"):
+                results.append(data)
+            else:
+                results.append(self._estimate_base_nutrition(food_name))
+        return results
+    
+    async def _load_upstream_coalesced(self, food_name: str, cache_key: str) -> Optional[Dict]:
+        """
+        Consultar upstream y guardar en cache bajo un lock corto en Redis, para
+        que los demás workers esperen el resultado en lugar de repetir la consulta
+        """
+        redis_client = await get_redis_binary()
+        lock_key = f"lock:{cache_key}"
+        token = uuid.uuid4().hex
         
         try:
-            cached_data = await redis_client.get(cache_key)
-            if cached_data:
-                data = json.loads(cached_data)
-                return self._calculate_portion_nutrition(data, portion_grams)
+            if not settings.NUTRITION_REDIS_ENABLED:
+                raise ConnectionError("Redis desactivado")
+            acquired = bool(await redis_client.set(
+                lock_key, token, nx=True, px=settings.NUTRITION_LOCK_TTL_MS
+            ))
+            locked_by_peer = not acquired
+        except Exception:
+            # Redis no disponible: consultar directamente
+            acquired = locked_by_peer = False
+        
+        if locked_by_peer:
+            # Otro worker está consultando: esperar a que publique en cache
+            lock_stats["waited"] += 1
+            data = await self._wait_for_peer(cache_key, lock_key)
+            if data is not None:
+                lock_stats["served_by_peer"] += 1
+                return data
+            lock_stats["fallbacks"] += 1
+        elif acquired:
+            lock_stats["acquired"] += 1
+        
+        try:
+            return await self._fetch_and_cache(food_name, cache_key)
+        finally:
+            if acquired:
+                await self._release_lock(lock_key, token)
+    
+    async def _release_lock(self, lock_key: str, token: str):
+        """Liberar el lock solo si sigue siendo nuestro"""
+        redis_client = await get_redis_binary()
+        try:
+            await redis_client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
         except Exception as e:
-            print(f"⚠️ Error accediendo cache: {e}")
+            print(f"⚠️ Error liberando lock {lock_key}: {e}")
+    
+    async def _load_upstream_many(
+        self,
+        names: Dict[str, str],
+        timeout: Optional[float],
+        concurrency: int,
+        upstream_gate: Optional[Callable[[str], Awaitable]] = None,
+        latency: Optional[LatencyTracker] = None
+    ) -> Dict[str, Dict]:
+        """
+        Versión por lotes de _load_upstream_coalesced: los locks se toman en un
+        pipeline y los resultados se guardan (liberando los locks) en otro
+        """
+        redis_client = await get_redis_binary()
+        token = uuid.uuid4().hex
+        try:
+            if not settings.NUTRITION_REDIS_ENABLED:
+                raise ConnectionError("Redis desactivado")
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for cache_key in names:
+                    pipe.set(f"lock:{cache_key}", token, nx=True, px=settings.NUTRITION_LOCK_TTL_MS)
+                acquired = dict(zip(names, (bool(flag) for flag in await pipe.execute())))
+            redis_available = True
+            batch_stats["redis_commands"] += len(names)
+            batch_stats["redis_round_trips"] += 1
+        except Exception:
+            # Redis no disponible: consultar directamente
+            acquired = dict.fromkeys(names, False)
+            redis_available = False
+        lock_stats["acquired"] += sum(acquired.values())
+        
+        pending: Dict[str, Dict] = {}
+        running = set()
+        flushed = False
+        semaphore = asyncio.Semaphore(concurrency)
         
-        # 2. Buscar en USDA (fuente primaria)
-        usda_data = await self._search_usda(food_name)
-        if usda_data:
-            # Guardar en cache
+        async def fetch(cache_key: str) -> Dict:
+            running.add(cache_key)
             try:
-                await redis_client.setex(cache_key, 604800, json.dumps(usda_data))  # 7 días
+                data = await self._fetch_upstream(names[cache_key], cache_key)
+            finally:
+                running.discard(cache_key)
+            if flushed:
+                # Terminó después del timeout del lote: se guarda por su cuenta
+                await self._cache_set(cache_key, data)
+                if acquired[cache_key]:
+                    await self._release_lock(f"lock:{cache_key}", token)
+            else:
+                pending[cache_key] = data
+            return data
+        
+        async def resolve(cache_key: str) -> Optional[Dict]:
+            if redis_available and not acquired[cache_key]:
+                lock_stats["waited"] += 1
+                data = await asyncio.wait_for(
+                    self._wait_for_peer(cache_key, f"lock:{cache_key}"), timeout=timeout
+                )
+                if data is not None:
+                    lock_stats["served_by_peer"] += 1
+                    return data
+                lock_stats["fallbacks"] += 1
+            async with semaphore:
+                # El timeout cuenta desde que hay turno, no mientras se espera en la cola
+                return await asyncio.wait_for(
+                    upstream_flight.do(cache_key, lambda: fetch(cache_key)), timeout=timeout
+                )
+        
+        async def resolve_with_timeout(cache_key: str) -> Optional[Dict]:
+            if upstream_gate is not None:
+                await upstream_gate(cache_key)
+            start = time.perf_counter()
+            try:
+                return await resolve(cache_key)
+            except asyncio.TimeoutError:
+                batch_stats["timeouts"] += 1
+                print(f"⚠️ Timeout obteniendo nutrición de '{names[cache_key]}', usando estimación")
+            except UpstreamUnavailable as e:
+                print(f"⚠️ {e}, usando estimación")
             except Exception as e:
-                print(f"⚠️ Error guardando en cache: {e}")
+                print(f"❌ Error obteniendo nutrición de '{names[cache_key]}': {e}")
+            finally:
+                if latency is not None:
+                    latency.record((time.perf_counter() - start) * 1000)
+            return None
+        
+        results = await asyncio.gather(*(resolve_with_timeout(cache_key) for cache_key in names))
+        flushed = True
+        
+        # Los locks de consultas que siguen en curso se liberan cuando terminen
+        await self._cache_set_many(
+            pending,
+            [cache_key for cache_key in names if acquired[cache_key] and cache_key not in running],
+            token
+        )
+        return {cache_key: data for cache_key, data in zip(names, results) if data is not None}
+    
+    async def _fetch_and_cache(self, food_name: str, cache_key: str) -> Dict:
+        """Consultar upstream y guardar el resultado (positivo o negativo)"""
+        data = await self._fetch_upstream(food_name, cache_key)
+        await self._cache_set(cache_key, data)
+        return data
+    
+    @staticmethod
+    def _expiry(data: Dict) -> int:
+        """
+        TTL duro de la entrada; las positivas además guardan su vencimiento
+        suave. Ambos llevan jitter para que las escritas juntas no venzan juntas.
+        """
+        if data.get("not_found"):
+            return settings.NUTRITION_NEGATIVE_TTL
+        jitter = 1 - random.uniform(0, settings.NUTRITION_TTL_JITTER)
+        hard_ttl = int(settings.NUTRITION_HARD_TTL * jitter)
+        soft_ttl = min(int(settings.NUTRITION_SOFT_TTL * jitter), hard_ttl)
+        data["fresh_until"] = int(time.time()) + soft_ttl
+        return hard_ttl
+    
+    @staticmethod
+    def _is_stale(data: Dict) -> bool:
+        """Pasó el soft TTL (las entradas sin fresh_until no se revalidan)"""
+        fresh_until = data.get("fresh_until")
+        return fresh_until is not None and fresh_until <= time.time()
+    
+    def _schedule_refresh(self, food_name: str, cache_key: str):
+        """Lanzar la revalidación de la clave si no hay otra en curso"""
+        refresh_stats["stale_served"] += 1
+        if cache_key in refresh_tasks:
+            refresh_stats["deduplicated"] += 1
+            return
+        if refresh_retry_at.get(cache_key, 0) > time.monotonic():
+            return
+        refresh_retry_at.pop(cache_key, None)
+        refresh_stats["scheduled"] += 1
+        task = asyncio.create_task(self._refresh(food_name, cache_key))
+        refresh_tasks[cache_key] = task
+        task.add_done_callback(lambda _: refresh_tasks.pop(cache_key, None))
+    
+    async def _refresh(self, food_name: str, cache_key: str):
+        """
+        Revalidar una entrada vencida. Si upstream falla se conserva el valor
+        anterior hasta el hard TTL en lugar de guardar una entrada negativa.
+        """
+        redis_client = await get_redis_binary()
+        lock_key = f"lock:{cache_key}"
+        token = uuid.uuid4().hex
+        acquired = False
+        if settings.NUTRITION_REDIS_ENABLED:
+            try:
+                if not await redis_client.set(lock_key, token, nx=True, px=settings.NUTRITION_LOCK_TTL_MS):
+                    refresh_stats["skipped"] += 1  # otro worker ya la está revalidando
+                    return
+                acquired = True
+            except Exception:
+                refresh_stats["failed"] += 1
+                return
+        
+        try:
+            data = await upstream_flight.do(cache_key, lambda: self._fetch_upstream(food_name, cache_key))
+            if data.get("not_found"):
+                refresh_stats["failed"] += 1
+                refresh_retry_at[cache_key] = time.monotonic() + settings.NUTRITION_NEGATIVE_TTL
+                return
+            await self._cache_set(cache_key, data)
+            refresh_stats["refreshed"] += 1
+        except Exception as e:
+            refresh_stats["failed"] += 1
+            refresh_retry_at[cache_key] = time.monotonic() + settings.NUTRITION_NEGATIVE_TTL
+            print(f"⚠️ Error revalidando {cache_key}: {e}")
+        finally:
+            if acquired:
+                await self._release_lock(lock_key, token)
+    
+    async def _fetch_upstream(self, food_name: str, cache_key: str) -> Dict:
+        """
+        USDA (fuente primaria) y Nutritionix como respaldo, ambos por 100 g.
+        Si ambos responden sin coincidencias se devuelve una entrada negativa;
+        si alguno falla se lanza UpstreamUnavailable (no se guarda nada).
+        """
+        # USDA solo entiende inglés: traducir con el diccionario local / tabla aprendida
+        canonical = cache_key.split(":", 1)[1]
+        query, origin = await food_translator.translate(canonical)
+        
+        data = await self._search_upstream(query or food_name)
+        if data:
+            # Sin traducción, el nombre en inglés que devolvió upstream se aprende
+            await food_translator.confirm(canonical, origin, data)
+            data["schema"] = nutrients.SCHEMA_VERSION
+            return data
+        
+        negative_stats["stored"] += 1
+        return {"not_found": True, "food_name": food_name, "schema": nutrients.SCHEMA_VERSION}
+    
+    async def _search_upstream(self, food_name: str) -> Optional[Dict]:
+        """
+        USDA y luego Nutritionix; con hedging, si USDA no responde dentro de su
+        p95 se lanza también Nutritionix y gana el primer resultado válido
+        """
+        start = time.perf_counter()
+        hedge_stats["lookups"] += 1
+        try:
+            if settings.NUTRITION_HEDGE_ENABLED:
+                return await self._search_hedged(food_name)
+            data, usda_failed = await self._search_source(usda_latency, self._search_usda(food_name))
+            return data or await self._search_fallback(food_name, usda_failed)
+        finally:
+            upstream_latency.record((time.perf_counter() - start) * 1000)
+    
+    async def _search_source(self, tracker: LatencyTracker, search) -> Tuple[Optional[Dict], bool]:
+        """(resultado, falló) de una fuente; None sin fallo: la fuente no lo conoce"""
+        try:
+            return await self._timed(tracker, search), False
+        except UpstreamUnavailable:
+            return None, True
+    
+    async def _search_fallback(self, food_name: str, usda_failed: bool) -> Optional[Dict]:
+        """Nutritionix tras un USDA sin resultado; None solo si ambos respondieron"""
+        data, failed = await self._search_source(nutritionix_latency, self._search_nutritionix(food_name))
+        if data:
+            return data
+        if failed or usda_failed:
+            raise UpstreamUnavailable(f"USDA / Nutritionix no disponibles para '{food_name}'")
+        return None
+    
+    async def _search_hedged(self, food_name: str) -> Optional[Dict]:
+        """Consulta con cobertura: la que pierde se cancela"""
+        usda = asyncio.create_task(self._search_source(usda_latency, self._search_usda(food_name)))
+        nutritionix = None
+        try:
+            done, _ = await asyncio.wait({usda}, timeout=self._hedge_delay())
+            hedge = usda not in done and self._hedge_budget_allows()
+            hedge_window.append(hedge)
+            if not hedge:
+                # USDA respondió a tiempo (o no queda presupuesto de coberturas): cadena secuencial
+                data, usda_failed = await usda
+                return data or await self._search_fallback(food_name, usda_failed)
             
-            return self._calculate_portion_nutrition(usda_data, portion_grams)
+            hedge_stats["hedged"] += 1
+            hedge_start = time.perf_counter()
+            nutritionix = asyncio.create_task(
+                self._search_source(nutritionix_latency, self._search_nutritionix(food_name))
+            )
+            finished: Dict[asyncio.Task, float] = {}
+            pending = {usda, nutritionix}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                now = time.perf_counter()
+                for task in done:
+                    finished[task] = now
+                # Si llegan juntas se prefiere USDA (fuente primaria)
+                if usda in done and usda.result()[0]:
+                    return usda.result()[0]
+                if nutritionix in done and nutritionix.result()[0]:
+                    hedge_stats["hedge_wins"] += 1
+                    return nutritionix.result()[0]
+                if usda in done:
+                    # Sin cobertura, Nutritionix recién empezaría ahora
+                    overlap = min(now, finished.get(nutritionix, now)) - hedge_start
+                    hedge_stats["saved_ms"] += overlap * 1000
+            if usda.result()[1] or nutritionix.result()[1]:
+                raise UpstreamUnavailable(f"USDA / Nutritionix no disponibles para '{food_name}'")
+            return None
+        finally:
+            if not usda.done():
+                usda.cancel()
+                hedge_stats["usda_cancelled"] += 1
+            if nutritionix is not None and not nutritionix.done():
+                nutritionix.cancel()
+                hedge_stats["nutritionix_cancelled"] += 1
+    
+    @staticmethod
+    def _hedge_budget_allows() -> bool:
+        """Como mucho NUTRITION_HEDGE_MAX_RATE de coberturas en la ventana de consultas"""
+        if sum(hedge_window) < settings.NUTRITION_HEDGE_MAX_RATE * hedge_window.maxlen:
+            return True
+        hedge_stats["budget_exhausted"] += 1
+        return False
+    
+    @staticmethod
+    def _hedge_delay() -> float:
+        """Segundos de espera a USDA antes de lanzar Nutritionix"""
+        if len(usda_latency.samples) < settings.NUTRITION_HEDGE_MIN_SAMPLES:
+            return settings.NUTRITION_HEDGE_INITIAL_DELAY_MS / 1000
+        delay_ms = usda_latency.percentile(settings.NUTRITION_HEDGE_PERCENTILE)
+        return max(delay_ms, settings.NUTRITION_HEDGE_MIN_DELAY_MS) / 1000
+    
+    @staticmethod
+    async def _timed(tracker: LatencyTracker, search) -> Optional[Dict]:
+        """
+        Medir una consulta upstream. Los errores no cuentan (vuelven rápido); una
+        cancelada (perdió la cobertura) cuenta lo que llevaba como cota inferior,
+        porque descartar justo las lentas sesgaría el percentil hacia abajo
+        """
+        start = time.perf_counter()
+        try:
+            data = await search
+        except asyncio.CancelledError:
+            tracker.record((time.perf_counter() - start) * 1000)
+            raise
+        tracker.record((time.perf_counter() - start) * 1000)
+        return data
+    
+    async def _wait_for_peer(self, cache_key: str, lock_key: str) -> Optional[Dict]:
+        """Esperar el resultado de otro worker mientras mantenga el lock"""
+        redis_client = await get_redis_binary()
+        deadline = time.monotonic() + settings.NUTRITION_LOCK_TTL_MS / 1000
+        while time.monotonic() < deadline:
+            await asyncio.sleep(settings.NUTRITION_LOCK_POLL_MS / 1000)
+            try:
+                async with redis_client.pipeline(transaction=False) as pipe:
+                    pipe.get(cache_key)
+                    pipe.exists(lock_key)
+                    cached_data, locked = await pipe.execute()
+            except Exception:
+                return None
+            if cached_data:
+                return await self._decode_cached(cache_key, cached_data)
+            if not locked:
+                return None  # terminó sin resultado o el worker murió
+        return None
+    
+    async def _cache_get(self, cache_key: str) -> Optional[Dict]:
+        """Leer de L1, catálogo local, Redis y el L2 en disco (rellenando L1)"""
+        data = await self._local_get(cache_key)
+        if data is not None:
+            return data
         
-        # 3. Fallback a Nutritionix
-        nutritionix_data = await self._search_nutritionix(food_name, portion_grams)
-        if nutritionix_data:
-            return nutritionix_data
+        if settings.NUTRITION_REDIS_ENABLED:
+            redis_client = await get_redis_binary()
+            start = time.perf_counter()
+            try:
+                cached_data = await redis_client.get(cache_key)
+            except Exception as e:
+                # Redis caído: el disco evita una avalancha de consultas upstream
+                redis_stats["errors"] += 1
+                print(f"⚠️ Error accediendo cache: {e}")
+            else:
+                redis_latency.record((time.perf_counter() - start) * 1000)
+                data = await self._decode_cached(cache_key, cached_data)
+                if data is not None:
+                    return data
         
-        # 4. Fallback final: datos estimados
-        return self._get_estimated_nutrition(food_name, portion_grams)
+        return (await self._disk_get_many([cache_key])).get(cache_key)
+    
+    async def _local_get(self, cache_key: str) -> Optional[Dict]:
+        """L1 y catálogo FDC local: sin red ni cuota"""
+        data = l1_cache.get(cache_key)
+        if data is not None:
+            return data
+        
+        data = await self._catalog_get(cache_key)
+        if data is not None:
+            l1_cache.set(cache_key, data)
+        return data
+    
+    async def _redis_get_many(self, cache_keys: List[str]) -> Dict[str, Dict]:
+        """Leer varias claves de Redis con un solo MGET"""
+        if not settings.NUTRITION_REDIS_ENABLED:
+            return {}
+        redis_client = await get_redis_binary()
+        start = time.perf_counter()
+        try:
+            values = await redis_client.mget(cache_keys)
+        except Exception as e:
+            redis_stats["errors"] += 1
+            print(f"⚠️ Error accediendo cache: {e}")
+            return {}
+        redis_latency.record((time.perf_counter() - start) * 1000)
+        batch_stats["redis_commands"] += len(cache_keys)
+        batch_stats["redis_round_trips"] += 1
+        
+        found, legacy = {}, {}
+        for cache_key, cached_data in zip(cache_keys, values):
+            data = self._decode_entry(cache_key, cached_data, legacy)
+            if data is not None:
+                found[cache_key] = data
+        await self._migrate_legacy(legacy)
+        return found
+    
+    async def _disk_get_many(self, cache_keys: List[str]) -> Dict[str, Dict]:
+        """L2 en disco: una sola consulta para todas las claves"""
+        if not disk_cache.available:
+            return {}
+        found = {}
+        for cache_key, cached_data in (await asyncio.to_thread(disk_cache.get_many, cache_keys)).items():
+            data = self._decode_raw(cache_key, cached_data)[0]
+            if data is not None and data.get("schema") == nutrients.SCHEMA_VERSION:
+                l1_cache.set(cache_key, data)
+                found[cache_key] = data
+        return found
+    
+    async def _disk_set_many(self, entries: Dict[str, tuple]):
+        """Guardar {clave: (bytes, ttl)} en el L2 en disco"""
+        if disk_cache.available and entries:
+            await asyncio.to_thread(disk_cache.set_many, entries)
+    
+    async def _decode_cached(self, cache_key: str, cached_data: Optional[bytes]) -> Optional[Dict]:
+        """Decodificar una entrada de Redis, reescribiéndola si aún era JSON"""
+        legacy: Dict[str, Dict] = {}
+        data = self._decode_entry(cache_key, cached_data, legacy)
+        await self._migrate_legacy(legacy)
+        return data
+    
+    def _decode_entry(self, cache_key: str, cached_data: Optional[bytes], legacy: Dict[str, Dict]) -> Optional[Dict]:
+        """Entrada de Redis → datos (None si falta o tiene otro esquema)"""
+        if not cached_data:
+            redis_stats["misses"] += 1
+            return None
+        
+        data, is_json = self._decode_raw(cache_key, cached_data)
+        if data is None:
+            redis_stats["misses"] += 1
+            return None
+        if data.get("schema") != nutrients.SCHEMA_VERSION:
+            # Entrada con unidades anteriores (sodio en g): volver a consultar
+            redis_stats["misses"] += 1
+            redis_stats["stale_schema"] += 1
+            return None
+        
+        redis_stats["hits"] += 1
+        l1_cache.set(cache_key, data)
+        if is_json:
+            encoding_stats["legacy_read"] += 1
+            legacy[cache_key] = data
+        return data
+    
+    @staticmethod
+    def _decode_raw(cache_key: str, cached_data: bytes) -> Tuple[Optional[Dict], bool]:
+        """Decodificar; formatos desconocidos y entradas dañadas cuentan como miss (None)"""
+        try:
+            data, is_json = nutrition_codec.decode(cached_data)
+        except nutrition_codec.CorruptEntry as e:
+            # Valor truncado o dañado: se vuelve a consultar y la escritura lo reemplaza
+            encoding_stats["corrupt"] += 1
+            print(f"⚠️ {cache_key}: {e}")
+            return None, False
+        if data is None:
+            # Formato binario más nuevo (despliegue en curso): tratar como miss
+            encoding_stats["unknown_format"] += 1
+        return data, is_json
+    
+    async def _migrate_legacy(self, entries: Dict[str, Dict]):
+        """Reescribir entradas JSON en formato binario conservando su TTL"""
+        if not entries:
+            return
+        redis_client = await get_redis_binary()
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for cache_key, data in entries.items():
+                    pipe.set(cache_key, self._encode(data), xx=True, keepttl=True)
+                await pipe.execute()
+            encoding_stats["migrated"] += len(entries)
+        except Exception as e:
+            print(f"⚠️ Error migrando entradas JSON del cache: {e}")
+    
+    @staticmethod
+    def _encode(data: Dict) -> bytes:
+        """Codificar una entrada para Redis"""
+        encoded = nutrition_codec.encode(data)
+        encoding_stats["written"] += 1
+        encoding_stats["bytes_written"] += len(encoded)
+        return encoded
+    
+    async def _catalog_get(self, cache_key: str) -> Optional[Dict]:
+        """Buscar en el catálogo local con la consulta traducida al inglés"""
+        if not food_catalog.available:
+            return None
+        canonical = cache_key.split(":", 1)[1]
+        query, _ = await food_translator.translate(canonical)
+        # SQLite es síncrono: fuera del event loop, como el L2 en disco
+        return await asyncio.to_thread(food_catalog.lookup, query or canonical)
+    
+    async def _cache_set(self, cache_key: str, data: Dict):
+        """Escribir en L1, Redis y disco, avisando a los demás procesos para invalidar su L1"""
+        ttl = self._expiry(data)
+        encoded = self._encode(data)
+        l1_cache.set(cache_key, data, ttl)
+        await self._disk_set_many({cache_key: (encoded, ttl)})
+        if not settings.NUTRITION_REDIS_ENABLED:
+            return
+        redis_client = await get_redis_binary()
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.setex(cache_key, ttl, encoded)
+                pipe.publish(INVALIDATION_CHANNEL, f"{PROCESS_ID}|{cache_key}")
+                await pipe.execute()
+        except Exception as e:
+            print(f"⚠️ Error guardando en cache: {e}")
+    
+    async def _cache_set_many(self, entries: Dict[str, Dict], release: List[str], token: str):
+        """Escribir varias entradas y liberar sus locks en un solo pipeline"""
+        if not entries and not release:
+            return
+        encoded = {}
+        for cache_key, data in entries.items():
+            ttl = self._expiry(data)
+            encoded[cache_key] = (self._encode(data), ttl)
+            l1_cache.set(cache_key, data, ttl)
+        await self._disk_set_many(encoded)
+        if not settings.NUTRITION_REDIS_ENABLED:
+            return
+        redis_client = await get_redis_binary()
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for cache_key, (value, ttl) in encoded.items():
+                    pipe.setex(cache_key, ttl, value)
+                    pipe.publish(INVALIDATION_CHANNEL, f"{PROCESS_ID}|{cache_key}")
+                for cache_key in release:
+                    pipe.eval(RELEASE_LOCK_SCRIPT, 1, f"lock:{cache_key}", token)
+                await pipe.execute()
+            batch_stats["redis_commands"] += 2 * len(entries) + len(release)
+            batch_stats["redis_round_trips"] += 1
+        except Exception as e:
+            print(f"⚠️ Error guardando en cache: {e}")
     
     async def _search_usda(self, food_name: str) -> Optional[Dict]:
-        """Buscar alimento en USDA Food Data Central"""
+        """
+        Buscar alimento en USDA Food Data Central. None si respondió sin
+        resultados; UpstreamUnavailable si no respondió bien.
+        """
         try:
             url = f"{self.usda_base_url}/foods/search"
             params = {
@@ -62,24 +759,31 @@ class NutritionService:
                 "dataType": ["Foundation", "SR Legacy"]
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params, timeout=5) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        foods = data.get("foods", [])
-                        
-                        if foods:
-                            # Tomar el primer resultado más relevante
-                            food = foods[0]
-                            return self._parse_usda_food(food)
+            session = await http_sessions.get("usda")
+            async with session.get(url, params=params) as response:
+                if response.status != 200:
+                    raise UpstreamUnavailable(f"USDA respondió {response.status}")
+                data = await response.json()
+                foods = data.get("foods", [])
+                
+                if foods:
+                    # Tomar el primer resultado más relevante
+                    food = foods[0]
+                    return self._parse_usda_food(food)
             
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             print(f"❌ Error buscando en USDA: {e}")
+            raise UpstreamUnavailable(f"USDA no disponible: {e}") from e
         
         return None
     
-    async def _search_nutritionix(self, food_name: str, portion_grams: float) -> Optional[Dict]:
-        """Buscar alimento en Nutritionix API"""
+    async def _search_nutritionix(self, food_name: str) -> Optional[Dict]:
+        """
+        Buscar alimento en Nutritionix API. None si no lo reconoce (404 o
+        lista vacía); UpstreamUnavailable ante cualquier otro fallo.
+        """
         try:
             url = f"{self.nutritionix_base_url}/natural/nutrients"
             headers = {
@@ -88,28 +792,35 @@ class NutritionService:
                 "Content-Type": "application/json"
             }
             
-            # Convertir gramos a descripción natural
-            query = f"{portion_grams}g {food_name}"
+            # Consultar por 100 g para poder compartir el cache entre porciones
+            query = f"100g {food_name}"
             
             payload = {"query": query}
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=payload, timeout=8) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        foods = data.get("foods", [])
-                        
-                        if foods:
-                            return self._parse_nutritionix_food(foods[0])
+            session = await http_sessions.get("nutritionix")
+            async with session.post(url, headers=headers, json=payload) as response:
+                # Nutritionix responde 404 cuando no reconoce el alimento
+                if response.status == 404:
+                    return None
+                if response.status != 200:
+                    raise UpstreamUnavailable(f"Nutritionix respondió {response.status}")
+                data = await response.json()
+                foods = data.get("foods", [])
+                
+                if foods:
+                    return self._parse_nutritionix_food(foods[0])
             
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             print(f"❌ Error buscando en Nutritionix: {e}")
+            raise UpstreamUnavailable(f"Nutritionix no disponible: {e}") from e
         
         return None
     
     def _parse_usda_food(self, food_data: Dict) -> Dict:
         """Parsear datos de USDA a formato estándar"""
-        nutrients = {}
+        values = {}
         
         # Mapear nutrientes de USDA
         nutrient_map = {
@@ -126,55 +837,58 @@ class NutritionService:
             nutrient_name = nutrient.get("nutrientName", "")
             if nutrient_name in nutrient_map:
                 key = nutrient_map[nutrient_name]
-                value = nutrient.get("value", 0)
                 
-                # Convertir unidades si es necesario
-                if key == "calories":
-                    nutrients[key] = value
-                elif key == "sodium":
-                    nutrients[key] = value / 1000  # mg a g
-                else:
-                    nutrients[key] = value
+                # "Energy" también se reporta en kJ
+                if key == "calories" and nutrient.get("unitName", "KCAL").upper() != "KCAL":
+                    continue
+                # Mismas unidades que el esquema canónico (sodio en mg)
+                values[key] = nutrient.get("value", 0)
         
         return {
-            "nutrition_per_100g": nutrients,
+            "nutrition_per_100g": values,
             "source": "usda",
             "food_name": food_data.get("description", "")
         }
     
     def _parse_nutritionix_food(self, food_data: Dict) -> Dict:
-        """Parsear datos de Nutritionix a formato estándar"""
+        """Parsear datos de Nutritionix a formato estándar (por 100 g)"""
+        serving_grams = food_data.get("serving_weight_grams") or 100
+        factor = 100.0 / serving_grams
+        
+        per_serving = nutrients.to_vector({
+            "calories": food_data.get("nf_calories"),
+            "protein": food_data.get("nf_protein"),
+            "carbs": food_data.get("nf_total_carbohydrate"),
+            "fat": food_data.get("nf_total_fat"),
+            "fiber": food_data.get("nf_dietary_fiber"),
+            "sugar": food_data.get("nf_sugars"),
+            "sodium": food_data.get("nf_sodium")  # mg
+        })
+        
         return {
-            "nutrition": {
-                "calories": food_data.get("nf_calories", 0),
-                "protein": food_data.get("nf_protein", 0),
-                "carbs": food_data.get("nf_total_carbohydrate", 0),
-                "fat": food_data.get("nf_total_fat", 0),
-                "fiber": food_data.get("nf_dietary_fiber", 0),
-                "sugar": food_data.get("nf_sugars", 0),
-                "sodium": food_data.get("nf_sodium", 0) / 1000  # mg a g
-            },
+            "nutrition_per_100g": nutrients.to_dict(per_serving * factor, decimals=4),
             "source": "nutritionix",
             "food_name": food_data.get("food_name", "")
         }
     
     def _calculate_portion_nutrition(self, base_data: Dict, portion_grams: float) -> Dict:
         """Calcular nutrición para porción específica"""
-        base_nutrition = base_data.get("nutrition_per_100g", {})
-        factor = portion_grams / 100.0
-        
-        calculated_nutrition = {}
-        for key, value in base_nutrition.items():
-            calculated_nutrition[key] = round(value * factor, 2)
+        per_100g = nutrients.to_vector(base_data.get("nutrition_per_100g"))
         
         return {
-            "nutrition": calculated_nutrition,
+            "nutrition": nutrients.to_dict(nutrients.scale_portions(per_100g, portion_grams)),
             "source": base_data.get("source", "calculated"),
             "food_name": base_data.get("food_name", "")
         }
     
     def _get_estimated_nutrition(self, food_name: str, portion_grams: float) -> Dict:
         """Datos nutricionales estimados como último recurso"""
+        return self._calculate_portion_nutrition(
+            self._estimate_base_nutrition(food_name), portion_grams
+        )
+    
+    def _estimate_base_nutrition(self, food_name: str) -> Dict:
+        """Estimación por 100 g según una categoría básica"""
         # Estimaciones muy básicas por categoría
         estimates_per_100g = {
             "fruta": {"calories": 50, "protein": 1, "carbs": 12, "fat": 0.2},
@@ -197,15 +911,91 @@ class NutritionService:
         elif any(word in food_lower for word in ["pan", "bread"]):
             category = "pan"
         
-        base_nutrition = estimates_per_100g[category]
-        factor = portion_grams / 100.0
-        
-        calculated_nutrition = {}
-        for key, value in base_nutrition.items():
-            calculated_nutrition[key] = round(value * factor, 2)
-        
         return {
-            "nutrition": calculated_nutrition,
+            "nutrition_per_100g": estimates_per_100g[category],
             "source": "estimated",
             "food_name": food_name
-        }
\ No newline at end of file
+        }
+
+async def run_invalidation_listener():
+    """
+    Escuchar invalidaciones publicadas por otros procesos y borrar su L1.
+    Se ejecuta como tarea en segundo plano durante la vida del proceso.
+    """
+    if not settings.NUTRITION_REDIS_ENABLED:
+        return
+    redis_client = await get_redis()
+    degraded = False
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            if degraded:
+                print("✅ Canal de invalidación restablecido")
+                l1_cache.ttl = settings.NUTRITION_L1_TTL
+                degraded = False
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                origin, _, cache_key = message["data"].partition("|")
+                if origin != PROCESS_ID:
+                    l1_cache.delete(cache_key)
+        except asyncio.CancelledError:
+            await pubsub.close()
+            raise
+        except Exception as e:
+            if not degraded:
+                # Sin canal de invalidación el L1 podría servir datos viejos:
+                # vaciarlo una vez y acortar su TTL hasta reconectar
+                print(f"⚠️ Canal de invalidación caído, vaciando L1: {e}")
+                l1_cache.clear()
+                l1_cache.ttl = settings.NUTRITION_L1_DEGRADED_TTL
+                degraded = True
+            await pubsub.close()
+            await asyncio.sleep(5)
+
+def get_upstream_stats() -> Dict:
+    """Latencias de USDA / Nutritionix y efecto del hedging"""
+    lookups = hedge_stats["lookups"]
+    return {
+        "usda": usda_latency.get_stats(),
+        "nutritionix": nutritionix_latency.get_stats(),
+        "lookup": upstream_latency.get_stats(),
+        "hedging": {
+            **hedge_stats,
+            "saved_ms": round(hedge_stats["saved_ms"], 1),
+            "enabled": settings.NUTRITION_HEDGE_ENABLED,
+            "threshold_ms": round(NutritionService._hedge_delay() * 1000, 1),
+            "hedge_rate": round(hedge_stats["hedged"] / lookups, 3) if lookups else 0.0
+        }
+    }
+
+def get_cache_stats() -> Dict:
+    """Métricas por nivel de cache"""
+    l1 = l1_cache.get_stats()
+    redis_lookups = redis_stats["hits"] + redis_stats["misses"]
+    redis_avg_ms = redis_latency.get_stats()["avg_ms"]
+    return {
+        "l1": l1,
+        "redis": {
+            **redis_stats,
+            "hit_ratio": round(redis_stats["hits"] / redis_lookups, 3) if redis_lookups else 0.0,
+            "latency": redis_latency.get_stats()
+        },
+        "single_flight": {**upstream_flight.get_stats(), "redis_lock": lock_stats},
+        "disk": disk_cache.get_stats(),
+        "negative": negative_stats,
+        "stale_while_revalidate": {**refresh_stats, "in_flight": len(refresh_tasks)},
+        "encoding": {
+            **encoding_stats,
+            "avg_bytes": round(encoding_stats["bytes_written"] / encoding_stats["written"], 1)
+            if encoding_stats["written"] else 0.0
+        },
+        "batch": {
+            **batch_stats,
+            "redis_round_trips_saved": batch_stats["redis_commands"] - batch_stats["redis_round_trips"]
+        },
+        # Cada acierto en L1 es un GET a Redis evitado
+        "redis_calls_saved": l1["hits"],
+        "redis_time_saved_ms": round(l1["hits"] * redis_avg_ms, 1)
+    }
@@ -0,0 +1,335 @@
+"""
+Índice de búsqueda tolerante a errores tipográficos
+
+Índice invertido de n-gramas sobre el vocabulario de tokens y listas de
+alimentos por token (arrays ordenados de numpy). Una consulta corrige cada
+token por distancia de edición contra el vocabulario, intersecta las listas
+y ordena por distancia total y luego por usage_count.
+"""
+
+import asyncio
+import re
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from services.food_names import ALIASES, S_SINGULARS, STOP_WORDS, fold_accents, singularize
+from services.food_translation import WORDS
+
+NGRAM = 3
+MAX_EXPANSIONS = 64  # tokens del vocabulario considerados por token de la consulta
+_NON_WORD = re.compile(r"[^a-z0-9ñ]+")
+
+
+def _stem(token: str) -> str:
+    """Raíz para comparar singular/plural en español e inglés (apples/apple → appl)"""
+    if len(token) <= 3:
+        return token
+    if token.endswith("ies"):
+        token = token[:-3] + "i"
+    elif token.endswith("s") and token not in S_SINGULARS:
+        token = token[:-1]
+    if token.endswith("y"):
+        token = token[:-1] + "i"
+    if token.endswith("e") and len(token) > 3:
+        token = token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokens normalizados: sin acentos, sin stop-words, sinónimos resueltos y en raíz"""
+    tokens = []
+    for token in _NON_WORD.split(fold_accents(text.lower())):
+        if token and token not in STOP_WORDS:
+            token = singularize(token)
+            tokens.append(_stem(ALIASES.get(token, token)))
+    return tokens
+
+
+def _ngrams(token: str) -> set:
+    padded = f"${token}$"
+    return {padded[i:i + NGRAM] for i in range(len(padded) - NGRAM + 1)}
+
+
+def max_typos(token: str) -> int:
+    """Errores tolerados según la longitud del token"""
+    if len(token) <= 3:
+        return 0
+    return 1 if len(token) <= 5 else 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Distancia de Levenshtein acotada (devuelve limit + 1 si la supera)"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class _IndexData:
+    """Estructuras de una versión del índice (se reemplazan juntas)"""
+
+    def __init__(self):
+        self.item_ids: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.usage = np.zeros(0, dtype=np.int64)
+        self.name_lengths = np.zeros(0, dtype=np.int32)
+        self.categories = np.zeros(0, dtype=np.int32)
+        self.sources = np.zeros(0, dtype=np.int32)
+        self.category_names: List[str] = []
+        self.source_names: List[str] = []
+        self.postings: Dict[str, np.ndarray] = {}
+        self.gram_index: Dict[str, np.ndarray] = {}
+        self.sorted_vocab: List[str] = []
+        self.vocab_lengths = np.zeros(0, dtype=np.int32)
+        self.vocab_sizes = np.zeros(0, dtype=np.int32)
+
+
+class FoodSearchIndex:
+    """Índice en memoria, de solo lectura entre reconstrucciones"""
+
+    def __init__(self):
+        self.data = _IndexData()
+        self.source_version = None
+        self._build_lock = asyncio.Lock()
+        self._rebuild_task: Optional[asyncio.Task] = None
+        self.stats = {"builds": 0, "build_ms": 0.0, "queries": 0, "query_ms_total": 0.0, "corrected_tokens": 0}
+
+    @property
+    def size(self) -> int:
+        return len(self.data.item_ids)
+
+    def build(self, entries: Iterable[Tuple[str, str, Optional[str], str, int]]):
+        """
+        Construir el índice a partir de (item_id, nombre, categoría, fuente, usage_count).
+        La versión nueva reemplaza a la anterior de forma atómica.
+        """
+        start = time.perf_counter()
+        item_ids, usage, name_lengths, categories, sources = [], [], [], [], []
+        category_codes: Dict[Optional[str], int] = {}
+        source_codes: Dict[str, int] = {}
+        raw_postings = defaultdict(list)
+
+        for position, (item_id, name, category, source, usage_count) in enumerate(entries):
+            item_ids.append(item_id)
+            usage.append(usage_count)
+            name_lengths.append(len(name))
+            categories.append(category_codes.setdefault((category or "").lower(), len(category_codes)))
+            sources.append(source_codes.setdefault(source, len(source_codes)))
+            for token in set(tokenize(name)):
+                raw_postings[token].append(position)
+
+        postings = {token: np.array(ids, dtype=np.int32) for token, ids in raw_postings.items()}
+
+        # Vocabulario en español → postings de su traducción (el catálogo USDA está en inglés)
+        for spanish, english in WORDS.items():
+            spanish = tokenize(spanish)
+            translated = [postings.get(token) for token in tokenize(english)]
+            if len(spanish) != 1 or not translated or any(p is None for p in translated):
+                continue
+            merged = translated[0]
+            for posting in translated[1:]:
+                merged = np.intersect1d(merged, posting, assume_unique=True)
+            if spanish[0] in postings:
+                merged = np.union1d(merged, postings[spanish[0]])
+            postings[spanish[0]] = merged
+
+        sorted_vocab = sorted(postings)
+        gram_index = defaultdict(list)
+        for position, token in enumerate(sorted_vocab):
+            for gram in _ngrams(token):
+                gram_index[gram].append(position)
+
+        data = _IndexData()
+        data.item_ids = item_ids
+        data.positions = {item_id: i for i, item_id in enumerate(item_ids)}
+        data.usage = np.array(usage, dtype=np.int64)
+        data.name_lengths = np.array(name_lengths, dtype=np.int32)
+        data.categories = np.array(categories, dtype=np.int32)
+        data.sources = np.array(sources, dtype=np.int32)
+        data.category_names = list(category_codes)
+        data.source_names = list(source_codes)
+        data.postings = postings
+        data.gram_index = {gram: np.array(ids, dtype=np.int32) for gram, ids in gram_index.items()}
+        data.sorted_vocab = sorted_vocab
+        data.vocab_lengths = np.array([len(token) for token in sorted_vocab], dtype=np.int32)
+        data.vocab_sizes = np.array([len(postings[token]) for token in sorted_vocab], dtype=np.int32)
+        # Las consultas en curso terminan con la versión anterior
+        self.data = data
+
+        self.stats["builds"] += 1
+        self.stats["build_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    async def ensure_built(self, loader, version=None):
+        """
+        Construir en un hilo la primera vez. Si cambia la versión de la fuente
+        se sigue sirviendo el índice actual mientras se reconstruye en segundo plano.
+        """
+        if self.size and version == self.source_version:
+            return
+        if not self.size:
+            await self._rebuild(loader, version)
+        elif self._rebuild_task is None or self._rebuild_task.done():
+            self._rebuild_task = asyncio.create_task(self._rebuild(loader, version))
+
+    async def _rebuild(self, loader, version):
+        async with self._build_lock:
+            if self.size and version == self.source_version:
+                return
+            await asyncio.to_thread(lambda: self.build(loader()))
+            self.source_version = version
+
+    def set_usage(self, item_id: str, usage_count: int):
+        """Actualizar la popularidad de un alimento sin reconstruir"""
+        data = self.data
+        position = data.positions.get(item_id)
+        if position is not None:
+            data.usage[position] = usage_count
+
+    @staticmethod
+    def _match_token(data: _IndexData, token: str, prefix: bool) -> List[Tuple[int, str]]:
+        """Tokens del vocabulario a distancia tolerable (y prefijos para el último token)"""
+        if token in data.postings and not prefix:
+            return [(0, token)]
+
+        vocab = data.sorted_vocab
+        matches = {}
+        if token in data.postings:
+            matches[token] = 0
+        elif max_typos(token):
+            limit = max_typos(token)
+            grams = [data.gram_index[gram] for gram in _ngrams(token) if gram in data.gram_index]
+            if grams:
+                # Con k errores se pierden como mucho k * NGRAM n-gramas
+                needed = max(1, len(_ngrams(token)) - limit * NGRAM)
+                counts = np.bincount(np.concatenate(grams), minlength=len(vocab))
+                candidates = np.nonzero(
+                    (counts >= needed) & (np.abs(data.vocab_lengths - len(token)) <= limit)
+                )[0]
+                if len(candidates) > MAX_EXPANSIONS:
+                    candidates = candidates[np.argsort(-counts[candidates], kind="stable")[:MAX_EXPANSIONS]]
+                for position in candidates:
+                    distance = edit_distance(token, vocab[position], limit)
+                    if distance <= limit:
+                        matches[vocab[position]] = distance
+        if prefix and len(token) >= 2:
+            # Búsqueda mientras se escribe: "manz" → "manzana" (los más frecuentes)
+            first = bisect_left(vocab, token)
+            last = bisect_left(vocab, token + "\uffff")
+            positions = np.arange(first, last)
+            if len(positions) > MAX_EXPANSIONS:
+                positions = positions[np.argsort(-data.vocab_sizes[first:last], kind="stable")[:MAX_EXPANSIONS]]
+            for position in positions:
+                matches.setdefault(vocab[position], 0)
+        return [(distance, candidate) for candidate, distance in matches.items()]
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        category: Optional[str] = None,
+        source: Optional[str] = None
+    ) -> List[Tuple[str, int]]:
+        """Devuelve [(item_id, usage_count)] ordenados por relevancia y popularidad"""
+        return self.search_with_total(query, limit, category, source)[0]
+
+    def search_with_total(
+        self,
+        query: str,
+        limit: int = 10,
+        category: Optional[str] = None,
+        source: Optional[str] = None
+    ) -> Tuple[List[Tuple[str, int]], int]:
+        """Como search, más el total de coincidencias antes de aplicar limit"""
+        start = time.perf_counter()
+        data = self.data
+        tokens = tokenize(query)
+        if not tokens or not data.item_ids:
+            return [], 0
+
+        candidates = None
+        token_matches = []
+        for i, token in enumerate(tokens):
+            matches = self._match_token(data, token, prefix=(i == len(tokens) - 1))
+            if not matches:
+                return self._finish(start, [])
+            if any(candidate != token for _, candidate in matches):
+                self.stats["corrected_tokens"] += 1
+            matches.sort()
+            token_matches.append(matches)
+            if len(matches) == 1:
+                items = data.postings[matches[0][1]]
+            else:
+                items = np.unique(np.concatenate([data.postings[c] for _, c in matches]))
+            candidates = items if candidates is None else np.intersect1d(candidates, items, assume_unique=True)
+            if not len(candidates):
+                return self._finish(start, [])
+
+        # Filtros dentro del índice
+        if category:
+            wanted = [code for code, name in enumerate(data.category_names) if category.lower() in name]
+            candidates = candidates[np.isin(data.categories[candidates], wanted)]
+        if source and source != "all":
+            if source not in data.source_names:
+                return self._finish(start, [])
+            candidates = candidates[data.sources[candidates] == data.source_names.index(source)]
+        if not len(candidates):
+            return self._finish(start, [])
+
+        # Distancia total: la mejor coincidencia de cada token de la consulta
+        score = np.zeros(len(candidates), dtype=np.int32)
+        for matches in token_matches:
+            if matches[0][0] == matches[-1][0]:
+                score += matches[0][0]
+                continue
+            best = np.full(len(candidates), max(d for d, _ in matches), dtype=np.int32)
+            for distance, candidate in reversed(matches):
+                best[np.isin(candidates, data.postings[candidate], assume_unique=True)] = distance
+            score += best
+
+        # Clave única (distancia, -usage_count, longitud del nombre) y selección parcial O(n)
+        usage = data.usage[candidates]
+        lengths = data.name_lengths[candidates].astype(np.int64)
+        top_usage = int(usage.max())
+        key = (score.astype(np.int64) * (top_usage + 1) + (top_usage - usage)) * (int(lengths.max()) + 1) + lengths
+        if len(key) > limit:
+            order = np.argpartition(key, limit - 1)[:limit]
+            order = order[np.argsort(key[order], kind="stable")]
+        else:
+            order = np.argsort(key, kind="stable")
+        results = [(data.item_ids[i], int(data.usage[i])) for i in candidates[order]]
+        return self._finish(start, results, len(candidates))
+
+    def _finish(self, start: float, results: List, total: int = 0) -> Tuple[List, int]:
+        self.stats["queries"] += 1
+        self.stats["query_ms_total"] += (time.perf_counter() - start) * 1000
+        return results, total
+
+    def get_stats(self) -> Dict:
+        """Métricas del índice"""
+        queries = self.stats["queries"]
+        return {
+            "items": self.size,
+            "vocabulary": len(self.data.postings),
+            "builds": self.stats["builds"],
+            "build_ms": self.stats["build_ms"],
+            "queries": queries,
+            "avg_query_ms": round(self.stats["query_ms_total"] / queries, 3) if queries else 0.0,
+            "corrected_tokens": self.stats["corrected_tokens"]
+        }
+
+
+# Instancia global del índice de búsqueda
+food_search_index = FoodSearchIndex()
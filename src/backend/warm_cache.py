@@ -0,0 +1,41 @@
+"""
+Precalentamiento del cache de nutrición desde la línea de comandos
+
+Útil tras un flush de Redis o antes de abrir el tráfico a un despliegue
+nuevo, sin esperar al lifespan de la API.
+
+    python warm_cache.py --top 1000 --rate 2
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+# Agregar el directorio actual al path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import settings
+from services.cache_warmer import CacheWarmer
+from services.http_sessions import http_sessions
+
+
+async def main(top_n: int, batch_size: int, upstream_rate: float):
+    """Precargar los top-N alimentos en Redis"""
+    warmer = CacheWarmer(top_n, batch_size, upstream_rate, ready_fraction=1.0)
+    try:
+        await warmer.run()
+    finally:
+        await http_sessions.close()
+    print(f"📊 {warmer.get_stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precalentar el cache de nutrición")
+    parser.add_argument("--top", type=int, default=settings.CACHE_WARMUP_TOP_N, help="Alimentos a precargar")
+    parser.add_argument("--batch", type=int, default=settings.CACHE_WARMUP_BATCH, help="Alimentos por lote")
+    parser.add_argument("--rate", type=float, default=settings.CACHE_WARMUP_UPSTREAM_RATE,
+                        help="Consultas upstream por segundo (0 = sin límite)")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.top, args.batch, args.rate))
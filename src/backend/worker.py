@@ -0,0 +1,53 @@
+"""
+Worker de análisis de imágenes (modo cola Redis)
+
+Consume trabajos publicados por POST /api/v1/analyze/image cuando
+ANALYSIS_QUEUE_BACKEND=redis. Se pueden ejecutar varias instancias.
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import sys
+
+# Agregar el directorio actual al path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from routers.images import process_image_analysis
+from services.job_stream import AnalysisStreamWorker
+from services.ml_service import close_openai_client
+from services.http_sessions import http_sessions
+from services.nutrition_service import run_invalidation_listener
+
+
+async def main(consumer_name: str = None, concurrency: int = None):
+    """Ejecutar worker hasta recibir SIGINT/SIGTERM"""
+    worker = AnalysisStreamWorker(
+        process_image_analysis,
+        consumer_name=consumer_name,
+        concurrency=concurrency
+    )
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    invalidation_task = asyncio.create_task(run_invalidation_listener())
+    try:
+        await worker.run()
+    finally:
+        invalidation_task.cancel()
+        await worker.queue.close()
+        await close_openai_client()
+        await http_sessions.close()
+        print("🔄 Worker detenido")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Worker de análisis de imágenes")
+    parser.add_argument("--name", help="Nombre del consumidor (por defecto host-pid)")
+    parser.add_argument("--concurrency", type=int, help="Trabajos simultáneos")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.name, args.concurrency))
@@ -177,6 +177,74 @@ class TestMLService:
         assert len(result) == 1
         assert result[0]["name"] == "manzana"
         assert result[0]["portion_grams"] == 150
+    
+    @pytest.mark.asyncio
+    async def test_analysis_errors_reach_the_queue(self):
+        """Probar que con raise_errors el fallo se propague en lugar del fallback"""
+        from config import settings
+        from services.ml_service import MLService
+        
+        ml_service = MLService()
+        ml_service.client = AsyncMock()
+        ml_service.client.chat.completions.create.side_effect = RuntimeError("502 Bad Gateway")
+        
+        with patch.object(settings, "IMAGE_PREPROCESS_ENABLED", False), \
+                patch.object(settings, "IMAGE_CACHE_ENABLED", False):
+            fallback = await ml_service.analyze_food_image(b"fake_image_data")
+            with pytest.raises(RuntimeError):
+                await ml_service.analyze_food_image(b"fake_image_data", raise_errors=True)
+        
+        assert fallback == ml_service._get_fallback_response()
+
+@pytest.fixture
+def nutrition_cache(tmp_path):
+    """Redis simulado (comandos y pipeline) y L2 en disco aislado para NutritionService"""
+    from types import SimpleNamespace
+    from unittest.mock import MagicMock
+    from services import nutrition_service as service_module
+    from services.disk_cache import DiskCache
+    
+    redis_client = MagicMock()
+    redis_client.get = AsyncMock(return_value=None)
+    redis_client.mget = AsyncMock(side_effect=lambda keys: [None] * len(keys))
+    redis_client.set = AsyncMock(return_value=True)
+    redis_client.eval = AsyncMock(return_value=1)
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(return_value=[])
+    redis_client.pipeline.return_value.__aenter__.return_value = pipe
+    disk = DiskCache(str(tmp_path / "l2.db"), 1024 * 1024)
+    
+    service_module.l1_cache.clear()
+    with patch.object(service_module, "get_redis_binary", AsyncMock(return_value=redis_client)), \
+            patch.object(service_module, "disk_cache", disk):
+        yield SimpleNamespace(redis=redis_client, pipe=pipe, disk=disk)
+    service_module.l1_cache.clear()
+
+@pytest.fixture
+def upstream_fetch():
+    """Sustituye la consulta a USDA / Nutritionix; cada prueba fija el resultado"""
+    from services.nutrition_service import NutritionService
+    
+    fetch = AsyncMock()
+    with patch.object(NutritionService, "_fetch_upstream", fetch):
+        yield fetch
+
+@pytest.fixture
+def lock_redis(tmp_path):
+    """fakeredis para los locks entre workers de NutritionService, con sondeo rápido"""
+    from types import SimpleNamespace
+    from config import settings
+    from services import nutrition_service as service_module
+    from services.disk_cache import DiskCache
+    
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeAsyncRedis()
+    service_module.l1_cache.clear()
+    with patch.object(service_module, "get_redis_binary", AsyncMock(return_value=client)), \
+            patch.object(service_module, "disk_cache", DiskCache(str(tmp_path / "l2.db"), 1024 * 1024)), \
+            patch.object(settings, "NUTRITION_LOCK_POLL_MS", 10):
+        yield SimpleNamespace(client=client, stats=service_module.lock_stats)
+    service_module.l1_cache.clear()
 
 class TestNutritionService:
     """Pruebas del servicio de nutrición"""
@@ -208,6 +276,1674 @@ class TestNutritionService:
         
         assert result is not None
         assert "nutrition_per_100g" in result
+    
+    def test_parse_nutritionix_per_100g(self):
+        """Probar normalización de Nutritionix a valores por 100 g"""
+        from services.nutrition_service import NutritionService
+        
+        nutrition_service = NutritionService()
+        result = nutrition_service._parse_nutritionix_food({
+            "food_name": "tamale",
+            "serving_weight_grams": 200,
+            "nf_calories": 400,
+            "nf_protein": 14,
+            "nf_sodium": 800
+        })
+        
+        assert result["source"] == "nutritionix"
+        assert result["nutrition_per_100g"]["calories"] == 200
+        assert result["nutrition_per_100g"]["protein"] == 7
+        assert result["nutrition_per_100g"]["sodium"] == 400  # mg
+    
+    @pytest.mark.asyncio
+    async def test_upstream_outage_is_not_negative_cached(self, nutrition_cache):
+        """Probar que un 503 de USDA no se guarda como alimento inexistente"""
+        from unittest.mock import MagicMock
+        from services import nutrition_service as service_module
+        from services.nutrition_service import NutritionService
+        
+        def upstream(status, payload):
+            response = MagicMock()
+            response.status = status
+            response.json = AsyncMock(return_value=payload)
+            session = MagicMock()
+            session.get.return_value.__aenter__.return_value = response
+            session.post.return_value.__aenter__.return_value = response
+            return session
+        
+        sessions = MagicMock()
+        sessions.get = AsyncMock()
+        service = NutritionService()
+        with patch.object(service_module, "http_sessions", sessions), \
+                patch.object(service_module.food_translator, "translate", AsyncMock(return_value=(None, "none"))):
+            # USDA caído y Nutritionix sin coincidencias: estimación sin cache
+            sessions.get.side_effect = lambda name: upstream(503 if name == "usda" else 404, {})
+            outage = await service.get_base_nutrition("pozole")
+            assert nutrition_cache.disk.get_many(["nutrition:pozole"]) == {}
+            assert service_module.l1_cache.get("nutrition:pozole") is None
+            nutrition_cache.pipe.setex.assert_not_called()
+            
+            # Ambos respondieron sin coincidencias: entrada negativa
+            sessions.get.side_effect = lambda name: upstream(200 if name == "usda" else 404, {"foods": []})
+            unknown = await service.get_base_nutrition("pozole")
+        
+        assert outage["source"] == "estimated"
+        assert unknown["source"] == "estimated"
+        assert service_module.l1_cache.get("nutrition:pozole")["not_found"]
+        assert "nutrition:pozole" in nutrition_cache.disk.get_many(["nutrition:pozole"])
+    
+    @pytest.mark.asyncio
+    async def test_batch_lookup_single_mget(self, nutrition_cache, upstream_fetch):
+        """Probar que el lote usa un MGET y una escritura en pipeline, en orden"""
+        from services.nutrition_service import NutritionService
+        from services import nutrition_codec
+        
+        cached = {"nutrition_per_100g": {"calories": 52}, "source": "usda", "food_name": "apple", "schema": 2}
+        nutrition_cache.redis.mget = AsyncMock(return_value=[nutrition_codec.encode(cached), None])
+        nutrition_cache.pipe.execute = AsyncMock(return_value=[True])
+        upstream_fetch.return_value = {
+            "nutrition_per_100g": {"calories": 89}, "source": "usda", "food_name": "banana", "schema": 2
+        }
+        
+        results = await NutritionService().get_base_nutrition_many(["apple", "banana", "apple"])
+        
+        assert [data["nutrition_per_100g"]["calories"] for data in results] == [52, 89, 52]
+        nutrition_cache.redis.mget.assert_awaited_once_with(["nutrition:apple", "nutrition:platano"])
+        assert nutrition_cache.pipe.execute.await_count == 2  # locks y escritura final
+        nutrition_cache.pipe.setex.assert_called_once()
+    
+    @pytest.mark.asyncio
+    async def test_lock_acquired_fetches_and_publishes(self, lock_redis, upstream_fetch):
+        """Probar que con el lock libre este worker consulte upstream y publique en Redis"""
+        from services import nutrition_codec
+        from services.nutrition_service import NutritionService
+        
+        locked = []
+        
+        async def fetch(food_name, cache_key):
+            locked.append(await lock_redis.client.get(f"lock:{cache_key}"))
+            return {"nutrition_per_100g": {"calories": 150}, "source": "usda", "food_name": "pozole", "schema": 2}
+        
+        upstream_fetch.side_effect = fetch
+        before = dict(lock_redis.stats)
+        
+        data = await NutritionService().get_base_nutrition("pozole")
+        
+        assert data["nutrition_per_100g"]["calories"] == 150
+        assert locked[0] is not None  # la consulta corrió con el lock tomado
+        published, _ = nutrition_codec.decode(await lock_redis.client.get("nutrition:pozole"))
+        assert published["nutrition_per_100g"]["calories"] == 150
+        assert lock_redis.stats["acquired"] - before["acquired"] == 1
+        assert lock_redis.stats["waited"] == before["waited"]
+    
+    @pytest.mark.asyncio
+    async def test_lock_held_by_peer_serves_its_result(self, lock_redis, upstream_fetch):
+        """Probar que con el lock de otro worker se espere y se use lo que publique"""
+        from services import nutrition_codec
+        from services.nutrition_service import NutritionService
+        
+        await lock_redis.client.set("lock:nutrition:pozole", "peer", px=5000)
+        
+        async def peer():
+            await asyncio.sleep(0.05)
+            encoded = nutrition_codec.encode(
+                {"nutrition_per_100g": {"calories": 120}, "source": "usda", "food_name": "pozole", "schema": 2}
+            )
+            await lock_redis.client.setex("nutrition:pozole", 60, encoded)
+            await lock_redis.client.delete("lock:nutrition:pozole")
+        
+        before = dict(lock_redis.stats)
+        publisher = asyncio.create_task(peer())
+        data = await NutritionService().get_base_nutrition("pozole")
+        await publisher
+        
+        assert data["nutrition_per_100g"]["calories"] == 120
+        upstream_fetch.assert_not_awaited()
+        assert lock_redis.stats["waited"] - before["waited"] == 1
+        assert lock_redis.stats["served_by_peer"] - before["served_by_peer"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_peer_timeout_falls_back_to_upstream(self, lock_redis, upstream_fetch):
+        """Probar que si el otro worker no publica a tiempo se consulte upstream directamente"""
+        from config import settings
+        from services.nutrition_service import NutritionService
+        
+        await lock_redis.client.set("lock:nutrition:pozole", "peer", px=5000)
+        upstream_fetch.return_value = {
+            "nutrition_per_100g": {"calories": 150}, "source": "usda", "food_name": "pozole", "schema": 2
+        }
+        before = dict(lock_redis.stats)
+        
+        with patch.object(settings, "NUTRITION_LOCK_TTL_MS", 60):
+            data = await NutritionService().get_base_nutrition("pozole")
+        
+        assert data["nutrition_per_100g"]["calories"] == 150
+        upstream_fetch.assert_awaited_once()
+        assert lock_redis.stats["fallbacks"] - before["fallbacks"] == 1
+        assert lock_redis.stats["served_by_peer"] == before["served_by_peer"]
+        assert await lock_redis.client.get("lock:nutrition:pozole") == b"peer"  # el lock ajeno no se toca
+    
+    @pytest.mark.asyncio
+    async def test_enrich_foods_item_timeout(self, nutrition_cache, upstream_fetch):
+        """Probar que un alimento lento caiga a estimación sin frenar a los demás"""
+        from config import settings
+        from routers.images import enrich_foods
+        from services.nutrition_service import NutritionService
+        
+        async def fetch(food_name, cache_key):
+            if food_name == "kiwi":
+                await asyncio.sleep(0.3)
+            return {"nutrition_per_100g": {"calories": 100}, "source": "usda", "food_name": food_name, "schema": 2}
+        
+        upstream_fetch.side_effect = fetch
+        nutrition_cache.pipe.execute = AsyncMock(return_value=[True, True, True])
+        foods = [
+            {"name": "pan", "portion_grams": 50},
+            {"name": "kiwi", "portion_grams": 100},
+            {"name": "arroz", "portion_grams": 200}
+        ]
+        
+        with patch.object(settings, "NUTRITION_ITEM_TIMEOUT", 0.05):
+            start = asyncio.get_running_loop().time()
+            enriched, portions = await enrich_foods(NutritionService(), foods)
+            elapsed = asyncio.get_running_loop().time() - start
+        
+        assert elapsed < 0.25
+        assert [food["source"] for food in enriched] == ["usda", "estimated", "usda"]
+        assert enriched[0]["nutrition"]["calories"] == 50
+        assert enriched[2]["nutrition"]["calories"] == 200
+        assert portions.shape[0] == 3
+        await asyncio.sleep(0.3)  # la consulta lenta termina y se guarda por su cuenta
+    
+    @pytest.mark.asyncio
+    async def test_item_timeout_starts_after_semaphore(self, nutrition_cache, upstream_fetch):
+        """Probar que la espera por el semáforo no consuma el timeout y que haya una latencia por alimento"""
+        from services.metrics import LatencyTracker
+        from services.nutrition_service import NutritionService
+        
+        async def fetch(food_name, cache_key):
+            await asyncio.sleep(0.03)
+            return {"nutrition_per_100g": {"calories": 100}, "source": "usda", "food_name": food_name, "schema": 2}
+        
+        upstream_fetch.side_effect = fetch
+        nutrition_cache.pipe.execute = AsyncMock(return_value=[True, True, True])
+        latency = LatencyTracker()
+        
+        # En serie el tercero termina a los ~90 ms, después de su timeout de 50 ms si contara la cola
+        results = await NutritionService().get_base_nutrition_many(
+            ["pan", "kiwi", "arroz"], timeout=0.05, concurrency=1, latency=latency
+        )
+        
+        assert [data["source"] for data in results] == ["usda", "usda", "usda"]
+        assert len(latency.samples) == 3
+        assert max(latency.samples) >= 60  # la muestra del último incluye su espera en la cola
+    
+    @pytest.mark.asyncio
+    async def test_stale_while_revalidate(self, nutrition_cache, upstream_fetch):
+        """Probar que una entrada vencida se sirve y se revalida una sola vez"""
+        import time
+        from services import nutrition_service as service_module
+        from services.nutrition_service import NutritionService
+        
+        stale = {
+            "nutrition_per_100g": {"calories": 50}, "source": "usda", "food_name": "apple",
+            "schema": 2, "fresh_until": int(time.time()) - 1
+        }
+        upstream_fetch.return_value = {
+            "nutrition_per_100g": {"calories": 52}, "source": "usda", "food_name": "apple", "schema": 2
+        }
+        
+        service_module.l1_cache.set("nutrition:apple", stale)
+        service = NutritionService()
+        results = await asyncio.gather(*(service.get_base_nutrition("apple") for _ in range(3)))
+        await asyncio.gather(*service_module.refresh_tasks.values())
+        refreshed = await service.get_base_nutrition("apple")
+        
+        assert [data["nutrition_per_100g"]["calories"] for data in results] == [50, 50, 50]
+        assert upstream_fetch.await_count == 1
+        assert refreshed["nutrition_per_100g"]["calories"] == 52
+        assert refreshed["fresh_until"] > time.time()
+    
+    @pytest.mark.asyncio
+    async def test_hedged_upstream_lookup(self):
+        """Probar que Nutritionix cubra a un USDA lento y que el perdedor se cancele"""
+        from services import nutrition_service as service_module
+        from services.nutrition_service import NutritionService
+        
+        cancelled = []
+        
+        async def slow_usda(food_name):
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(food_name)
+                raise
+            return {"source": "usda"}
+        
+        async def fast_usda(food_name):
+            return {"source": "usda"}
+        
+        nutritionix = AsyncMock(return_value={"source": "nutritionix"})
+        stats = dict(service_module.hedge_stats)
+        service = NutritionService()
+        with patch.object(service_module.settings, "NUTRITION_HEDGE_INITIAL_DELAY_MS", 20), \
+                patch.object(service_module.settings, "NUTRITION_HEDGE_MIN_SAMPLES", 1000), \
+                patch.object(service, "_search_nutritionix", nutritionix):
+            with patch.object(service, "_search_usda", slow_usda):
+                hedged = await service._search_upstream("pollo")
+            with patch.object(service, "_search_usda", fast_usda):
+                direct = await service._search_upstream("pollo")
+        
+        assert hedged["source"] == "nutritionix"
+        assert cancelled == ["pollo"]
+        assert direct["source"] == "usda"
+        assert nutritionix.await_count == 1
+        assert service_module.hedge_stats["hedged"] - stats["hedged"] == 1
+        assert service_module.hedge_stats["hedge_wins"] - stats["hedge_wins"] == 1
+        assert service_module.get_upstream_stats()["hedging"]["hedge_rate"] > 0
+    
+    @pytest.mark.asyncio
+    async def test_hedge_threshold_ignores_failed_calls(self):
+        """Probar que el p95 de USDA ignore los errores y cuente las canceladas como cota inferior"""
+        from services.metrics import LatencyTracker
+        from services.nutrition_service import NutritionService, UpstreamUnavailable
+        
+        tracker = LatencyTracker()
+        
+        async def failed():
+            raise UpstreamUnavailable("USDA respondió 503")
+        
+        async def answered():
+            await asyncio.sleep(0.02)
+            return None  # 200 sin resultados
+        
+        with pytest.raises(UpstreamUnavailable):
+            await NutritionService._timed(tracker, failed())
+        assert tracker.count == 0
+        
+        # Perdió la cobertura a los 30 ms: tardaba al menos eso
+        slow = asyncio.create_task(NutritionService._timed(tracker, asyncio.sleep(1)))
+        await asyncio.sleep(0.03)
+        slow.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await slow
+        assert tracker.count == 1
+        assert 30 <= tracker.samples[0] < 1000
+        
+        assert await NutritionService._timed(tracker, answered()) is None
+        assert tracker.count == 2
+        assert tracker.percentile(95) >= 30
+    
+    @pytest.mark.asyncio
+    async def test_hedge_rate_budget(self):
+        """Probar que sin presupuesto de coberturas se espere a USDA sin lanzar Nutritionix"""
+        from collections import deque
+        from services import nutrition_service as service_module
+        from services.nutrition_service import NutritionService
+        
+        async def slow_usda(food_name):
+            await asyncio.sleep(0.05)
+            return {"source": "usda"}
+        
+        nutritionix = AsyncMock(return_value={"source": "nutritionix"})
+        window = deque(maxlen=10)
+        stats = dict(service_module.hedge_stats)
+        service = NutritionService()
+        with patch.object(service_module.settings, "NUTRITION_HEDGE_INITIAL_DELAY_MS", 10), \
+                patch.object(service_module.settings, "NUTRITION_HEDGE_MIN_SAMPLES", 1000), \
+                patch.object(service_module.settings, "NUTRITION_HEDGE_MAX_RATE", 0.1), \
+                patch.object(service_module, "hedge_window", window), \
+                patch.object(service, "_search_usda", slow_usda), \
+                patch.object(service, "_search_nutritionix", nutritionix):
+            first = await service._search_upstream("pollo")  # 1 de 10 permitida
+            second = await service._search_upstream("pollo")
+        
+        assert first["source"] == "nutritionix"
+        assert second["source"] == "usda"
+        assert nutritionix.await_count == 1
+        assert list(window) == [True, False]
+        assert service_module.hedge_stats["budget_exhausted"] - stats["budget_exhausted"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_disk_cache_survives_redis_outage(self, nutrition_cache, upstream_fetch):
+        """Probar que con Redis caído se sirve desde el disco sin consultar upstream"""
+        from services import nutrition_service as service_module
+        from services.nutrition_service import NutritionService
+        
+        redis_client = nutrition_cache.redis
+        redis_client.get = AsyncMock(side_effect=ConnectionError("Redis caído"))
+        redis_client.mget = AsyncMock(side_effect=ConnectionError("Redis caído"))
+        redis_client.set = AsyncMock(side_effect=ConnectionError("Redis caído"))
+        redis_client.pipeline.side_effect = ConnectionError("Redis caído")
+        upstream_fetch.return_value = {
+            "nutrition_per_100g": {"calories": 52}, "source": "usda", "food_name": "apple", "schema": 2
+        }
+        
+        service = NutritionService()
+        await service.get_base_nutrition("apple")
+        service_module.l1_cache.clear()
+        single = await service.get_base_nutrition("apple")
+        service_module.l1_cache.clear()
+        batch = await service.get_base_nutrition_many(["apple"])
+        
+        assert upstream_fetch.await_count == 1
+        assert single["nutrition_per_100g"]["calories"] == 52
+        assert batch[0]["nutrition_per_100g"]["calories"] == 52
+    
+    def test_disk_cache_lru_compaction(self, tmp_path):
+        """Probar expiración y desalojo LRU por tamaño del cache en disco"""
+        import time
+        from services.disk_cache import DiskCache
+        
+        cache = DiskCache(str(tmp_path / "l2.db"), max_bytes=950)
+        cache.set_many({f"k{i}": (b"x" * 98, 60) for i in range(8)})  # 100 B por entrada
+        cache.set_many({"expired": (b"x" * 93, -1)})
+        time.sleep(0.01)
+        cache.get_many(["k0"])  # k0 pasa a ser la más reciente
+        cache.set_many({"k8": (b"x" * 98, 60), "k9": (b"x" * 98, 60)})
+        cache.compact()
+        
+        kept = cache.get_many([f"k{i}" for i in range(10)])
+        assert "k0" in kept and "k8" in kept and "k9" in kept
+        assert len(kept) == 8  # 1000 B > 950: se desalojan las menos usadas hasta 855 B
+        assert cache.get_many(["expired"]) == {}
+    
+    def test_binary_cache_encoding(self):
+        """Probar la codificación binaria y la lectura de entradas JSON anteriores"""
+        from services import nutrition_codec
+        
+        data = {
+            "nutrition_per_100g": {"calories": 52, "protein": 0.26, "sodium": 1},
+            "source": "usda",
+            "food_name": "Manzana",
+            "schema": 2
+        }
+        encoded = nutrition_codec.encode(data)
+        decoded, is_json = nutrition_codec.decode(encoded)
+        
+        assert len(encoded) < len(json.dumps(data))
+        assert not is_json
+        assert decoded["nutrition_per_100g"]["protein"] == 0.26
+        assert decoded["food_name"] == "Manzana"
+        
+        not_found = {"not_found": True, "food_name": "tamal", "schema": 2}
+        assert nutrition_codec.decode(nutrition_codec.encode(not_found)) == (not_found, False)
+        assert nutrition_codec.decode(json.dumps(data).encode()) == (data, True)
+    
+    @pytest.mark.asyncio
+    async def test_corrupt_cache_values_are_misses(self, nutrition_cache, upstream_fetch):
+        """Probar que valores truncados o dañados cuenten como miss y no lleguen al llamador"""
+        from services import nutrition_codec
+        from services import nutrition_service as service_module
+        from services.nutrition_service import NutritionService
+        
+        encoded = nutrition_codec.encode({
+            "nutrition_per_100g": {"calories": 52}, "source": "usda", "food_name": "Manzana", "schema": 2
+        })
+        corrupt = [encoded[:10], encoded[:-7] + b"\xff\xfe", b"{no es json", b"[1, 2]"]
+        for raw in corrupt:
+            with pytest.raises(nutrition_codec.CorruptEntry):
+                nutrition_codec.decode(raw)
+        
+        nutrition_cache.redis.get = AsyncMock(return_value=corrupt[0])
+        nutrition_cache.redis.mget = AsyncMock(return_value=corrupt[1:])
+        nutrition_cache.pipe.execute = AsyncMock(return_value=[True, True, True])
+        upstream_fetch.return_value = {
+            "nutrition_per_100g": {"calories": 89}, "source": "usda", "food_name": "banana", "schema": 2
+        }
+        before = service_module.encoding_stats["corrupt"]
+        service = NutritionService()
+        
+        single = await service.get_base_nutrition("pan")
+        batch = await service.get_base_nutrition_many(["arroz", "pollo", "huevo"])
+        
+        assert single["nutrition_per_100g"]["calories"] == 89
+        assert [data["nutrition_per_100g"]["calories"] for data in batch] == [89, 89, 89]
+        assert service_module.encoding_stats["corrupt"] - before == 4
+        assert upstream_fetch.await_count == 4
+    
+    @pytest.mark.asyncio
+    async def test_legacy_json_read_is_rewritten(self, nutrition_cache):
+        """Probar que una entrada JSON antigua se reescriba en binario con SET XX KEEPTTL"""
+        from services import nutrition_codec
+        from services import nutrition_service as service_module
+        from services.nutrition_service import NutritionService
+        
+        legacy = {"nutrition_per_100g": {"calories": 52}, "source": "usda", "food_name": "apple", "schema": 2}
+        nutrition_cache.redis.get = AsyncMock(return_value=json.dumps(legacy).encode())
+        before = dict(service_module.encoding_stats)
+        
+        data = await NutritionService().get_base_nutrition("manzana")
+        
+        assert data["nutrition_per_100g"]["calories"] == 52
+        nutrition_cache.pipe.set.assert_called_once()
+        args, kwargs = nutrition_cache.pipe.set.call_args
+        assert args[0] == "nutrition:manzana"
+        rewritten, is_json = nutrition_codec.decode(args[1])
+        assert not is_json
+        assert rewritten["nutrition_per_100g"]["calories"] == 52
+        assert rewritten["food_name"] == "apple"
+        assert kwargs == {"xx": True, "keepttl": True}
+        assert service_module.encoding_stats["legacy_read"] - before["legacy_read"] == 1
+        assert service_module.encoding_stats["migrated"] - before["migrated"] == 1
+
+class TestNutrients:
+    """Pruebas del esquema canónico de nutrientes"""
+    
+    def test_batched_portions_and_totals(self):
+        """Probar escalado de porciones y totales sobre la matriz"""
+        from services import nutrients
+        from routers.images import calculate_total_nutrition
+        
+        per_100g = nutrients.to_matrix([
+            {"calories": 52, "protein": 0.26, "sodium": 1},
+            {"calories": 165, "protein": 31, "fat": 3.6, "sodium": 74}
+        ])
+        portions = nutrients.scale_portions(per_100g, [150, 200])
+        totals = nutrients.to_dict(calculate_total_nutrition(portions))
+        
+        assert list(totals) == nutrients.NUTRIENTS
+        assert totals["calories"] == 408
+        assert totals["sodium"] == 149.5  # mg
+        assert nutrients.to_dict(portions[1])["fat"] == 7.2
+
+class TestAnalysisQueue:
+    """Pruebas de la cola de análisis"""
+    
+    @pytest.mark.asyncio
+    async def test_queue_full_rejects_with_retry_after(self):
+        """Probar que la cola acotada rechace trabajos al llenarse"""
+        from services.analysis_queue import AnalysisQueue, QueueFullError
+        
+        queue = AnalysisQueue(max_concurrency=1, max_queue_size=1, max_history=10)
+        
+        async def handler(value):
+            await asyncio.sleep(0.01)
+            return value
+        
+        queue.submit("job-1", handler, 1)
+        with pytest.raises(QueueFullError) as exc_info:
+            queue.submit("job-2", handler, 2)
+        
+        assert exc_info.value.retry_after >= 1
+        await queue.stop()
+        assert queue.get_job("job-1")["status"] == "completed"
+        assert queue.get_job("job-1")["result"] == 1
+        assert queue.get_stats()["rejected"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_failed_job_state(self):
+        """Probar que los errores queden registrados en el trabajo"""
+        from services.analysis_queue import AnalysisQueue
+        
+        queue = AnalysisQueue(max_concurrency=2, max_queue_size=5, max_history=10)
+        
+        async def handler():
+            raise ValueError("imagen corrupta")
+        
+        queue.submit("job-1", handler)
+        await queue.stop()
+        
+        job = queue.get_job("job-1")
+        assert job["status"] == "failed"
+        assert job["error"] == "imagen corrupta"
+    
+    @pytest.mark.asyncio
+    async def test_status_only_for_owner(self):
+        """Probar que el estado de un análisis solo lo vea el usuario que lo envió"""
+        from fastapi import HTTPException
+        from config import settings
+        from routers import images
+        from services.analysis_queue import AnalysisQueue
+        
+        queue = AnalysisQueue(max_concurrency=1, max_queue_size=5, max_history=10)
+        
+        async def handler():
+            return {}
+        
+        queue.submit("job-1", handler, user_id=1)
+        await queue.stop()
+        redis_jobs = AsyncMock(return_value={"id": "job-2", "status": "queued", "user_id": "1", "error": None})
+        with patch.object(images, "analysis_queue", queue), \
+                patch.object(images.job_queue, "get_job", redis_jobs), \
+                patch.object(settings, "ANALYSIS_QUEUE_BACKEND", "redis"):
+            own = await images.get_analysis_status("job-1", current_user={"id": 1})
+            own_redis = await images.get_analysis_status("job-2", current_user={"id": 1})
+            for analysis_id in ("job-1", "job-2"):
+                with pytest.raises(HTTPException) as exc_info:
+                    await images.get_analysis_status(analysis_id, current_user={"id": 2})
+                assert exc_info.value.status_code == 404
+        
+        assert own.status == "completed"
+        assert own_redis.status == "queued"
+
+@pytest.fixture
+def stream_redis():
+    """
+    Redis con Streams para la cola durable: el local (TEST_REDIS_URL) o, sin
+    servidor, fakeredis. Streams y claves con prefijo propio de la prueba.
+    """
+    import uuid
+    import redis
+    from types import SimpleNamespace
+    from config import settings
+    
+    prefix = f"test-{uuid.uuid4().hex[:8]}"
+    url = os.environ.get("TEST_REDIS_URL", "redis://localhost:6379/1")
+    server = redis.Redis.from_url(url, socket_connect_timeout=0.2)
+    try:
+        server.ping()
+        client = redis.asyncio.from_url(url)
+    except redis.exceptions.ConnectionError:
+        server = None
+        fakeredis = pytest.importorskip("fakeredis")
+        client = fakeredis.FakeAsyncRedis()
+    
+    with patch.object(settings, "ANALYSIS_STREAM", f"{prefix}:jobs"), \
+            patch.object(settings, "ANALYSIS_DEAD_LETTER_STREAM", f"{prefix}:dead"), \
+            patch.object(settings, "ANALYSIS_CONSUMER_GROUP", f"{prefix}-workers"), \
+            patch.object(settings, "ML_MAX_RETRIES", 2):
+        yield SimpleNamespace(client=client, prefix=prefix)
+    
+    if server is not None:
+        for key in server.scan_iter(f"*{prefix}*"):
+            server.delete(key)
+        server.close()
+
+class TestRedisJobStream:
+    """Pruebas de la cola durable sobre Redis Streams"""
+    
+    def _worker(self, stream_redis, handler, consumer="worker-1"):
+        from services.job_stream import AnalysisStreamWorker
+        
+        worker = AnalysisStreamWorker(handler, consumer_name=consumer, concurrency=4)
+        worker.queue.redis = worker.redis = stream_redis.client
+        return worker
+    
+    async def _read(self, worker):
+        response = await worker.redis.xreadgroup(
+            worker.queue.group, worker.consumer, {worker.queue.stream: ">"}, count=10
+        )
+        return [(msg_id, fields, 1) for _, entries in response for msg_id, fields in entries]
+    
+    @pytest.mark.asyncio
+    async def test_enqueue_read_and_ack(self, stream_redis):
+        """Probar el recorrido completo: XADD, XREADGROUP, resultado y XACK"""
+        handler = AsyncMock(return_value={"foods": ["manzana"]})
+        worker = self._worker(stream_redis, handler)
+        analysis_id = f"{stream_redis.prefix}-ok"
+        await worker.ensure_group()
+        
+        await worker.queue.enqueue(analysis_id, b"imagen", 7, "lunch", None)
+        assert await worker.queue.pending_count() == 1
+        
+        messages = await self._read(worker)
+        assert len(messages) == 1
+        await worker.process_message(*messages[0])
+        
+        handler.assert_awaited_once_with(analysis_id, b"imagen", 7, "lunch", None)
+        job = await worker.queue.get_job(analysis_id)
+        assert job["status"] == "completed"
+        assert job["result"] == {"foods": ["manzana"]}
+        assert await worker.queue.pending_count() == 0
+        assert await worker.redis.exists(f"analysis:image:{analysis_id}") == 0
+    
+    @pytest.mark.asyncio
+    async def test_retry_then_dead_letter(self, stream_redis):
+        """Probar que un fallo se reencole hasta el máximo y acabe en dead-letter"""
+        handler = AsyncMock(side_effect=RuntimeError("OpenAI no disponible"))
+        worker = self._worker(stream_redis, handler)
+        analysis_id = f"{stream_redis.prefix}-fail"
+        await worker.ensure_group()
+        await worker.queue.enqueue(analysis_id, b"imagen", 7, None, None)
+        
+        # Primer intento: se vuelve a publicar con attempts=1
+        await worker.process_message(*(await self._read(worker))[0])
+        job = await worker.queue.get_job(analysis_id)
+        assert job["status"] == "queued"
+        assert job["error"] == "OpenAI no disponible"
+        retry = await self._read(worker)
+        assert len(retry) == 1
+        assert retry[0][1][b"attempts"] == b"1"
+        
+        # Segundo intento (ML_MAX_RETRIES=2): dead-letter, sin más reintentos
+        await worker.process_message(*retry[0])
+        assert handler.await_count == 2
+        assert await self._read(worker) == []
+        assert await worker.queue.pending_count() == 0
+        dead = await worker.redis.xrange(worker.queue.dead_letter_stream)
+        assert len(dead) == 1
+        assert dead[0][1][b"analysis_id"] == analysis_id.encode()
+        job = await worker.queue.get_job(analysis_id)
+        assert job["status"] == "failed"
+        assert job["error"] == "OpenAI no disponible"
+    
+    @pytest.mark.asyncio
+    async def test_claims_stale_job(self, stream_redis):
+        """Probar que XAUTOCLAIM recupere el trabajo de un worker caído"""
+        from config import settings
+        
+        crashed = self._worker(stream_redis, AsyncMock(), consumer="worker-crashed")
+        handler = AsyncMock(return_value={"foods": []})
+        worker = self._worker(stream_redis, handler, consumer="worker-2")
+        analysis_id = f"{stream_redis.prefix}-stale"
+        await worker.ensure_group()
+        await worker.queue.enqueue(analysis_id, b"imagen", 7, None, None)
+        assert len(await self._read(crashed)) == 1  # entregado y nunca confirmado
+        
+        assert await worker._claim_stale() == []  # aún no supera ANALYSIS_CLAIM_IDLE_MS
+        with patch.object(settings, "ANALYSIS_CLAIM_IDLE_MS", 0):
+            claimed = await worker._claim_stale()
+        
+        assert len(claimed) == 1
+        msg_id, fields, deliveries = claimed[0]
+        assert deliveries == 2
+        await worker.process_message(msg_id, fields, deliveries)
+        handler.assert_awaited_once()
+        job = await worker.queue.get_job(analysis_id)
+        assert job["status"] == "completed"
+        assert job["attempts"] == "2"
+        assert await worker.queue.pending_count() == 0
+
+class TestAIMDLimiter:
+    """Pruebas del limitador de concurrencia adaptativo"""
+    
+    @pytest.mark.asyncio
+    async def test_limit_adapts(self):
+        """Probar crecimiento aditivo y reducción multiplicativa"""
+        from services.concurrency import AIMDLimiter
+        
+        limiter = AIMDLimiter(initial_limit=4, min_limit=1, max_limit=8)
+        
+        for _ in range(8):
+            await limiter.acquire()
+            await limiter.release("success")
+        assert limiter.limit > 5
+        
+        await limiter.acquire()
+        await limiter.release("overload")
+        assert limiter.limit < 3
+        assert limiter.in_flight == 0
+    
+    @pytest.mark.asyncio
+    async def test_one_decrease_per_window(self):
+        """Probar que una ráfaga de 429 simultáneos reduzca el límite una sola vez"""
+        from services.concurrency import AIMDLimiter
+        
+        limiter = AIMDLimiter(initial_limit=8, min_limit=1, max_limit=8)
+        windows = [await limiter.acquire() for _ in range(4)]
+        for window in windows:
+            await limiter.release("overload", window)
+        assert limiter.limit == 4
+        
+        # Una llamada que empezó después de la reducción sí vuelve a reducir
+        await limiter.release("overload", await limiter.acquire())
+        assert limiter.limit == 2
+        assert limiter.get_stats()["decreases"] == 2
+        assert limiter.get_stats()["overloads"] == 5
+    
+    @pytest.mark.asyncio
+    async def test_zero_retries_still_calls_the_model(self):
+        """Probar que ML_MAX_RETRIES=0 haga al menos un intento"""
+        from config import settings
+        from services.ml_service import MLService
+        
+        ml_service = MLService()
+        ml_service.client = AsyncMock()
+        ml_service.client.chat.completions.create.return_value = "respuesta"
+        
+        with patch.object(settings, "ML_MAX_RETRIES", 0):
+            assert await ml_service._create_completion("data:image/jpeg;base64,") == "respuesta"
+        ml_service.client.chat.completions.create.assert_awaited_once()
+
+class TestLatencyTracker:
+    """Pruebas de la ventana de latencias"""
+    
+    def test_percentiles_over_window(self):
+        """Probar percentiles por rango más cercano y que solo cuente la ventana"""
+        from services.metrics import LatencyTracker
+        
+        tracker = LatencyTracker(window=100)
+        assert tracker.percentile(95) == 0.0
+        for latency in range(1, 101):
+            tracker.record(float(latency))
+        
+        assert tracker.percentile(0) == 1.0
+        assert tracker.percentile(50) == 51.0
+        assert tracker.percentile(95) == 95.0
+        assert tracker.percentile(100) == 100.0
+        
+        for _ in range(100):
+            tracker.record(1000.0)  # desplaza toda la ventana
+        stats = tracker.get_stats()
+        assert stats["p50_ms"] == 1000.0
+        assert stats["count"] == 200
+        assert stats["avg_ms"] == round((5050 + 100000) / 200, 2)
+
+class TestTokenBucket:
+    """Pruebas del token bucket"""
+    
+    @pytest.mark.asyncio
+    async def test_waits_for_tokens(self):
+        """Probar la ráfaga inicial y la espera proporcional a la tasa"""
+        from services import concurrency
+        from services.concurrency import TokenBucket
+        
+        bucket = TokenBucket(rate=10, burst=2)
+        sleep = AsyncMock()
+        with patch.object(concurrency.asyncio, "sleep", sleep):
+            waits = [await bucket.acquire() for _ in range(3)]
+        
+        assert waits[:2] == [0.0, 0.0]
+        assert 0.09 < waits[2] <= 0.1
+        sleep.assert_awaited_once()
+        assert await TokenBucket(rate=0).acquire() == 0.0
+
+class TestSingleFlight:
+    """Pruebas de coalescencia de consultas"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_result(self):
+        """Probar que solo una consulta upstream se ejecute por clave"""
+        from services.concurrency import SingleFlight
+        
+        flight = SingleFlight()
+        calls = []
+        
+        async def lookup():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"source": "usda"}
+        
+        results = await asyncio.gather(*(
+            flight.do("nutrition:pollo", lookup) for _ in range(5)
+        ))
+        
+        assert len(calls) == 1
+        assert all(result == {"source": "usda"} for result in results)
+        assert flight.get_stats()["coalesced"] == 4
+
+class TestHTTPSessions:
+    """Pruebas del pool de sesiones HTTP por upstream"""
+    
+    @pytest.mark.asyncio
+    async def test_reuse_per_upstream_and_recreate_after_close(self):
+        """Probar una sesión por upstream, reutilizada hasta close()"""
+        from config import settings
+        from services.http_sessions import HTTPSessionPool
+        
+        pool = HTTPSessionPool()
+        usda = await pool.get("usda")
+        assert await pool.get("usda") is usda
+        assert await pool.get("nutritionix") is not usda
+        
+        stats = pool.get_stats()
+        assert stats["usda"] == {
+            "closed": False,
+            "limit": settings.HTTP_POOL_LIMIT,
+            "limit_per_host": settings.HTTP_POOL_LIMIT_PER_HOST,
+            "in_flight": 0,
+            "requests": 0,
+            "connections_created": 0,
+            "connections_reused": 0
+        }
+        
+        await pool.close()
+        assert usda.closed
+        assert pool.get_stats() == {}
+        
+        recreated = await pool.get("usda")
+        assert recreated is not usda and not recreated.closed
+        await recreated.close()
+        assert pool.get_stats() == {"usda": {"closed": True}}
+        assert await pool.get("usda") is not recreated
+        await pool.close()
+    
+    @pytest.mark.asyncio
+    async def test_request_counters(self):
+        """Probar que las estadísticas salgan de los contadores propios (TraceConfig)"""
+        from aiohttp import web
+        from aiohttp.test_utils import TestServer
+        from services.http_sessions import HTTPSessionPool
+        
+        async def handler(request):
+            return web.Response(text="ok")
+        
+        app = web.Application()
+        app.router.add_get("/", handler)
+        pool = HTTPSessionPool()
+        async with TestServer(app) as server:
+            session = await pool.get("usda")
+            for _ in range(3):
+                async with session.get(server.make_url("/")) as response:
+                    assert await response.text() == "ok"
+            stats = pool.get_stats()["usda"]
+            await pool.close()
+        
+        assert stats["requests"] == 3
+        assert stats["in_flight"] == 0
+        assert stats["connections_created"] == 1
+        assert stats["connections_reused"] == 2
+    
+    def test_session_from_finished_loop_is_closed(self):
+        """Probar que la sesión de un event loop terminado se cierre al reemplazarla"""
+        from services.http_sessions import HTTPSessionPool
+        
+        pool = HTTPSessionPool()
+        
+        async def get_session():
+            return await pool.get("usda")
+        
+        first = asyncio.run(get_session())
+        second = asyncio.run(get_session())
+        
+        assert second is not first
+        assert first.closed
+        assert first.connector is None
+        asyncio.run(pool.close())
+
+class TestRedisCircuitBreaker:
+    """Pruebas del circuit breaker de Redis"""
+    
+    @pytest.mark.asyncio
+    async def test_open_fallback_and_half_open_probe(self):
+        """Probar apertura tras fallos, respaldo en memoria y cierre con una prueba"""
+        from unittest.mock import MagicMock
+        from redis.exceptions import ConnectionError as RedisConnectionError
+        from services.circuit_breaker import CircuitBreaker, CircuitOpenError, FallbackStore, GuardedRedis
+        
+        fallback = FallbackStore(max_entries=100, max_ttl=60)
+        breaker = CircuitBreaker("Redis", failure_threshold=2, reset_timeout=0.05, on_close=fallback.clear)
+        client = MagicMock()
+        client.get = AsyncMock(side_effect=RedisConnectionError("down"))
+        client.set = AsyncMock(side_effect=RedisConnectionError("down"))
+        redis_client = GuardedRedis(client, breaker, fallback)
+        
+        # Por debajo del umbral el error llega al llamador
+        with pytest.raises(RedisConnectionError):
+            await redis_client.get("nutrition:pan")
+        assert breaker.state == "closed"
+        assert await redis_client.set("nutrition:pan", b"v", ex=60) is True
+        assert breaker.state == "open"
+        
+        # Abierto: no se espera a Redis
+        assert await redis_client.get("nutrition:pan") == b"v"
+        assert client.get.await_count == 1
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.set("lock:nutrition:pan", "a", nx=True, px=1000)
+            pipe.set("lock:nutrition:pan", "b", nx=True, px=1000)
+            assert await pipe.execute() == [True, None]
+        with pytest.raises(CircuitOpenError):
+            await redis_client.hgetall("food:translations")
+        
+        # Semiabierto: una prueba exitosa cierra el circuito y vacía el respaldo
+        await asyncio.sleep(0.06)
+        client.get = AsyncMock(return_value=b"redis")
+        assert await redis_client.get("nutrition:pan") == b"redis"
+        assert breaker.state == "closed"
+        assert fallback.get_stats()["entries"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_only_the_probe_decides_half_open(self):
+        """Probar que una llamada iniciada antes de abrir no libere ni decida la prueba"""
+        from redis.exceptions import ConnectionError as RedisConnectionError
+        from services.circuit_breaker import CircuitBreaker
+        
+        breaker = CircuitBreaker("Redis", failure_threshold=1, reset_timeout=0.05)
+        release_old, release_probe = asyncio.Event(), asyncio.Event()
+        
+        async def slow_failure(event):
+            await event.wait()
+            raise RedisConnectionError("down")
+        
+        async def slow_success(event):
+            await event.wait()
+            return "redis"
+        
+        async def fail():
+            raise RedisConnectionError("down")
+        
+        old = asyncio.create_task(breaker.call(lambda: slow_failure(release_old), lambda: "respaldo"))
+        await asyncio.sleep(0)
+        assert await breaker.call(fail, lambda: "respaldo") == "respaldo"
+        assert breaker.state == "open"
+        
+        await asyncio.sleep(0.06)
+        probe = asyncio.create_task(breaker.call(lambda: slow_success(release_probe), lambda: "respaldo"))
+        await asyncio.sleep(0)
+        assert breaker.state == "half_open"
+        
+        release_old.set()
+        assert await old == "respaldo"
+        assert breaker.state == "half_open"  # el fallo antiguo no reabre el circuito
+        assert await breaker.call(fail, lambda: "respaldo") == "respaldo"  # prueba aún en curso
+        assert breaker.get_stats()["rejected"] == 1
+        
+        release_probe.set()
+        assert await probe == "redis"
+        assert breaker.state == "closed"
+
+class TestImageCache:
+    """Pruebas del cache de imágenes casi duplicadas"""
+    
+    def test_near_duplicate_hit(self):
+        """Probar que hashes cercanos reutilicen el resultado"""
+        from services.image_cache import PerceptualImageCache
+        
+        cache = PerceptualImageCache(max_entries=10, ttl=600, max_distance=4)
+        cache.put(0b1011_0000, [{"name": "manzana", "portion_grams": 150}])
+        
+        assert cache.get(0b1011_0011)[0]["name"] == "manzana"  # distancia 2
+        assert cache.get(0b0100_1111) is None  # distancia 8
+        assert cache.get_stats()["hits"] == 1
+        assert cache.get_stats()["misses"] == 1
+    
+    def test_lru_eviction(self):
+        """Probar que se descarten las entradas menos usadas"""
+        from services.image_cache import PerceptualImageCache
+        
+        cache = PerceptualImageCache(max_entries=1, ttl=600, max_distance=2)
+        cache.put(0, [{"name": "pan"}])
+        cache.put(2 ** 63 - 1, [{"name": "pollo"}])
+        
+        assert cache.get(0) is None
+        assert cache.get_stats()["evictions"] == 1
+    
+    def test_scoped_by_user(self):
+        """Probar que la foto parecida de otro usuario no reutilice el resultado"""
+        from services.image_cache import PerceptualImageCache
+        
+        cache = PerceptualImageCache(max_entries=10, ttl=600, max_distance=4)
+        cache.put(0b1011_0000, [{"name": "manzana"}], scope=1)
+        
+        assert cache.get(0b1011_0001, scope=1)[0]["name"] == "manzana"
+        assert cache.get(0b1011_0001, scope=2) is None
+    
+    def test_dhash_of_encoded_images(self):
+        """Probar dHash sobre imágenes reales: recodificar/reducir no lo cambia, otra foto sí"""
+        import io
+        from PIL import Image, ImageDraw
+        from services.image_cache import compute_dhash
+        
+        def encode(img, fmt, **params):
+            buffer = io.BytesIO()
+            img.save(buffer, format=fmt, **params)
+            return buffer.getvalue()
+        
+        plate = Image.new("RGB", (640, 480), "white")
+        draw = ImageDraw.Draw(plate)
+        draw.ellipse((120, 80, 520, 400), fill=(200, 40, 40))
+        draw.rectangle((0, 0, 160, 480), fill=(60, 120, 30))
+        other = plate.transpose(Image.FLIP_LEFT_RIGHT)
+        
+        original = compute_dhash(encode(plate, "PNG"))
+        recompressed = compute_dhash(encode(plate.resize((320, 240)), "JPEG", quality=40))
+        different = compute_dhash(encode(other, "JPEG", quality=90))
+        
+        assert original is not None
+        assert bin(original ^ recompressed).count("1") <= 6
+        assert bin(original ^ different).count("1") > 6
+        assert compute_dhash(b"no es una imagen") is None
+
+class TestImagePreprocessing:
+    """Pruebas del preprocesamiento de imágenes"""
+    
+    def _encode(self, img, fmt="JPEG", **params):
+        import io
+        
+        buffer = io.BytesIO()
+        img.save(buffer, format=fmt, **params)
+        return buffer.getvalue()
+    
+    def test_exif_transpose_and_downscale(self):
+        """Probar que se aplique la orientación EXIF, se reduzca y se quiten metadatos"""
+        import io
+        from PIL import Image
+        from services.image_processing import preprocess_image, ORIENTATION_TAG
+        
+        photo = Image.new("RGB", (2000, 1000), (200, 40, 40))
+        exif = Image.Exif()
+        exif[ORIENTATION_TAG] = 6  # cámara girada 90°
+        
+        result = preprocess_image(self._encode(photo, exif=exif.tobytes()), max_edge=1024, quality=85)
+        
+        assert result["processed"]
+        assert result["dimensions"] == {"width": 512, "height": 1024}
+        assert result["mime_type"] == "image/jpeg"
+        assert result["image_hash"] is not None
+        with Image.open(io.BytesIO(result["data"])) as processed:
+            assert processed.size == (512, 1024)
+            assert ORIENTATION_TAG not in processed.getexif()
+    
+    def test_keeps_original_when_reencoding_grows_it(self):
+        """Probar que una imagen pequeña y ya comprimida no crezca al recodificar"""
+        import random
+        from PIL import Image
+        from services.image_processing import preprocess_image
+        
+        rng = random.Random(7)
+        noise = Image.new("RGB", (200, 150))
+        noise.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(200 * 150)])
+        original = self._encode(noise, quality=30)
+        
+        result = preprocess_image(original, max_edge=1024, quality=95)
+        
+        assert result["processed"]
+        assert result["data"] == original
+        assert result["processed_bytes"] == result["original_bytes"]
+        assert result["image_hash"] is not None
+    
+    def test_exif_always_stripped(self):
+        """Probar que una imagen con EXIF (GPS) se recodifique sin metadatos aunque crezca"""
+        import io
+        import random
+        from PIL import Image
+        from services.image_processing import preprocess_image
+        
+        rng = random.Random(7)
+        noise = Image.new("RGB", (200, 150))
+        noise.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(200 * 150)])
+        exif = Image.Exif()
+        exif[0x010F] = "Camara"
+        exif.get_ifd(0x8825)[2] = (19.0, 26.0, 0.0)  # GPSLatitude
+        original = self._encode(noise, quality=30, exif=exif.tobytes())
+        with Image.open(io.BytesIO(original)) as source:
+            assert source._getexif()
+        
+        result = preprocess_image(original, max_edge=1024, quality=95)
+        
+        assert result["processed"]
+        assert result["data"] != original
+        with Image.open(io.BytesIO(result["data"])) as processed:
+            assert not processed._getexif()
+    
+    @pytest.mark.asyncio
+    async def test_broken_pool_falls_back_to_original(self):
+        """Probar que un pool de procesos roto devuelva la imagen original y se recree"""
+        from unittest.mock import MagicMock
+        from concurrent.futures.process import BrokenProcessPool
+        from services import image_processing
+        
+        broken = MagicMock()
+        broken.submit.side_effect = BrokenProcessPool("proceso terminado")
+        with patch.object(image_processing, "_executor", broken):
+            result = await image_processing.preprocess_image_async(b"imagen")
+            assert image_processing._executor is None
+        
+        assert not result["processed"]
+        assert result["data"] == b"imagen"
+        assert result["saved_bytes"] == 0
+
+class TestMemoryCache:
+    """Pruebas del cache L1 en memoria"""
+    
+    def test_ttl_and_lru(self):
+        """Probar expiración, desalojo LRU e invalidación"""
+        from services.memory_cache import TTLCache
+        
+        cache = TTLCache(max_entries=2, ttl=60)
+        cache.set("nutrition:manzana", {"source": "usda"})
+        cache.set("nutrition:pollo", {"source": "usda"})
+        cache.get("nutrition:manzana")
+        cache.set("nutrition:pan", {"source": "usda"})
+        
+        assert cache.get("nutrition:pollo") is None
+        assert cache.get("nutrition:manzana") == {"source": "usda"}
+        
+        cache.set("nutrition:arroz", {"source": "usda"}, ttl=0)
+        assert cache.get("nutrition:arroz") is None
+        cache.set("nutrition:manzana", {"source": "nutritionix"}, ttl=0)
+        assert cache.get("nutrition:manzana") is None
+        cache.set("nutrition:manzana", {"source": "usda"})
+        
+        assert cache.delete("nutrition:manzana")
+        assert cache.get_stats()["evictions"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_invalidation_outage_clears_once(self):
+        """Probar que con el canal caído el L1 se vacíe una vez y use un TTL corto hasta reconectar"""
+        from unittest.mock import MagicMock
+        from config import settings
+        from services import nutrition_service as service_module
+        
+        l1_cache = service_module.l1_cache
+        pubsub = MagicMock()
+        pubsub.subscribe = AsyncMock(side_effect=[ConnectionError("down"), ConnectionError("down"), None])
+        pubsub.close = AsyncMock()
+        pubsub.listen.side_effect = asyncio.CancelledError  # reconectado: terminar la prueba
+        redis_client = MagicMock()
+        redis_client.pubsub.return_value = pubsub
+        ttls = []
+        
+        async def sleep(seconds):
+            ttls.append(l1_cache.ttl)
+            l1_cache.set("nutrition:pan", {"source": "usda"})
+        
+        l1_cache.set("nutrition:manzana", {"source": "usda"})
+        with patch.object(settings, "NUTRITION_REDIS_ENABLED", True), \
+                patch.object(service_module, "get_redis", AsyncMock(return_value=redis_client)), \
+                patch.object(service_module.asyncio, "sleep", sleep):
+            with pytest.raises(asyncio.CancelledError):
+                await service_module.run_invalidation_listener()
+        
+        assert ttls == [settings.NUTRITION_L1_DEGRADED_TTL] * 2
+        assert l1_cache.ttl == settings.NUTRITION_L1_TTL
+        assert l1_cache.get("nutrition:manzana") is None
+        assert l1_cache.get("nutrition:pan") == {"source": "usda"}  # no se vació en el segundo fallo
+        l1_cache.clear()
+
+class TestFoodNames:
+    """Pruebas de canonicalización de nombres"""
+    
+    def test_variants_fold_to_same_key(self):
+        """Probar que variantes del mismo alimento compartan clave"""
+        from services.food_names import canonicalize
+        
+        variants = [
+            "Manzana roja",
+            "manzana  roja",
+            "manzanas rojas",
+            "manzana roja (cruda)",
+            "Manzana Roja"
+        ]
+        assert {canonicalize(name) for name in variants} == {"manzana roja"}
+    
+    def test_plurals_accents_and_aliases(self):
+        """Probar plurales, acentos y sinónimos regionales"""
+        from services.food_names import canonicalize
+        
+        assert canonicalize("Limones") == canonicalize("limón") == "limon"
+        assert canonicalize("Chiles verdes") == "chile verde"
+        assert canonicalize("patatas fritas") == canonicalize("Papas fritas")
+        assert canonicalize("Zumo de naranja") == "jugo naranja"
+
+class TestFoodTranslation:
+    """Pruebas de la traducción español → inglés para USDA"""
+    
+    def _redis(self, table=None, fail=False):
+        """Redis simulado con el hash nutrition:translations"""
+        from unittest.mock import MagicMock
+        
+        store = dict(table or {})
+        redis_client = MagicMock()
+        redis_client.hgetall = AsyncMock(
+            side_effect=ConnectionError("down") if fail else lambda key: dict(store)
+        )
+        redis_client.hset = AsyncMock(side_effect=lambda key, field, value: store.__setitem__(field, value))
+        return redis_client, store
+    
+    @pytest.mark.asyncio
+    async def test_phrases_and_words(self):
+        """Probar frases completas, traducción palabra por palabra y claves sin traducción"""
+        from services import food_translation as translation_module
+        from services.food_translation import FoodTranslator
+        
+        redis_client, _ = self._redis()
+        translator = FoodTranslator()
+        with patch.object(translation_module, "get_redis", AsyncMock(return_value=redis_client)):
+            assert await translator.translate("manzana roja") == ("apple red delicious raw", "dictionary")
+            assert await translator.translate("pechuga pollo asada") == ("breast chicken roasted", "words")
+            assert await translator.translate("pechuga tlayuda") == (None, "none")
+        
+        stats = translator.get_stats()
+        assert (stats["dictionary"], stats["words"], stats["untranslated"]) == (1, 1, 1)
+    
+    @pytest.mark.asyncio
+    async def test_learned_table_round_trip(self):
+        """Probar que el diccionario no se memorice y que una traducción aprendida la use otro proceso"""
+        from services import food_translation as translation_module
+        from services.food_translation import FoodTranslator, LEARNED_KEY
+        
+        usda = {"source": "usda", "food_name": "Chicken, breast, roasted"}
+        redis_client, store = self._redis()
+        with patch.object(translation_module, "get_redis", AsyncMock(return_value=redis_client)):
+            first = FoodTranslator()
+            query, origin = await first.translate("pechuga pollo asada")
+            await first.confirm("pechuga pollo asada", origin, usda)
+            redis_client.hset.assert_not_awaited()
+            
+            query, origin = await first.translate("tlayuda")
+            assert (query, origin) == (None, "none")
+            await first.confirm("tlayuda", origin, {"source": "nutritionix", "food_name": "Tortilla Corn"})
+            redis_client.hset.assert_awaited_once_with(LEARNED_KEY, "tlayuda", "tortilla corn")
+            
+            second = FoodTranslator()
+            query, origin = await second.translate("tlayuda")
+            assert (query, origin) == ("tortilla corn", "learned")
+            await second.confirm("tlayuda", origin, {"source": "usda", "food_name": "Tortillas, corn"})
+        
+        assert store == {"tlayuda": "tortilla corn"}
+        assert first.get_stats()["round_trips_avoided"] == 0
+        assert second.get_stats()["round_trips_avoided"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_untranslated_name_learned_from_upstream(self, nutrition_cache):
+        """Probar que un nombre sin traducción aprenda el nombre en inglés de la coincidencia upstream"""
+        from services import food_translation as translation_module
+        from services import nutrition_service as service_module
+        from services.food_translation import FoodTranslator
+        from services.nutrition_service import NutritionService
+        
+        redis_client, store = self._redis()
+        translator = FoodTranslator()
+        queries = []
+        
+        async def search(food_name):
+            queries.append(food_name)
+            if food_name == "Huitlacoche":
+                return {"nutrition_per_100g": {"calories": 40}, "source": "nutritionix", "food_name": "Corn Smut"}
+            return {"nutrition_per_100g": {"calories": 40}, "source": "usda", "food_name": "Corn smut, raw"}
+        
+        service = NutritionService()
+        with patch.object(translation_module, "get_redis", AsyncMock(return_value=redis_client)), \
+                patch.object(service_module, "food_translator", translator), \
+                patch.object(service, "_search_upstream", search):
+            await service._fetch_upstream("Huitlacoche", "nutrition:huitlacoche")
+            await service._fetch_upstream("Huitlacoche", "nutrition:huitlacoche")
+        
+        assert queries == ["Huitlacoche", "corn smut"]
+        assert store == {"huitlacoche": "corn smut"}
+        assert translator.get_stats()["round_trips_avoided"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_learned_table_retried_after_failure(self):
+        """Probar que si Redis falla al cargar la tabla se reintente más tarde"""
+        from services import food_translation as translation_module
+        from services.food_translation import FoodTranslator
+        
+        down, _ = self._redis(fail=True)
+        up, _ = self._redis({"tlayuda": "tortilla corn"})
+        translator = FoodTranslator()
+        
+        with patch.object(translation_module, "get_redis", AsyncMock(return_value=down)):
+            assert await translator.translate("tlayuda") == (None, "none")
+            assert await translator.translate("tlayuda") == (None, "none")
+        assert down.hgetall.await_count == 1  # en backoff
+        
+        translator._retry_at = 0
+        with patch.object(translation_module, "get_redis", AsyncMock(return_value=up)):
+            assert await translator.translate("tlayuda") == ("tortilla corn", "learned")
+            await translator.translate("tlayuda")
+        assert up.hgetall.await_count == 1
+
+class TestFoodCatalog:
+    """Pruebas del catálogo FDC local"""
+
+    @staticmethod
+    def _fdc_food(fdc_id, description, calories, published="2019-04-01"):
+        return {
+            "fdcId": fdc_id,
+            "description": description,
+            "dataType": "SR Legacy",
+            "publicationDate": published,
+            "foodCategory": {"description": "Fruits and Fruit Juices"},
+            "foodNutrients": [
+                {"nutrient": {"number": "208"}, "amount": calories},
+                {"nutrient": {"number": "307"}, "amount": 1}
+            ],
+            "foodPortions": [{"gramWeight": 182, "portionDescription": "1 medium"}]
+        }
+
+    def test_incremental_import_and_search(self, tmp_path):
+        """Probar importación incremental y búsqueda de texto completo"""
+        from services.food_catalog import FoodCatalog, import_foods
+
+        db_path = str(tmp_path / "catalog.db")
+        foods = [
+            self._fdc_food(171688, "Apples, raw, with skin", 52),
+            self._fdc_food(173944, "Bananas, raw", 89)
+        ]
+        assert import_foods(db_path, foods, "r1")["inserted"] == 2
+
+        foods[1]["publicationDate"] = "2020-01-01"
+        counts = import_foods(db_path, foods, "r2")
+        assert counts == {"inserted": 0, "updated": 1, "unchanged": 1}
+
+        catalog = FoodCatalog(db_path)
+        results = catalog.search("apple raw")
+        assert [food["id"] for food in results] == ["usda_171688"]
+        assert results[0]["nutrition_per_100g"]["sodium"] == 1  # mg, como FDC
+        assert catalog.lookup("banana")["nutrition_per_100g"]["calories"] == 89
+        assert catalog.get(999) is None
+
+    def test_lookup_requires_whole_word_match(self, tmp_path):
+        """Probar que lookup no acepte subcadenas ni nombres sin traducir"""
+        from services.food_catalog import FoodCatalog, import_foods
+
+        db_path = str(tmp_path / "catalog.db")
+        import_foods(db_path, [
+            self._fdc_food(171688, "Apples, raw, with skin", 52),
+            self._fdc_food(169124, "Pineapple, raw, all varieties", 50),
+            self._fdc_food(172430, "Peanuts, all types, raw", 567),
+            self._fdc_food(169928, "Peaches, yellow, raw", 39)
+        ], "r1")
+        catalog = FoodCatalog(db_path)
+
+        assert catalog.lookup("apple")["fdc_id"] == "171688"
+        assert catalog.lookup("pineapple")["fdc_id"] == "169124"
+        assert catalog.lookup("pea") is None
+        assert catalog.lookup("manzana") is None
+        assert catalog.get_stats()["rejected"] >= 1
+
+    def test_columnar_catalog_lookup(self, tmp_path):
+        """Probar el catálogo columnar mapeado en memoria"""
+        from services.food_catalog import import_foods
+        from services.catalog_columns import ColumnarCatalog, build_columnar
+
+        db_path = str(tmp_path / "catalog.db")
+        columnar_path = str(tmp_path / "catalog.fcol")
+        import_foods(db_path, [
+            self._fdc_food(173944, "Bananas, raw", 89),
+            self._fdc_food(171688, "Apples, raw, with skin", 52)
+        ], "r1")
+        assert build_columnar(db_path, columnar_path) == 2
+
+        catalog = ColumnarCatalog(columnar_path)
+        row = catalog.row(171688)
+        assert catalog.nutrients(row)[0] == 52
+        food = catalog.get(173944)
+        assert food["name"] == "Bananas, raw"
+        assert food["serving_sizes"] == [{"description": "1 medium", "grams": 182}]
+        assert catalog.row(1) is None
+
+    @pytest.mark.asyncio
+    async def test_invalid_columnar_falls_back_to_sqlite(self, tmp_path, capsys):
+        """Probar que un archivo columnar truncado o incompatible se descarte una vez y se use SQLite"""
+        from services.food_catalog import FoodCatalog, import_foods
+        from services.catalog_columns import ColumnarCatalog, build_columnar, HEADER, MAGIC
+        from routers import nutrition
+
+        db_path = str(tmp_path / "catalog.db")
+        columnar_path = str(tmp_path / "catalog.fcol")
+        import_foods(db_path, [self._fdc_food(171688, "Apples, raw, with skin", 52)], "r1")
+        build_columnar(db_path, columnar_path)
+        with open(columnar_path, "rb") as handle:
+            content = handle.read()
+        with open(columnar_path, "wb") as handle:
+            handle.write(content[:HEADER.size + 4])
+
+        catalog = ColumnarCatalog(columnar_path)
+        with patch.object(nutrition, "columnar_catalog", catalog), \
+                patch.object(nutrition, "food_catalog", FoodCatalog(db_path)):
+            food = await nutrition._load_food("usda_171688")
+            assert catalog.row(171688) is None
+            assert catalog.row(171688) is None
+        assert food["nutrition_per_100g"]["calories"] == 52
+        assert catalog.get_stats()["rejected"] == 1
+        assert capsys.readouterr().out.count("Catálogo columnar inválido") == 1
+
+        # Versión incompatible: tampoco se reabre en cada llamada
+        with open(columnar_path, "wb") as handle:
+            handle.write(HEADER.pack(MAGIC, 1, 0, 0, 0, 0, 0, 0))
+        assert not catalog.available
+        assert not catalog.available
+        assert catalog.get_stats()["rejected"] == 2
+
+        # Un archivo válido nuevo vuelve a activar la ruta columnar
+        build_columnar(db_path, columnar_path)
+        assert catalog.row(171688) == 0
+
+    @pytest.mark.asyncio
+    async def test_batch_nutrition_calculation(self, tmp_path):
+        """Probar el cálculo por lotes con columnar, SQLite y alimentos de ejemplo"""
+        from services.food_catalog import FoodCatalog, import_foods
+        from services.catalog_columns import ColumnarCatalog, build_columnar
+        from models.requests import NutritionBatchRequest
+        from routers import nutrition
+
+        db_path = str(tmp_path / "catalog.db")
+        columnar_path = str(tmp_path / "catalog.fcol")
+        import_foods(db_path, [self._fdc_food(171688, "Apples, raw, with skin", 52)], "r1")
+        build_columnar(db_path, columnar_path)
+        import_foods(db_path, [self._fdc_food(173944, "Bananas, raw", 89)], "r2")  # solo en SQLite
+
+        request = NutritionBatchRequest(items=[
+            {"food_id": "usda_171688", "portion_grams": 200},
+            {"food_id": "usda_173944", "portion_grams": 50},
+            {"food_id": "usda_169905", "portion_grams": 100},
+            {"food_id": "usda_1", "portion_grams": 100},
+            {"food_id": "usda_171688", "portion_grams": 100}
+        ])
+        with patch.object(nutrition, "columnar_catalog", ColumnarCatalog(columnar_path)), \
+                patch.object(nutrition, "food_catalog", FoodCatalog(db_path)):
+            response = await nutrition.calculate_nutrition_batch(request, current_user=None)
+
+        calories = [result["nutrition"] and result["nutrition"]["calories"] for result in response["results"]]
+        assert calories == [104, 44.5, 52, None, 52]
+        assert response["not_found"] == ["usda_1"]
+        assert response["total_nutrition"]["calories"] == 252.5
+
+class TestFoodSearchIndex:
+    """Pruebas del índice de búsqueda tolerante a errores"""
+    
+    def _index(self):
+        from services.search_index import FoodSearchIndex
+        
+        index = FoodSearchIndex()
+        index.build([
+            ("usda_1", "Apples, raw, with skin", "Fruits", "usda", 10),
+            ("usda_2", "Apple juice, canned", "Beverages", "usda", 50),
+            ("usda_3", "Chicken, breast, roasted", "Poultry", "usda", 5),
+            ("nix_1", "Pollo asado", "Poultry", "nutritionix", 80)
+        ])
+        return index
+    
+    def test_typos_and_spanish_queries(self):
+        """Probar consultas con errores tipográficos y en español"""
+        index = self._index()
+        
+        assert [item for item, _ in index.search("manzna")] == ["usda_2", "usda_1"]
+        assert [item for item, _ in index.search("polo")] == ["nix_1", "usda_3"]
+        assert index.search("xyzzy") == []
+    
+    def test_filters_inside_index(self):
+        """Probar filtros de categoría y fuente"""
+        index = self._index()
+        
+        assert index.search("apple", category="fruit") == [("usda_1", 10)]
+        assert index.search("pollo", source="usda") == [("usda_3", 5)]
+    
+    def test_total_counts_before_limit(self):
+        """Probar que el total sea el de coincidencias, no el de resultados devueltos"""
+        index = self._index()
+        
+        assert index.search_with_total("apple", limit=1) == ([("usda_2", 50)], 2)
+        assert index.search_with_total("xyzzy") == ([], 0)
+    
+    @pytest.mark.asyncio
+    async def test_popularity_breaks_ties(self):
+        """Probar que el alimento más detectado quede por encima de uno con la misma relevancia"""
+        from unittest.mock import MagicMock
+        from routers import nutrition as nutrition_router
+        from services.search_index import FoodSearchIndex
+        
+        foods = {
+            item_id: {"id": item_id, "name": name, "category": "Grains", "source": "usda", "usage_count": 0}
+            for item_id, name in (("usda_1", "Rice, white, cooked"), ("usda_2", "Rice, brown, cooked"))
+        }
+        index = FoodSearchIndex()
+        popularity = MagicMock()
+        popularity.version = AsyncMock(return_value=3)
+        popularity.load = AsyncMock(return_value=[("arroz integral", "Rice, brown, cooked", 42)])
+        with patch.object(nutrition_router, "food_search_index", index), \
+                patch.object(nutrition_router, "food_popularity", popularity), \
+                patch.object(nutrition_router, "SAMPLE_FOODS", foods), \
+                patch.object(nutrition_router.food_catalog, "path", "/nonexistent/catalog.db"), \
+                patch.dict(nutrition_router.popular_usage, clear=True):
+            index.build(nutrition_router.search_entries())
+            assert [item for item, _ in index.search("rice")] == ["usda_1", "usda_2"]
+            
+            await nutrition_router.refresh_search_popularity()
+            assert index.search("rice") == [("usda_2", 42), ("usda_1", 0)]
+            
+            # Una reconstrucción del catálogo conserva los conteos aplicados
+            index.build(nutrition_router.search_entries())
+            assert index.search("rice") == [("usda_2", 42), ("usda_1", 0)]
+
+class TestAutocomplete:
+    """Pruebas del trie de autocompletado"""
+    
+    def test_top_k_per_prefix(self):
+        """Probar completados por popularidad en cada prefijo"""
+        from services.autocomplete import build_trie
+        
+        trie = build_trie([
+            ("manzana roja", "Manzana roja", 30),
+            ("mango", "Mango", 50),
+            ("mantequilla", "Mantequilla", 10),
+            ("pechuga pollo", "Pechuga de pollo", 20)
+        ], top_k=2)
+        
+        assert trie.complete("man", 5) == [("Mango", 50), ("Manzana roja", 30)]
+        assert trie.complete("manz", 5) == [("Manzana roja", 30)]
+        assert trie.complete("pollo", 5) == [("Pechuga de pollo", 20)]
+        assert trie.complete("kiwi", 5) == []
+    
+    def test_incremental_update(self):
+        """Probar que los incrementos reordenen el top-k sin reconstruir"""
+        from services.autocomplete import build_trie
+        
+        trie = build_trie([("mango", "Mango", 2), ("mantequilla", "Mantequilla", 1)], top_k=1)
+        trie.increment("mantequilla", "Mantequilla", 5)
+        
+        assert trie.complete("man", 5) == [("Mantequilla", 6)]
+    
+    @pytest.mark.asyncio
+    async def test_version_bumps_only_for_new_foods(self):
+        """Probar que repetir alimentos conocidos no fuerce reconstruir los tries"""
+        from unittest.mock import MagicMock
+        from services import food_popularity as popularity_module
+        
+        redis_client = MagicMock()
+        redis_client.incr = AsyncMock()
+        pipe = MagicMock()
+        redis_client.pipeline.return_value.__aenter__.return_value = pipe
+        
+        with patch.object(popularity_module, "get_redis", AsyncMock(return_value=redis_client)):
+            pipe.execute = AsyncMock(return_value=[5.0, 0, 3.0, 0])
+            await popularity_module.food_popularity.record([{"name": "Manzana"}, {"name": "Arroz"}])
+            redis_client.incr.assert_not_awaited()
+            
+            pipe.execute = AsyncMock(return_value=[6.0, 0, 1.0, 0])
+            await popularity_module.food_popularity.record([{"name": "Manzana"}, {"name": "Kiwi"}])
+            redis_client.incr.assert_awaited_once_with(popularity_module.VERSION_KEY)
+    
+    @pytest.mark.asyncio
+    async def test_seed_groups_by_display_name(self):
+        """Probar que la siembra use food_name y no las claves en inglés de food_name_normalized"""
+        from unittest.mock import MagicMock
+        from services import food_popularity as popularity_module
+        from services.food_popularity import FoodPopularity
+        
+        redis_client = MagicMock()
+        pipe = MagicMock()
+        pipe.execute = AsyncMock()
+        redis_client.pipeline.return_value.__aenter__.return_value = pipe
+        rows = [("apple_red", "Manzana roja", 4), ("apple_green", "manzanas rojas", 2), ("rice_white", "Arroz", 3)]
+        
+        with patch.object(popularity_module, "get_redis", AsyncMock(return_value=redis_client)), \
+                patch.object(FoodPopularity, "_query_detected_foods", return_value=rows):
+            await FoodPopularity()._seed_from_database()
+        
+        counts = pipe.zadd.call_args[0][1]
+        assert counts == {"manzana roja": 6, "arroz": 3}
+    
+    @pytest.mark.asyncio
+    async def test_periodic_rebuild_without_new_foods(self):
+        """Probar que sin cambio de versión solo se reconstruya al vencer el intervalo"""
+        from config import settings
+        from services import autocomplete as autocomplete_module
+        from services.autocomplete import AutocompleteIndex
+        
+        index = AutocompleteIndex(top_k=2, max_names=100)
+        popularity = AsyncMock()
+        popularity.version.return_value = 3
+        popularity.load.return_value = [("mango", "Mango", 4)]
+        
+        with patch.object(autocomplete_module, "food_popularity", popularity):
+            await index.refresh()
+            await index.refresh()
+            assert index.stats["rebuilds"] == 1
+            
+            with patch.object(settings, "AUTOCOMPLETE_REBUILD_SECONDS", 0):
+                await index.refresh()
+        
+        assert index.stats["rebuilds"] == 2
+        assert index.complete("man") == [{"name": "Mango", "usage_count": 4}]
+    
+    @pytest.mark.asyncio
+    async def test_analysis_records_only_confident_foods(self):
+        """Probar que el análisis no registre el fallback ni detecciones de baja confianza"""
+        import numpy as np
+        from routers import images
+        from services import nutrients
+        
+        detected = [
+            {"name": "Manzana", "portion_grams": 180, "confidence": 9},
+            {"name": "Salsa", "portion_grams": 20, "confidence": 5},
+            {"name": "Alimento no identificado", "portion_grams": 100, "confidence": 3}
+        ]
+        record = AsyncMock()
+        with patch.object(images.MLService, "analyze_food_image", AsyncMock(return_value=detected)), \
+                patch.object(images, "enrich_foods", AsyncMock(return_value=(detected, np.zeros((3, nutrients.SIZE))))), \
+                patch.object(images.autocomplete_index, "record", record):
+            await images.process_image_analysis("job-1", b"imagen", 1, None, None)
+        
+        record.assert_awaited_once_with([detected[0]])
+
+class TestCacheWarmer:
+    """Pruebas del precalentamiento del cache de nutrición"""
+    
+    @pytest.mark.asyncio
+    async def test_warmup_progress_and_readiness(self):
+        """Probar lotes, progreso y la fracción requerida para readiness"""
+        from unittest.mock import MagicMock
+        from services.cache_warmer import CacheWarmer
+        
+        warmer = CacheWarmer(top_n=5, batch_size=2, upstream_rate=0, ready_fraction=0.5)
+        names = ["pan", "manzana", "pollo", "arroz", "huevo"]
+        progress = []
+        
+        async def lookup(batch, **kwargs):
+            progress.append(warmer.ready)
+            return [{"source": "usda"} for _ in batch]
+        
+        service = MagicMock()
+        service.get_base_nutrition_many = lookup
+        assert not warmer.ready
+        with patch.object(CacheWarmer, "load_names", AsyncMock(return_value=names)):
+            await warmer.run(service)
+        
+        assert progress == [False, False, True]  # 0/5, 2/5 y 4/5 antes de cada lote
+        assert warmer.get_stats()["warmed"] == 5
+        assert warmer.ready
+    
+    @pytest.mark.asyncio
+    async def test_estimates_are_not_warmed(self):
+        """Probar que solo cuenten los datos de cache o upstream y se limite cada consulta upstream"""
+        from unittest.mock import MagicMock
+        from services.cache_warmer import CacheWarmer
+        
+        warmer = CacheWarmer(top_n=4, batch_size=4, upstream_rate=1000, ready_fraction=0.75)
+        gated = []
+        
+        async def lookup(batch, upstream_gate, **kwargs):
+            # pan en cache; manzana y kiwi van a upstream y kiwi termina en timeout
+            for cache_key in ("nutrition:manzana", "nutrition:kiwi"):
+                await upstream_gate(cache_key)
+                gated.append(cache_key)
+            return [{"source": "usda"}, {"source": "usda"}, {"source": "estimated"}, {"source": "estimated"}]
+        
+        service = MagicMock()
+        service.get_base_nutrition_many = lookup
+        with patch.object(CacheWarmer, "load_names", AsyncMock(return_value=["pan", "manzana", "kiwi", "xyz"])):
+            await warmer.run(service)
+        
+        stats = warmer.get_stats()
+        assert gated == ["nutrition:manzana", "nutrition:kiwi"]
+        assert (stats["from_cache"], stats["from_upstream"], stats["skipped"]) == (1, 1, 2)
+        assert stats["warmed"] == 2
+        assert stats["progress"] == 0.5
 
 class TestRateLimiting:
     """Pruebas de rate limiting"""